@@ -1,166 +1,451 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, current_app, g, request, jsonify
+import json
 from flask_cors import CORS
 import os
 import tempfile
-from werkzeug.utils import secure_filename
-from pdf_processor import process_pdf
-from model_client import create_model_client
+import time
+from typing import Optional
+from dotenv import load_dotenv
+
+# Настройки модулей читаются из окружения при импорте, поэтому .env загружается первым
+load_dotenv()
+
+import metrics
+from model_client import model_clients_status
+from cache import sha256_text
+from jobs import JobQueueFull
+from fanout import needs_fanout, generate_quiz_fanout, stream_quiz_fanout
+from upload_buffer import UploadBuffer, as_upload_buffer
+from timings import bind_timings
+from router import BackendUnavailable, get_model_router
+from batch import BATCH_MAX_SIZE, collect_batch_items, parse_question_counts, run_batch
+from quiz_service import (
+    MAX_FILE_SIZE, QUIZ_CACHE_TTL, allowed_file, health_status, job_manager, load_pdf_content,
+    parse_num_questions, parse_text_request, quiz_cache_key, quiz_response, result_cache,
+    validate_quiz_parameters
+)
+
+
+class UploadRequest(Request):
+    """Запрос Flask, который складывает загружаемые файлы в UploadBuffer."""
+
+    @property
+    def max_content_length(self) -> Optional[int]:
+        """Лимит размера тела; для маршрутов из UPLOAD_SIZE_LIMITS - свой."""
+        limits = current_app.config.get("UPLOAD_SIZE_LIMITS", {})
+        if self.path in limits:
+            return limits[self.path]
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadBuffer(directory=current_app.config.get("UPLOAD_FOLDER"))
+
 
 app = Flask(__name__)
+# Загрузки пишутся в UploadBuffer: SHA-256 считается во время приема тела запроса
+app.request_class = UploadRequest
 CORS(app)
 
 # Настройки для загрузки файлов
 UPLOAD_FOLDER = tempfile.gettempdir()
-ALLOWED_EXTENSIONS = {'pdf'}
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+# Пакетная загрузка содержит много документов; лимит на файл проверяется отдельно
+app.config['UPLOAD_SIZE_LIMITS'] = {'/api/batch': BATCH_MAX_SIZE}
+
+
+def _route_label():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+@app.before_request
+def _start_request_timings():
+    # Этапы обработки запроса (stage) собираются для заголовка Server-Timing
+    g.started_at = time.perf_counter()
+    g.timings_binding = bind_timings({})
+    g.timings = g.timings_binding.__enter__()
+
 
+@app.after_request
+def _record_request_metrics(response):
+    started_at = g.get("started_at")
+    if started_at is None:
+        return response
+    elapsed = time.perf_counter() - started_at
+    metrics.http_request_seconds.observe(elapsed, _route_label(), request.method, str(response.status_code))
+    
+    # Для потоковых ответов здесь видна только подготовка: генерация идет после отправки заголовков
+    spans = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in g.timings.items()]
+    spans.append(f"total;dur={elapsed * 1000:.1f}")
+    response.headers["Server-Timing"] = ", ".join(spans)
+    return response
+
+
+@app.teardown_request
+def _stop_request_timings(error=None):
+    binding = g.pop("timings_binding", None)
+    if binding is not None:
+        binding.__exit__(None, None, None)
 
-def allowed_file(filename):
-    """Проверяет, что файл имеет разрешенное расширение."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _error_response(error):
+    """Ответ с ошибкой: 400 для ошибок валидации, 503 если модель перегружена
+    или отключена роутером, иначе 500; тип ошибки идет в метрики."""
+    metrics.http_errors.inc(_route_label(), metrics.error_type(error))
+    if isinstance(error, ValueError):
+        return jsonify({"error": str(error)}), 400
+    if isinstance(error, BackendUnavailable):
+        response = jsonify({"error": str(error)})
+        response.headers['Retry-After'] = str(int(error.retry_after))
+        return response, 503
+    return jsonify({"error": f"Ошибка при обработке запроса: {str(error)}"}), 500
 
-def _validate_quiz_parameters(num_questions, model_type):
-    """Валидирует параметры для генерации теста."""
-    if not num_questions or num_questions < 1:
-        raise ValueError("Количество вопросов должно быть положительным числом")
+
+def _parse_pdf_request():
+    """Проверяет multipart-запрос с PDF и возвращает (файл, кол-во вопросов, тип модели)."""
+    # Проверяем наличие файла
+    if 'file' not in request.files:
+        raise ValueError("Файл не найден в запросе")
+    
+    file = request.files['file']
+    
+    if file.filename == '':
+        raise ValueError("Файл не выбран")
     
-    if num_questions > 20:
-        raise ValueError("Максимальное количество вопросов - 20")
+    if not allowed_file(file.filename):
+        raise ValueError("Разрешены только PDF файлы")
     
-    valid_models = ['openrouter', 'ollama-mistral']
-    if model_type not in valid_models:
-        raise ValueError(f"Неизвестный тип модели. Доступные: {', '.join(valid_models)}")
+    num_questions = parse_num_questions(request.form.get('num_questions', 0))
+    # Получаем тип модели (по умолчанию openrouter)
+    model_type = request.form.get('model_type', 'openrouter')
     
-    return True
+    return file, num_questions, model_type
 
 
-def _generate_quiz_from_content(content, num_questions, model_type):
-    """Генерирует вопросы из контента."""
+def _upload_buffer(file):
+    """Возвращает буфер загруженного файла (в памяти или в уникальном временном файле)."""
+    return as_upload_buffer(file.stream)
+
+
+def _generate_quiz_from_content(content, num_questions, model_type, content_hash=None, job=None,
+                                model_client=None):
+    """Генерирует вопросы из контента.
+    
+    Если передан content_hash, результат кэшируется по ключу
+    (хэш контента, количество вопросов, тип модели, версия промпта).
+    Отмена задачи job прерывает параллельную генерацию до следующего вызова модели.
+    model_client - общий роутер запроса (пакета документов); по умолчанию создается новый.
+    """
     # Валидация параметров
-    _validate_quiz_parameters(num_questions, model_type)
+    validate_quiz_parameters(num_questions, model_type)
     
-    # Создаем клиент модели и генерируем вопросы
-    model_client = create_model_client(model_type)
-    questions = model_client.generate_quiz_questions(content, num_questions)
+    cache_key = None
+    if content_hash:
+        cache_key = quiz_cache_key(content_hash, num_questions, model_type)
+        cached_questions = result_cache.get("quiz", cache_key)
+        if cached_questions is not None:
+            return cached_questions
+    
+    # Создаем клиент модели (с повторами и резервной моделью) и генерируем вопросы
+    model_client = model_client or get_model_router(model_type)
+    if needs_fanout(model_client, content, num_questions):
+        questions = generate_quiz_fanout(model_client, content, num_questions,
+                                         check_cancelled=job.raise_if_cancelled if job else None)
+    else:
+        questions = model_client.generate_quiz_questions(content, num_questions)
+    
+    if cache_key and questions:
+        result_cache.set("quiz", cache_key, questions, ttl=QUIZ_CACHE_TTL)
     
     return questions
 
 
+def _stream_quiz_from_content(content, num_questions, model_type, content_hash=None):
+    """Генерирует вопросы в потоковом режиме, отдавая события NDJSON.
+    
+    События: {"type": "question", "question": {...}} по мере генерации,
+    затем {"type": "done", "total_questions": N} или {"type": "error", "error": "..."}.
+    """
+    questions = []
+    try:
+        cached_questions = None
+        if content_hash:
+            cached_questions = result_cache.get("quiz", quiz_cache_key(content_hash, num_questions, model_type))
+        
+        if cached_questions is not None:
+            questions = cached_questions
+            for question in questions:
+                yield json.dumps({"type": "question", "question": question}, ensure_ascii=False) + "\n"
+        else:
+            model_client = get_model_router(model_type)
+            if needs_fanout(model_client, content, num_questions):
+                stream = stream_quiz_fanout(model_client, content, num_questions)
+            else:
+                stream = model_client.stream_quiz_questions(content, num_questions)
+            for question in stream:
+                questions.append(question)
+                yield json.dumps({"type": "question", "question": question}, ensure_ascii=False) + "\n"
+            
+            if content_hash and questions:
+                result_cache.set("quiz", quiz_cache_key(content_hash, num_questions, model_type), questions, ttl=QUIZ_CACHE_TTL)
+        
+        yield json.dumps({"type": "done", "total_questions": len(questions)}, ensure_ascii=False) + "\n"
+    except Exception as e:
+        metrics.http_errors.inc("/api/stream-quiz", metrics.error_type(e))
+        yield json.dumps({"type": "error", "error": f"Ошибка при обработке запроса: {str(e)}"}, ensure_ascii=False) + "\n"
+
+
+def _ndjson_response(events):
+    """Оборачивает генератор событий в потоковый HTTP ответ без буферизации."""
+    response = Response(events, mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _generate_quiz_from_pdf(upload, num_questions, model_type, job=None):
+    """Полный пайплайн для PDF: извлечение контента и генерация вопросов."""
+    validate_quiz_parameters(num_questions, model_type)
+    pdf_content = load_pdf_content(upload, num_questions, model_type)
+    
+    if job:
+        job.raise_if_cancelled()
+    
+    return _generate_quiz_from_content(pdf_content, num_questions, model_type, content_hash=upload.sha256, job=job)
+
+
+def _generate_quiz_from_text(text, num_questions, model_type, job=None):
+    """Полный пайплайн для текста: генерация вопросов из вставленного текста."""
+    # Формируем контент в том же формате, что и для PDF
+    text_content = {
+        "text": text,
+        "images": [],  # Текстовый режим не поддерживает изображения
+        "total_pages": 0
+    }
+    
+    return _generate_quiz_from_content(text_content, num_questions, model_type, content_hash=sha256_text(text), job=job)
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Проверка работоспособности API."""
-    return jsonify({"status": "ok"})
+    return jsonify(health_status(model_clients_status()))
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Метрики процесса в текстовом формате Prometheus."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.route('/api/upload-pdf', methods=['POST'])
 def upload_pdf():
     """Обрабатывает загруженный PDF и генерирует тест."""
     try:
-        # Проверяем наличие файла
-        if 'file' not in request.files:
-            return jsonify({"error": "Файл не найден в запросе"}), 400
+        file, num_questions, model_type = _parse_pdf_request()
         
-        file = request.files['file']
+        upload = _upload_buffer(file)
         
-        if file.filename == '':
-            return jsonify({"error": "Файл не выбран"}), 400
-        
-        if not allowed_file(file.filename):
-            return jsonify({"error": "Разрешены только PDF файлы"}), 400
-        
-        # Получаем количество вопросов
         try:
-            num_questions = int(request.form.get('num_questions', 0))
-        except (ValueError, TypeError):
-            num_questions = 0
-        # Получаем тип модели (по умолчанию openrouter)
-        model_type = request.form.get('model_type', 'openrouter')
-        
-        # Сохраняем файл временно
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        try:
-            # Обрабатываем PDF
-            pdf_content = process_pdf(filepath)
-            
-            # Проверяем, что PDF не пустой
-            if not pdf_content.get("text") and not pdf_content.get("images"):
-                return jsonify({"error": "PDF документ пуст или не может быть обработан"}), 400
-            
             # Генерируем вопросы (валидация параметров внутри функции)
-            questions = _generate_quiz_from_content(pdf_content, num_questions, model_type)
-            
-            # Удаляем временный файл
-            os.remove(filepath)
-            
-            return jsonify({
-                "success": True,
-                "questions": questions,
-                "total_questions": len(questions)
-            })
-            
-        except Exception as e:
-            # Удаляем временный файл в случае ошибки
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            raise e
+            questions = _generate_quiz_from_pdf(upload, num_questions, model_type)
+        finally:
+            # Освобождаем буфер загрузки
+            upload.release()
+        
+        return jsonify(quiz_response(questions))
             
-    except ValueError as e:
-        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": f"Ошибка при обработке запроса: {str(e)}"}), 500
+        return _error_response(e)
 
 
 @app.route('/api/process-text', methods=['POST'])
 def process_text():
     """Обрабатывает вставленный текст и генерирует тест."""
     try:
-        data = request.get_json()
-        
-        # Проверяем наличие текста
-        if not data or 'text' not in data:
-            return jsonify({"error": "Текст не найден в запросе"}), 400
-        
-        text = data.get('text', '').strip()
+        text, num_questions, model_type = parse_text_request(request.get_json())
         
-        if not text:
-            return jsonify({"error": "Текст не может быть пустым"}), 400
-        
-        # Получаем количество вопросов
-        try:
-            num_questions = int(data.get('num_questions', 0))
-        except (ValueError, TypeError):
-            num_questions = 0
+        # Генерируем вопросы (валидация параметров внутри функции)
+        questions = _generate_quiz_from_text(text, num_questions, model_type)
         
-        # Получаем тип модели (по умолчанию openrouter)
-        model_type = data.get('model_type', 'openrouter')
+        return jsonify(quiz_response(questions))
+            
+    except Exception as e:
+        return _error_response(e)
+
+
+@app.route('/api/stream-quiz', methods=['POST'])
+def stream_quiz():
+    """Генерирует тест в потоковом режиме (NDJSON), отдавая вопросы по мере готовности.
+    
+    Принимает те же данные, что /api/upload-pdf (multipart с файлом)
+    или /api/process-text (JSON с текстом).
+    """
+    try:
+        if request.files:
+            file, num_questions, model_type = _parse_pdf_request()
+            validate_quiz_parameters(num_questions, model_type)
+            # Буфер нужен до конца генерации (изображения рендерятся лениво),
+            # поэтому он не должен освобождаться вместе с запросом
+            upload = _upload_buffer(file).detach()
+            
+            try:
+                pdf_content = load_pdf_content(upload, num_questions, model_type)
+            except Exception:
+                upload.release()
+                raise
+            
+            def events():
+                try:
+                    yield from _stream_quiz_from_content(pdf_content, num_questions, model_type, content_hash=upload.sha256)
+                finally:
+                    upload.release()
+            
+            response = _ndjson_response(events())
+            # Если клиент отключился до первого фрагмента, генератор не запускается
+            # и его finally не выполнится - буфер освобождается при закрытии ответа
+            response.call_on_close(upload.release)
+            return response
         
-        # Формируем контент в том же формате, что и для PDF
+        text, num_questions, model_type = parse_text_request(request.get_json(silent=True))
+        validate_quiz_parameters(num_questions, model_type)
         text_content = {
             "text": text,
-            "images": [],  # Текстовый режим не поддерживает изображения
+            "images": [],
             "total_pages": 0
         }
+        return _ndjson_response(
+            _stream_quiz_from_content(text_content, num_questions, model_type, content_hash=sha256_text(text))
+        )
+    
+    except Exception as e:
+        return _error_response(e)
+
+
+@app.route('/api/batch', methods=['POST'])
+def batch_quiz():
+    """Генерирует тесты для нескольких документов одним запросом (NDJSON).
+    
+    Принимает multipart с файлами files (PDF или zip архивы с PDF), общим
+    num_questions и model_type. Количество вопросов для отдельных документов
+    задается JSON полем items ({"имя.pdf": 10}) или manifest.json в архиве.
+    
+    События: {"type": "batch", "documents": [...]} со списком документов,
+    затем по одному {"type": "result", "index", "name", "questions", ...} или
+    {"type": "error", "index", "name", "error"} на документ в порядке готовности
+    и {"type": "done", "total_documents": N, "failed": K}.
+    """
+    try:
+        model_type = request.form.get('model_type', 'openrouter')
+        default_questions = parse_num_questions(request.form.get('num_questions', 0))
+        question_counts = parse_question_counts(request.form.get('items'))
         
-        # Генерируем вопросы (валидация параметров внутри функции)
-        questions = _generate_quiz_from_content(text_content, num_questions, model_type)
+        items, skipped = collect_batch_items(
+            request.files.getlist('files') + request.files.getlist('file'),
+            default_questions, question_counts, max_file_size=MAX_FILE_SIZE
+        )
+        try:
+            for item in items:
+                try:
+                    validate_quiz_parameters(item.num_questions, model_type)
+                except ValueError as e:
+                    raise ValueError(f"{item.name}: {e}")
+            # Пакет - один запрос: роутер общий, и очередь модели ограничивает
+            # по времени только его допуск, а не каждый документ
+            model_client = get_model_router(model_type)
+        except Exception:
+            for item in items:
+                item.upload.release()
+            raise
+        
+        def extract(item):
+            # Документы пакета разбираются в пуле процессов параллельно на разных ядрах
+            return load_pdf_content(item.upload, item.num_questions, model_type, in_pool=True)
         
-        return jsonify({
-            "success": True,
-            "questions": questions,
-            "total_questions": len(questions)
-        })
+        def generate(item, content):
+            return _generate_quiz_from_content(content, item.num_questions, model_type,
+                                               content_hash=item.upload.sha256, model_client=model_client)
+        
+        def events():
+            yield json.dumps({
+                "type": "batch",
+                "documents": [
+                    {"index": item.index, "name": item.name, "num_questions": item.num_questions}
+                    for item in items
+                ],
+                "skipped": skipped
+            }, ensure_ascii=False) + "\n"
+            for event in run_batch(items, extract, generate, model_type):
+                if event["type"] == "error":
+                    metrics.http_errors.inc("/api/batch", event["error_type"])
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        
+        response = _ndjson_response(events())
+        # Если клиент отключился до начала обработки, буферы освобождаются здесь
+        response.call_on_close(lambda: [item.upload.release() for item in items])
+        return response
+    
+    except Exception as e:
+        return _error_response(e)
+
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """Ставит генерацию теста в очередь и сразу возвращает id задачи.
+    
+    Принимает те же данные, что /api/upload-pdf (multipart с файлом)
+    или /api/process-text (JSON с текстом).
+    """
+    try:
+        if request.files:
+            file, num_questions, model_type = _parse_pdf_request()
+            validate_quiz_parameters(num_questions, model_type)
+            # Буфер загрузки живет до завершения задачи
+            upload = _upload_buffer(file).detach()
             
-    except ValueError as e:
-        return jsonify({"error": str(e)}), 400
+            try:
+                job = job_manager.submit(
+                    lambda job: quiz_response(_generate_quiz_from_pdf(upload, num_questions, model_type, job)),
+                    cleanup=upload.release
+                )
+            except JobQueueFull:
+                upload.release()
+                raise
+        else:
+            text, num_questions, model_type = parse_text_request(request.get_json(silent=True))
+            validate_quiz_parameters(num_questions, model_type)
+            job = job_manager.submit(
+                lambda job: quiz_response(_generate_quiz_from_text(text, num_questions, model_type, job))
+            )
+        
+        return jsonify({"job_id": job.id, "status": job.status}), 202
+    
+    except JobQueueFull as e:
+        metrics.http_errors.inc(_route_label(), metrics.error_type(e))
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 429
     except Exception as e:
-        return jsonify({"error": f"Ошибка при обработке запроса: {str(e)}"}), 500
+        return _error_response(e)
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Возвращает статус задачи, результат и время выполнения этапов."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Задача не найдена"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Отменяет задачу в очереди или прерывает выполняющуюся."""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Задача не найдена"}), 404
+    return jsonify({"job_id": job.id, "status": job.status})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,203 @@
+"""Асинхронный (ASGI) режим сервера.
+
+Обслуживает те же маршруты с тем же JSON-контрактом, что и app.py, но
+ожидание ответа модели не занимает поток: генерация идет через асинхронные
+клиенты (httpx.AsyncClient, openai.AsyncOpenAI), а работа с PDF выполняется
+в пуле потоков. Запуск:
+
+    uvicorn asgi_app:app --port 5001
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+
+from dotenv import load_dotenv
+
+# Настройки модулей читаются из окружения при импорте, поэтому .env загружается первым
+load_dotenv()
+
+import metrics
+from cache import sha256_text
+from fanout import needs_fanout, generate_quiz_fanout_async
+from model_client import get_async_model_client, async_model_clients_status, close_async_model_clients
+from quiz_service import (
+    MAX_FILE_SIZE, QUIZ_CACHE_TTL, allowed_file, health_status, load_pdf_content, parse_num_questions,
+    parse_text_request, quiz_cache_key, quiz_response, result_cache, validate_quiz_parameters
+)
+from router import BackendUnavailable, get_async_model_router
+from upload_buffer import UploadTooLarge, as_upload_buffer
+
+# Потоки для извлечения текста и прочей CPU работы с PDF
+ASGI_PDF_WORKERS = int(os.getenv("ASGI_PDF_WORKERS", os.cpu_count() or 1))
+pdf_executor = ThreadPoolExecutor(max_workers=ASGI_PDF_WORKERS, thread_name_prefix="pdf")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await close_async_model_clients()
+    pdf_executor.shutdown(wait=False)
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+async def _run_blocking(func, *args):
+    """Выполняет блокирующую функцию в пуле потоков PDF."""
+    return await asyncio.get_running_loop().run_in_executor(pdf_executor, partial(func, *args))
+
+
+@app.middleware("http")
+async def _record_request_metrics(request: Request, call_next):
+    started_at = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.http_request_seconds.observe(
+        time.perf_counter() - started_at, route.path if route else "unmatched", request.method, str(response.status_code)
+    )
+    return response
+
+
+def _error_response(error, route):
+    """Ответ с ошибкой в формате app.py: 400 для ошибок валидации, 503 для
+    перегруженной или отключенной модели, иначе 500."""
+    metrics.http_errors.inc(route, metrics.error_type(error))
+    if isinstance(error, ValueError):
+        return JSONResponse({"error": str(error)}, status_code=400)
+    if isinstance(error, BackendUnavailable):
+        return JSONResponse({"error": str(error)}, status_code=503,
+                            headers={"Retry-After": str(int(error.retry_after))})
+    return JSONResponse({"error": f"Ошибка при обработке запроса: {str(error)}"}, status_code=500)
+
+
+async def _parse_pdf_request(request):
+    """Проверяет multipart-запрос с PDF и возвращает (файл, кол-во вопросов, тип модели)."""
+    form = await request.form()
+
+    # Проверяем наличие файла
+    file = form.get("file")
+    if file is None or isinstance(file, str):
+        raise ValueError("Файл не найден в запросе")
+
+    if not file.filename:
+        raise ValueError("Файл не выбран")
+
+    if not allowed_file(file.filename):
+        raise ValueError("Разрешены только PDF файлы")
+
+    num_questions = parse_num_questions(form.get("num_questions", 0))
+    # Получаем тип модели (по умолчанию openrouter)
+    model_type = form.get("model_type", "openrouter")
+
+    return file, num_questions, model_type
+
+
+async def _generate_quiz_from_content(content, num_questions, model_type, content_hash=None):
+    """Асинхронный вариант app._generate_quiz_from_content с тем же кэшем тестов."""
+    validate_quiz_parameters(num_questions, model_type)
+
+    cache_key = None
+    if content_hash:
+        cache_key = quiz_cache_key(content_hash, num_questions, model_type)
+        cached_questions = result_cache.get("quiz", cache_key)
+        if cached_questions is not None:
+            return cached_questions
+
+    model_client = await get_async_model_router(model_type)
+    if needs_fanout(model_client, content, num_questions):
+        questions = await generate_quiz_fanout_async(model_client, content, num_questions)
+    else:
+        questions = await model_client.generate_quiz_questions(content, num_questions)
+
+    if cache_key and questions:
+        result_cache.set("quiz", cache_key, questions, ttl=QUIZ_CACHE_TTL)
+
+    return questions
+
+
+@app.get("/api/health")
+async def health_check():
+    """Проверка работоспособности API."""
+    return health_status(async_model_clients_status())
+
+
+@app.get("/api/metrics")
+async def metrics_endpoint():
+    """Метрики процесса в текстовом формате Prometheus."""
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+def _too_large_response():
+    return JSONResponse({"error": "Файл слишком большой"}, status_code=413)
+
+
+def _content_too_large(request) -> bool:
+    """Тело запроса больше MAX_FILE_SIZE по Content-Length (как MAX_CONTENT_LENGTH во Flask)."""
+    content_length = request.headers.get("content-length", "")
+    return content_length.isdecimal() and int(content_length) > MAX_FILE_SIZE
+
+
+@app.post("/api/upload-pdf")
+async def upload_pdf(request: Request):
+    """Обрабатывает загруженный PDF и генерирует тест."""
+    try:
+        # Слишком большой запрос отклоняется до разбора multipart
+        if _content_too_large(request):
+            return _too_large_response()
+        file, num_questions, model_type = await _parse_pdf_request(request)
+        validate_quiz_parameters(num_questions, model_type)
+
+        # Копирование в UploadBuffer считает SHA-256 файла и прекращается после MAX_FILE_SIZE
+        try:
+            upload = await _run_blocking(as_upload_buffer, file.file, MAX_FILE_SIZE)
+        except UploadTooLarge:
+            return _too_large_response()
+
+        try:
+            model_client = await get_async_model_client(model_type)
+            pdf_content = await _run_blocking(load_pdf_content, upload, num_questions, model_type, model_client)
+            questions = await _generate_quiz_from_content(
+                pdf_content, num_questions, model_type, content_hash=upload.sha256
+            )
+        finally:
+            # Освобождаем буфер загрузки
+            upload.release()
+
+        return quiz_response(questions)
+
+    except Exception as e:
+        return _error_response(e, "/api/upload-pdf")
+
+
+@app.post("/api/process-text")
+async def process_text(request: Request):
+    """Обрабатывает вставленный текст и генерирует тест."""
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        text, num_questions, model_type = parse_text_request(data)
+
+        # Формируем контент в том же формате, что и для PDF
+        text_content = {
+            "text": text,
+            "images": [],  # Текстовый режим не поддерживает изображения
+            "total_pages": 0
+        }
+        questions = await _generate_quiz_from_content(
+            text_content, num_questions, model_type, content_hash=sha256_text(text)
+        )
+
+        return quiz_response(questions)
+
+    except Exception as e:
+        return _error_response(e, "/api/process-text")
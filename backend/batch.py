@@ -0,0 +1,263 @@
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List
+
+from router import get_backend
+from timings import bind_timings
+from upload_buffer import UploadBuffer, UploadTooLarge, as_upload_buffer
+
+# Лимиты пакетной загрузки (/api/batch)
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", 100))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 500 * 1024 * 1024))
+# Извлечение текста - работа CPU, генерация - ожидание модели, поэтому пулы разные:
+# пока одни документы извлекаются, для других уже идет генерация
+BATCH_EXTRACT_WORKERS = int(os.getenv("BATCH_EXTRACT_WORKERS", os.cpu_count() or 1))
+# Верхняя граница пула генерации; для каждой модели пул не больше ее max_concurrency
+BATCH_GENERATE_WORKERS = int(os.getenv("BATCH_GENERATE_WORKERS", 16))
+
+# Файл архива с количеством вопросов для документов
+MANIFEST_NAME = "manifest.json"
+
+_extract_executor = ThreadPoolExecutor(max_workers=BATCH_EXTRACT_WORKERS, thread_name_prefix="batch-extract")
+_generate_executors: Dict[str, ThreadPoolExecutor] = {}
+_generate_executors_lock = threading.Lock()
+
+
+def _generate_executor(model_type: str) -> ThreadPoolExecutor:
+    """Пул генерации модели, общий для всех пакетов.
+
+    Документов одновременно генерируется не больше, чем модель обрабатывает
+    параллельно (max_concurrency из политики роутера): иначе пакет занимает
+    все слоты Ollama и сам себе мешает.
+    """
+    with _generate_executors_lock:
+        executor = _generate_executors.get(model_type)
+        if executor is None:
+            workers = max(1, min(BATCH_GENERATE_WORKERS, get_backend(model_type).max_concurrency))
+            executor = _generate_executors[model_type] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=f"batch-generate-{model_type}"
+            )
+        return executor
+
+
+class BatchItem:
+    """Документ пакета: имя, количество вопросов и буфер с содержимым."""
+
+    def __init__(self, index: int, name: str, upload: UploadBuffer, num_questions: int = 0):
+        self.index = index
+        self.name = name
+        self.upload = upload
+        self.num_questions = num_questions
+        self.timings: Dict[str, float] = {}
+
+
+def parse_question_counts(value) -> Dict[str, int]:
+    """Количество вопросов по именам документов.
+
+    Принимает JSON {"имя.pdf": 10} или [{"name": "имя.pdf", "num_questions": 10}].
+    """
+    if not value:
+        return {}
+    if isinstance(value, (str, bytes)):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            raise ValueError("Параметр items должен быть JSON")
+    if isinstance(value, dict):
+        pairs = value.items()
+    elif isinstance(value, list):
+        pairs = [(item.get("name"), item.get("num_questions")) for item in value if isinstance(item, dict)]
+    else:
+        raise ValueError("Параметр items должен быть объектом или списком")
+
+    counts = {}
+    for name, count in pairs:
+        try:
+            counts[str(name)] = int(count)
+        except (TypeError, ValueError):
+            raise ValueError(f"Некорректное количество вопросов для {name}")
+    return counts
+
+
+def _is_pdf(name: str) -> bool:
+    return name.lower().endswith(".pdf")
+
+
+def _is_zip(name: str) -> bool:
+    return name.lower().endswith(".zip")
+
+
+def _zip_items(stream, archive_name: str, max_file_size: int, max_total_size: int, start_index: int):
+    """Документы PDF из zip архива и его manifest.json.
+
+    Размер распакованных данных ограничен, чтобы архив-бомба не заполнила диск.
+    Остальные файлы (изображения, служебные папки) пропускаются.
+    """
+    items, skipped, counts = [], [], {}
+    total_size = 0
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        raise ValueError(f"Архив {archive_name} поврежден или не является zip")
+
+    with archive:
+        for info in archive.infolist():
+            name = info.filename
+            base_name = os.path.basename(name)
+            if info.is_dir() or name.startswith("__MACOSX/") or base_name.startswith("."):
+                continue
+            if base_name == MANIFEST_NAME:
+                counts.update(parse_question_counts(archive.read(info)))
+                continue
+            if not _is_pdf(name):
+                skipped.append(name)
+                continue
+            if info.file_size > max_file_size:
+                raise ValueError(f"Файл {name} слишком большой")
+            total_size += info.file_size
+            if total_size > max_total_size:
+                raise ValueError("Распакованный архив слишком большой")
+
+            upload = UploadBuffer()
+            try:
+                with archive.open(info) as member:
+                    for chunk in iter(lambda: member.read(1024 * 1024), b""):
+                        upload.write(chunk)
+            except Exception:
+                upload.release()
+                raise
+            upload.seek(0)
+            items.append(BatchItem(start_index + len(items), name, upload))
+    return items, skipped, counts
+
+
+def collect_batch_items(files, default_questions: int, question_counts: Dict[str, int],
+                        max_file_size: int, max_total_size: int = BATCH_MAX_SIZE):
+    """Собирает документы пакета из загруженных PDF и zip архивов.
+
+    files - загруженные файлы (FileStorage). Количество вопросов документа:
+    из question_counts (по имени в запросе или в архиве), затем из manifest.json
+    архива, иначе default_questions.
+
+    Returns:
+        (документы, пропущенные файлы архивов)
+    """
+    items: List[BatchItem] = []
+    skipped: List[str] = []
+    counts: Dict[str, int] = {}
+    try:
+        for file in files:
+            if not file or not file.filename:
+                continue
+            if _is_zip(file.filename):
+                archive_items, archive_skipped, archive_counts = _zip_items(
+                    file.stream, file.filename, max_file_size, max_total_size, len(items)
+                )
+                items.extend(archive_items)
+                skipped.extend(archive_skipped)
+                counts.update(archive_counts)
+            elif _is_pdf(file.filename):
+                try:
+                    upload = as_upload_buffer(file.stream, max_file_size)
+                except UploadTooLarge:
+                    raise ValueError(f"Файл {file.filename} слишком большой")
+                # Буфер нужен до конца потокового ответа
+                items.append(BatchItem(len(items), file.filename, upload.detach()))
+            else:
+                raise ValueError("Разрешены только PDF файлы и zip архивы с PDF")
+
+            if len(items) > BATCH_MAX_DOCUMENTS:
+                raise ValueError(f"Максимальное количество документов в пакете - {BATCH_MAX_DOCUMENTS}")
+    except Exception:
+        for item in items:
+            item.upload.release()
+        raise
+
+    if not items:
+        raise ValueError("В запросе нет PDF документов")
+
+    counts.update(question_counts)
+    for item in items:
+        item.num_questions = counts.get(item.name, counts.get(os.path.basename(item.name), default_questions))
+    return items, skipped
+
+
+def _error_event(item: BatchItem, error: Exception) -> Dict[str, Any]:
+    if isinstance(error, ValueError):
+        message, error_type = str(error), "validation"
+    else:
+        message, error_type = f"Ошибка при обработке запроса: {str(error)}", "internal"
+    return {"type": "error", "index": item.index, "name": item.name, "error": message, "error_type": error_type}
+
+
+def run_batch(items: List[BatchItem], extract: Callable[[BatchItem], Any],
+              generate: Callable[[BatchItem, Any], List[Dict]], model_type: str) -> Iterator[Dict[str, Any]]:
+    """Обрабатывает документы конвейером и отдает события по мере готовности.
+
+    extract(документ) выполняется в пуле извлечения, generate(документ, контент) -
+    в пуле генерации модели model_type сразу после извлечения этого документа, поэтому извлечение
+    следующих документов идет одновременно с генерацией предыдущих. На каждый
+    документ приходится ровно одно событие result или error; буферы документов
+    освобождаются после обработки. Если клиент отключился, еще не начатые
+    документы пропускаются.
+    """
+    events = queue.Queue()
+    stopped = threading.Event()
+    generate_executor = _generate_executor(model_type)
+
+    def finish(item, event):
+        item.upload.release()
+        events.put(event)
+
+    def generate_task(item, content):
+        if stopped.is_set():
+            return finish(item, None)
+        started = time.perf_counter()
+        try:
+            with bind_timings(item.timings):
+                questions = generate(item, content)
+        except Exception as e:
+            return finish(item, _error_event(item, e))
+        item.timings["generate"] = time.perf_counter() - started
+        finish(item, {
+            "type": "result",
+            "index": item.index,
+            "name": item.name,
+            "questions": questions,
+            "total_questions": len(questions),
+            "timings": {name: round(seconds, 4) for name, seconds in item.timings.items()}
+        })
+
+    def extract_task(item):
+        if stopped.is_set():
+            return finish(item, None)
+        try:
+            with bind_timings(item.timings):
+                content = extract(item)
+        except Exception as e:
+            return finish(item, _error_event(item, e))
+        try:
+            generate_executor.submit(generate_task, item, content)
+        except RuntimeError as e:
+            finish(item, _error_event(item, e))
+
+    for item in items:
+        _extract_executor.submit(extract_task, item)
+
+    failed = 0
+    try:
+        for _ in items:
+            event = events.get()
+            if event is None:
+                continue
+            failed += event["type"] == "error"
+            yield event
+    finally:
+        stopped.set()
+
+    yield {"type": "done", "total_documents": len(items), "failed": failed}
@@ -0,0 +1 @@
+"""Бенчмарки backend: python -m bench.run (см. bench/run.py)."""
@@ -0,0 +1,248 @@
+"""Локальный детерминированный заменитель моделей для бенчмарков.
+
+Отвечает на запросы OpenAI chat completions (как OpenRouter) и Ollama
+/api/generate, включая потоковые режимы, с настраиваемой задержкой
+и скоростью генерации токенов.
+
+Запуск отдельно от бенчмарка:
+
+    python -m bench.fake_llm --port 8089 --latency 0.2 --tokens-per-second 200
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Количество вопросов берется из последней фразы промпта "Создай N вопросов"
+QUESTION_COUNT_RE = re.compile(r"Создай (\d+) вопрос")
+
+# Грубая оценка: около 4 символов JSON ответа на токен
+CHARS_PER_TOKEN = 4
+
+
+def fake_questions(prompt: str, num_questions: int) -> List[Dict]:
+    """Детерминированные вопросы: одинаковый промпт дает одинаковый ответ."""
+    # Хеш у каждого вопроса свой, иначе фильтр качества примет вопросы за повторы
+    return [
+        {
+            "id": idx,
+            "question": f"Вопрос {idx} по материалу {hashlib.sha256(f'{prompt}:{idx}'.encode('utf-8')).hexdigest()[:12]}?",
+            "type": "multiple_choice",
+            "options": [f"Вариант {letter} вопроса {idx}" for letter in "ABCD"],
+            "correct_answer": idx % 4
+        }
+        for idx in range(1, num_questions + 1)
+    ]
+
+
+def _question_count(prompt: str) -> int:
+    matches = QUESTION_COUNT_RE.findall(prompt)
+    return int(matches[-1]) if matches else 5
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def settings(self) -> "FakeLLMServer":
+        return self.server.settings
+
+    def _send_json(self, data: Dict, status: int = 200) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data: str) -> None:
+        payload = data.encode("utf-8")
+        self.wfile.write(f"{len(payload):X}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "mistral:latest"}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        request = self._read_json()
+        self.settings.count_request()
+        if self.path.endswith("/chat/completions"):
+            self._chat_completions(request)
+        elif self.path == "/api/generate":
+            self._ollama_generate(request)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _chat_completions(self, request: Dict) -> None:
+        prompt = "\n".join(
+            message["content"] for message in request.get("messages", [])
+            if isinstance(message.get("content"), str)
+        )
+        text = json.dumps({"questions": fake_questions(prompt, _question_count(prompt))}, ensure_ascii=False)
+        text = self.settings.limit_output(text, request.get("max_tokens"))
+        completion_tokens = len(text) // CHARS_PER_TOKEN + 1
+        usage = {
+            "prompt_tokens": len(prompt) // CHARS_PER_TOKEN + 1,
+            "completion_tokens": completion_tokens,
+            "total_tokens": len(prompt) // CHARS_PER_TOKEN + 1 + completion_tokens
+        }
+        base = {"id": "chatcmpl-bench", "created": int(time.time()), "model": request.get("model", "fake")}
+
+        if not request.get("stream"):
+            self.settings.wait(completion_tokens)
+            self._send_json({
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+            return
+
+        self._start_chunked("text/event-stream")
+        for piece in self.settings.paced_pieces(text):
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+        final = {**base, "object": "chat.completion.chunk",
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self._write_chunk(f"data: {json.dumps(final)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_chunked()
+
+    def _ollama_generate(self, request: Dict) -> None:
+        prompt = request.get("prompt", "")
+        text = json.dumps({"questions": fake_questions(prompt, _question_count(prompt))}, ensure_ascii=False)
+        text = self.settings.limit_output(text, request.get("options", {}).get("num_predict"))
+        eval_count = len(text) // CHARS_PER_TOKEN + 1
+
+        if not request.get("stream", True):
+            self.settings.wait(eval_count)
+            self._send_json({
+                "model": request.get("model"),
+                "response": text,
+                "done": True,
+                "eval_count": eval_count
+            })
+            return
+
+        self._start_chunked("application/x-ndjson")
+        for piece in self.settings.paced_pieces(text):
+            self._write_chunk(json.dumps({"model": request.get("model"), "response": piece, "done": False}, ensure_ascii=False) + "\n")
+        self._write_chunk(json.dumps({"model": request.get("model"), "response": "", "done": True, "eval_count": eval_count}) + "\n")
+        self._end_chunked()
+
+
+class FakeLLMServer:
+    """HTTP сервер-заменитель моделей в фоновом потоке.
+
+    Время ответа: latency + токены ответа / tokens_per_second. Если
+    honor_max_tokens включен, ответ обрезается по max_tokens/num_predict,
+    как у настоящей модели.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.05,
+                 tokens_per_second: float = 0, stream_chunk_tokens: int = 8, honor_max_tokens: bool = True):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.stream_chunk_tokens = stream_chunk_tokens
+        self.honor_max_tokens = honor_max_tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), FakeLLMHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.settings = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def limit_output(self, text: str, max_tokens: Optional[int]) -> str:
+        if self.honor_max_tokens and max_tokens:
+            return text[:int(max_tokens) * CHARS_PER_TOKEN]
+        return text
+
+    def wait(self, tokens: int) -> None:
+        delay = self.latency
+        if self.tokens_per_second:
+            delay += tokens / self.tokens_per_second
+        if delay > 0:
+            time.sleep(delay)
+
+    def paced_pieces(self, text: str):
+        """Части ответа для потоковой выдачи с задержкой генерации."""
+        if self.latency > 0:
+            time.sleep(self.latency)
+        size = self.stream_chunk_tokens * CHARS_PER_TOKEN
+        for start in range(0, len(text), size):
+            if self.tokens_per_second:
+                time.sleep(self.stream_chunk_tokens / self.tokens_per_second)
+            yield text[start:start + size]
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный заменитель OpenRouter и Ollama для бенчмарков")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка до первого токена (сек)")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Скорость генерации (0 - мгновенно)")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.host, args.port, args.latency, args.tokens_per_second)
+    print(f"Fake LLM: {server.url} (OPENROUTER_BASE_URL={server.url}/v1, OLLAMA_BASE_URL={server.url})")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
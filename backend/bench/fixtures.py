@@ -0,0 +1,96 @@
+"""Генерация PDF документов для бенчмарков.
+
+Текстовые PDF пишутся напрямую (без внешних библиотек), сканы - как
+страницы-изображения через Pillow. Файлы кэшируются в BENCH_FIXTURE_DIR.
+"""
+import os
+import tempfile
+
+from PIL import Image, ImageDraw
+
+FIXTURE_DIR = os.getenv("BENCH_FIXTURE_DIR", os.path.join(tempfile.gettempdir(), "quiz-bench-fixtures"))
+
+# Строки текста на странице текстового PDF
+LINES_PER_PAGE = 40
+
+_WORDS = (
+    "process memory thread cache latency network protocol storage index query "
+    "schedule kernel buffer request response module function object class method"
+).split()
+
+
+def _page_lines(page_num: int):
+    # Колонтитулы повторяются на каждой странице, как в реальных документах
+    lines = ["Benchmark fixture document - chapter %d" % (page_num // 10 + 1)]
+    for line_num in range(LINES_PER_PAGE):
+        words = [_WORDS[(page_num * 7 + line_num * 3 + idx) % len(_WORDS)] for idx in range(12)]
+        lines.append(" ".join(words))
+    lines.append("Page %d" % page_num)
+    return lines
+
+
+def _write_text_pdf(path: str, pages: int) -> None:
+    """Пишет PDF со шрифтом Helvetica и текстом на каждой странице."""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    kids = []
+    for page_num in range(1, pages + 1):
+        stream = "BT /F1 10 Tf 50 770 Td 14 TL " + " ".join(f"({line}) '" for line in _page_lines(page_num)) + " ET"
+        page_id = len(objects) + 1
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        kids.append(f"{page_id} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    output = "%PDF-1.4\n"
+    offsets = []
+    for idx, obj in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{idx} 0 obj\n{obj}\nendobj\n"
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+
+    with open(path, "w", encoding="latin-1") as f:
+        f.write(output)
+
+
+def _write_scanned_pdf(path: str, pages: int) -> None:
+    """Пишет PDF из изображений страниц без текстового слоя (как у сканов)."""
+    def render(page_num):
+        image = Image.new("L", (850, 1100), 255)
+        draw = ImageDraw.Draw(image)
+        for line_num, line in enumerate(_page_lines(page_num)):
+            draw.text((60, 60 + line_num * 24), line, fill=0)
+        return image
+
+    first = render(1)
+    first.save(path, "PDF", resolution=100.0, save_all=True,
+               append_images=(render(page_num) for page_num in range(2, pages + 1)))
+
+
+def fixture_pdf(pages: int, kind: str = "text") -> str:
+    """Возвращает путь к PDF из pages страниц, создавая его при первом обращении.
+
+    kind: text - текстовый слой, scanned - только изображения страниц.
+    """
+    if kind not in ("text", "scanned"):
+        raise ValueError(f"Неизвестный тип документа: {kind}")
+
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    path = os.path.join(FIXTURE_DIR, f"{kind}_{pages}.pdf")
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        if kind == "text":
+            _write_text_pdf(tmp_path, pages)
+        else:
+            _write_scanned_pdf(tmp_path, pages)
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,358 @@
+"""Бенчмарк пайплайна backend: извлечение PDF, клиенты моделей и HTTP эндпоинты.
+
+Модели заменяются локальным сервером bench.fake_llm, поэтому результаты
+воспроизводимы и не тратят кредиты. Запуск из папки backend:
+
+    python -m bench.run                               # все наборы
+    python -m bench.run --suite pdf --pages 1,100,1000
+    python -m bench.run --save-baseline bench/baseline.json
+    python -m bench.run --compare bench/baseline.json  # код 1 при регрессии
+    python -m bench.run --suite startup               # холодный старт и время импорта
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List
+
+from bench.fake_llm import FakeLLMServer
+from bench.fixtures import fixture_pdf
+
+SUITES = ("startup", "pdf", "clients", "endpoints")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Выполняется в отдельном процессе: импорт приложения, первый /api/health
+# и с аргументом warm-up - загрузка отложенных модулей (как в мастере gunicorn)
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+status = app.app.test_client().get("/api/health").status_code
+health = time.perf_counter()
+from lazy_imports import warm_up
+loaded = warm_up() if sys.argv[1:] == ["warm-up"] else {}
+print(json.dumps({
+    "status": status,
+    "import_app_ms": round((imported - start) * 1000, 1),
+    "first_health_ms": round((health - imported) * 1000, 1),
+    "warm_up_ms": {name: round(seconds * 1000, 1) for name, seconds in loaded.items()}
+}))
+"""
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Перцентиль методом ближайшего ранга."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _rss_peak_mb() -> Dict[str, float]:
+    # ru_maxrss - пик за все время процесса: в килобайтах на Linux, в байтах на macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "rss_children_peak_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)
+    }
+
+
+def measure(func: Callable[[int], Any], iterations: int, concurrency: int = 1, warmup: int = 1) -> Dict[str, Any]:
+    """Выполняет func(номер итерации) iterations раз с заданной параллельностью.
+
+    Returns:
+        Задержки p50/p95/p99 (мс), запросы в секунду, ошибки и пик RSS процесса
+    """
+    for idx in range(warmup):
+        func(-1 - idx)
+
+    def timed(idx):
+        start = time.perf_counter()
+        func(idx)
+        return time.perf_counter() - start
+
+    latencies = []
+    errors = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in as_completed([executor.submit(timed, idx) for idx in range(iterations)]):
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors.append(str(e))
+    wall = time.perf_counter() - started
+
+    result = {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        "rps": round(len(latencies) / wall, 2) if wall > 0 else 0.0
+    }
+    result.update(_rss_peak_mb())
+    if errors:
+        result["first_error"] = errors[0][:300]
+    return result
+
+
+def _configure_environment(server: FakeLLMServer) -> None:
+    """Направляет клиентов моделей на локальный сервер.
+
+    Вызывается до импорта модулей backend: адреса и ключ читаются при импорте.
+    """
+    os.environ["OPENROUTER_BASE_URL"] = f"{server.url}/v1"
+    os.environ["OPENROUTER_API_KEY"] = "bench"
+    os.environ["OLLAMA_BASE_URL"] = server.url
+    # Кэш результатов скрыл бы повторные вызовы модели
+    os.environ["CACHE_BACKEND"] = "none"
+
+
+def _run_startup_script(importtime: bool = False, warm_up: bool = False) -> subprocess.CompletedProcess:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", STARTUP_SCRIPT]
+    if warm_up:
+        command.append("warm-up")
+    result = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise Exception(result.stderr[-300:])
+    if json.loads(result.stdout.strip().splitlines()[-1])["status"] != 200:
+        raise Exception(f"/api/health вернул ошибку: {result.stdout[-300:]}")
+    return result
+
+
+def import_time_report(stderr: str, limit: int = 12) -> Dict[str, float]:
+    """Самые долгие импорты верхнего уровня из вывода python -X importtime (мс, с вложенными)."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Отступ имени - глубина вложенности; берем модули, импортированные скриптом и app.py
+        depth = (len(name) - len(name.lstrip())) // 2
+        if cumulative.strip().isdigit() and depth <= 1:
+            modules[name.strip()] = round(int(cumulative) / 1000, 1)
+    return dict(sorted(modules.items(), key=lambda item: item[1], reverse=True)[:limit])
+
+
+def run_startup_suite(args) -> Dict[str, Dict[str, Any]]:
+    """Холодный старт: новый процесс python от запуска до ответа /api/health."""
+    result = measure(lambda idx: _run_startup_script(), args.startup_iterations)
+
+    details = json.loads(_run_startup_script(warm_up=True).stdout.strip().splitlines()[-1])
+    profile = _run_startup_script(importtime=True)
+    result.update({
+        "import_app_ms": details["import_app_ms"],
+        "first_health_ms": details["first_health_ms"],
+        "warm_up_ms": details["warm_up_ms"],
+        "imports_ms": import_time_report(profile.stderr)
+    })
+    return {"startup: spawn -> /api/health": result}
+
+
+def print_startup_report(results: Dict[str, Dict[str, Any]]) -> None:
+    for name, result in results.items():
+        if "imports_ms" not in result:
+            continue
+        print(f"\n{name}: импорт app {result['import_app_ms']} мс, первый /api/health {result['first_health_ms']} мс")
+        print("  Отложенные модули (загрузка при первом использовании или warm_up):")
+        for module, ms in result["warm_up_ms"].items():
+            print(f"    {module:<40} {ms:>9} мс")
+        print("  Импорт при запуске (с вложенными):")
+        for module, ms in result["imports_ms"].items():
+            print(f"    {module:<40} {ms:>9} мс")
+
+
+def run_pdf_suite(args) -> Dict[str, Dict[str, Any]]:
+    from pdf_processor import process_pdf, render_pdf_pages
+
+    results = {}
+    for kind in args.kinds:
+        for pages in args.pages:
+            path = fixture_pdf(pages, kind)
+            results[f"process_pdf[{kind},{pages}p]"] = measure(
+                lambda idx: process_pdf(path), args.pdf_iterations
+            )
+            results[f"process_pdf[{kind},{pages}p,budget]"] = measure(
+                lambda idx: process_pdf(path, max_chars=4000), args.pdf_iterations
+            )
+
+    # Рендеринг страниц требует poppler (pdftoppm)
+    if shutil.which("pdftoppm"):
+        path = fixture_pdf(min(args.pages), "scanned")
+        results["render_pdf_pages[scanned,2p]"] = measure(
+            lambda idx: render_pdf_pages(path, [1, 2], dpi=150, fmt="auto", quality=75, max_side=1024),
+            args.pdf_iterations
+        )
+    return results
+
+
+def run_clients_suite(args) -> Dict[str, Dict[str, Any]]:
+    from model_client import get_model_client
+
+    content = {
+        "text": "\n".join(" ".join(["benchmark text"] * 20) for _ in range(40)),
+        "images": [],
+        "total_pages": 0
+    }
+    results = {}
+    for model_type in ("openrouter", "ollama-mistral"):
+        client = get_model_client(model_type)
+        results[f"{type(client).__name__}.generate[{args.questions}q]"] = measure(
+            lambda idx: client.generate_quiz_questions(content, args.questions),
+            args.iterations, args.concurrency
+        )
+        results[f"{type(client).__name__}.stream[{args.questions}q]"] = measure(
+            lambda idx: list(client.stream_quiz_questions(content, args.questions)),
+            args.iterations, args.concurrency
+        )
+    return results
+
+
+def run_endpoints_suite(args) -> Dict[str, Dict[str, Any]]:
+    from app import app
+
+    def check(response):
+        if response.status_code != 200:
+            raise Exception(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+    def process_text(idx):
+        # Уникальный текст на каждую итерацию, чтобы запросы не совпадали
+        text = f"Benchmark request {idx}. " + "Text about storage and indexes. " * 100
+        check(app.test_client().post("/api/process-text", json={
+            "text": text, "num_questions": args.questions, "model_type": "ollama-mistral"
+        }))
+
+    pdf_pages = min(max(args.pages), 10)
+    with open(fixture_pdf(pdf_pages, "text"), "rb") as f:
+        pdf_bytes = f.read()
+
+    def upload_pdf(idx):
+        check(app.test_client().post("/api/upload-pdf", data={
+            "file": (io.BytesIO(pdf_bytes), "bench.pdf"),
+            "num_questions": str(args.questions),
+            "model_type": "openrouter"
+        }, content_type="multipart/form-data"))
+
+    return {
+        f"POST /api/process-text[{args.questions}q]": measure(process_text, args.iterations, args.concurrency),
+        f"POST /api/upload-pdf[{pdf_pages}p,{args.questions}q]": measure(upload_pdf, args.iterations, args.concurrency)
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> List[str]:
+    """Сравнивает с базовой линией: рост p95 или падение rps больше threshold - регрессия."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p95_ms"] > 0 and current["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {current['p95_ms']} мс")
+        if base["rps"] > 0 and current["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"{name}: rps {base['rps']} -> {current['rps']}")
+        if current["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: ошибок {base.get('errors', 0)} -> {current['errors']}")
+    return regressions
+
+
+def print_report(results: Dict[str, Dict[str, Any]]) -> None:
+    header = f"{'benchmark':<48} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>9} {'rss MB':>8} {'err':>4}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        print(f"{name:<48} {result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9} "
+              f"{result['rps']:>9} {result['rss_peak_mb']:>8} {result['errors']:>4}")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк backend с локальным заменителем моделей")
+    parser.add_argument("--suite", default="all", help=f"Наборы через запятую: {', '.join(SUITES)} или all")
+    parser.add_argument("--pages", type=_int_list, default=[1, 10, 100, 1000], help="Размеры PDF в страницах")
+    parser.add_argument("--kinds", default="text,scanned", help="Типы PDF: text, scanned")
+    parser.add_argument("--iterations", type=int, default=50, help="Запросов на бенчмарк клиентов и эндпоинтов")
+    parser.add_argument("--pdf-iterations", type=int, default=3, help="Повторов на бенчмарк извлечения PDF")
+    parser.add_argument("--startup-iterations", type=int, default=5, help="Запусков процесса для холодного старта")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка заменителя модели (сек)")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Скорость генерации заменителя")
+    parser.add_argument("--output", help="Сохранить результаты в JSON")
+    parser.add_argument("--save-baseline", help="Сохранить результаты как базовую линию")
+    parser.add_argument("--compare", help="Сравнить с базовой линией")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимое ухудшение (доля)")
+    args = parser.parse_args(argv)
+
+    args.kinds = [kind for kind in args.kinds.split(",") if kind]
+    suites = SUITES if args.suite == "all" else [suite for suite in args.suite.split(",") if suite]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"Неизвестные наборы: {', '.join(sorted(unknown))}")
+
+    server = FakeLLMServer(latency=args.latency, tokens_per_second=args.tokens_per_second).start()
+    _configure_environment(server)
+
+    runners = {
+        "startup": run_startup_suite, "pdf": run_pdf_suite,
+        "clients": run_clients_suite, "endpoints": run_endpoints_suite
+    }
+    results = {}
+    try:
+        for suite in suites:
+            results.update(runners[suite](args))
+    finally:
+        server.stop()
+
+    print_report(results)
+    print_startup_report(results)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "latency": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "concurrency": args.concurrency,
+            "questions": args.questions
+        },
+        "results": results
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\nРезультаты сохранены: {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\nРегрессии относительно базовой линии:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nРегрессий относительно базовой линии нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def sha256_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Вычисляет SHA-256 файла, читая его блоками."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sha256_text(text: str) -> str:
+    """Вычисляет SHA-256 строки в UTF-8."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CacheBackend(ABC):
+    """Абстрактное хранилище кэша с TTL и ограничением по размеру."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """Возвращает значение или None, если ключ отсутствует или истек."""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Сохраняет значение; ttl в секундах (None - без ограничения)."""
+        pass
+
+    @abstractmethod
+    def size_bytes(self) -> int:
+        """Текущий объем хранилища в байтах."""
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """LRU кэш в памяти процесса с вытеснением по суммарному размеру."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at is not None and expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        # Размер оцениваем по сериализованному представлению
+        size = len(_dumps(value))
+        if size > self.max_bytes:
+            return
+        expires_at = time.time() + ttl if ttl else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, value)
+            self._total_bytes += size
+
+            while self._total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def size_bytes(self) -> int:
+        return self._total_bytes
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def default_cache_dir() -> str:
+    """Каталог дискового кэша текущего пользователя (XDG_CACHE_HOME или ~/.cache)."""
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "quiz-generator")
+
+
+def ensure_private_dir(directory: str) -> None:
+    """Создает каталог с правами 0700 и проверяет, что чужие пользователи не могут в него писать."""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+        raise ValueError(f"Путь кэша {directory} не является каталогом")
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise ValueError(f"Каталог кэша {directory} принадлежит другому пользователю")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise ValueError(f"Каталог кэша {directory} доступен на запись другим пользователям")
+
+
+class DiskCache(CacheBackend):
+    """Кэш на диске, переживающий перезапуски процесса.
+
+    Каждая запись хранится в отдельном JSON файле: содержимое каталога не
+    исполняется при чтении, в отличие от pickle. При превышении max_bytes
+    удаляются файлы, к которым дольше всего не обращались.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        ensure_private_dir(directory)
+        self._total_bytes = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in os.listdir(directory) if name.endswith(".json")
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                expires_at, value = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Поврежденная запись считается промахом
+            self._delete(path)
+            return None
+
+        if expires_at is not None and expires_at < time.time():
+            self._delete(path)
+            return None
+
+        # Обновляем время доступа для LRU вытеснения
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        data = _dumps([expires_at, value])
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            # Атомарная запись через временный файл
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data) - old_size
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def size_bytes(self) -> int:
+        return self._total_bytes
+
+    def _delete(self, path: str) -> None:
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._total_bytes -= size
+            except OSError:
+                pass
+
+    def _evict(self) -> None:
+        """Удаляет самые старые записи, пока объем не станет меньше лимита."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        for _, size, path in sorted(entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self._total_bytes -= size
+            except OSError:
+                pass
+
+
+class ResultCache:
+    """Кэш результатов обработки с раздельными пространствами имен и счетчиками."""
+
+    def __init__(self, backend: Optional[CacheBackend]):
+        self.backend = backend
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def _count(self, namespace: str, field: str) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(namespace, {"hits": 0, "misses": 0})
+            counters[field] += 1
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        value = self.backend.get(f"{namespace}:{key}")
+        self._count(namespace, "misses" if value is None else "hits")
+        return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if self.enabled and value is not None:
+            self.backend.set(f"{namespace}:{key}", value, ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика попаданий/промахов для /api/health."""
+        if not self.enabled:
+            return {"backend": "none"}
+        with self._lock:
+            namespaces = {name: dict(counters) for name, counters in self._counters.items()}
+        return {
+            "backend": type(self.backend).__name__,
+            "size_bytes": self.backend.size_bytes(),
+            "namespaces": namespaces
+        }
+
+
+def create_result_cache() -> ResultCache:
+    """Создает кэш на основе переменных окружения.
+
+    CACHE_BACKEND: memory (по умолчанию), disk или none
+    CACHE_MAX_BYTES: лимит размера хранилища
+    CACHE_DIR: каталог для дискового кэша (по умолчанию ~/.cache/quiz-generator);
+        должен принадлежать пользователю сервера и быть закрыт для записи другим
+
+    Значения должны сериализоваться в JSON.
+    """
+    backend_type = os.getenv("CACHE_BACKEND", "memory").lower()
+    max_bytes = os.getenv("CACHE_MAX_BYTES")
+
+    if backend_type == "none":
+        return ResultCache(None)
+    if backend_type == "disk":
+        directory = os.getenv("CACHE_DIR") or default_cache_dir()
+        return ResultCache(DiskCache(directory, int(max_bytes) if max_bytes else 512 * 1024 * 1024))
+    if backend_type == "memory":
+        return ResultCache(MemoryCache(int(max_bytes) if max_bytes else 64 * 1024 * 1024))
+    raise ValueError(f"Неизвестный тип кэша: {backend_type}. Доступные: memory, disk, none")
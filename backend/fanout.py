@@ -0,0 +1,243 @@
+import asyncio
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from model_client import ModelClient, _top_up, _top_up_async
+from quality import QuestionFilter, filter_questions
+from timings import bind_timings, current_timings
+
+# Максимум вопросов, запрашиваемых у модели за один вызов
+QUESTIONS_PER_CALL = int(os.getenv("FANOUT_QUESTIONS_PER_CALL", 20))
+# Максимум одновременных запросов к модели
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", 4))
+
+# Начало маркера страницы, который добавляет extract_text_from_pdf
+PAGE_MARKER_RE = re.compile(r"\n*={60}\nСТРАНИЦА \d+\n={60}\n")
+
+
+def _split_units(text: str) -> List[str]:
+    """Делит текст на страницы по маркерам, а без маркеров - на абзацы."""
+    starts = [match.start() for match in PAGE_MARKER_RE.finditer(text)]
+    if starts:
+        if starts[0] > 0:
+            starts.insert(0, 0)
+        bounds = starts + [len(text)]
+        return [text[bounds[i]:bounds[i + 1]] for i in range(len(starts))]
+    return [paragraph + "\n\n" for paragraph in text.split("\n\n") if paragraph.strip()]
+
+
+def split_text_into_chunks(text: str, max_chars: int) -> List[str]:
+    """Делит текст на фрагменты не длиннее max_chars по границам страниц.
+
+    Соседние страницы объединяются в один фрагмент, пока он помещается в лимит;
+    страница длиннее лимита режется на части.
+    """
+    chunks = []
+    current = ""
+
+    for unit in _split_units(text):
+        if len(current) + len(unit) <= max_chars:
+            current += unit
+            continue
+        if current.strip():
+            chunks.append(current)
+        while len(unit) > max_chars:
+            chunks.append(unit[:max_chars])
+            unit = unit[max_chars:]
+        current = unit
+
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def allocate_questions(weights: List[int], total: int) -> List[int]:
+    """Распределяет total вопросов пропорционально весам (метод наибольших остатков)."""
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        weights = [1] * len(weights)
+        weight_sum = len(weights)
+
+    shares = [total * weight / weight_sum for weight in weights]
+    allocation = [int(share) for share in shares]
+    remainders = sorted(range(len(shares)), key=lambda idx: shares[idx] - allocation[idx], reverse=True)
+    for idx in remainders[:total - sum(allocation)]:
+        allocation[idx] += 1
+    return allocation
+
+
+def planned_calls(num_questions: int) -> int:
+    """Сколько вызовов модели нужно для num_questions вопросов.
+
+    Делит только количество вопросов: длинный текст при небольшом тесте
+    упаковывается в промпт одного вызова, а не дробится на несколько.
+    """
+    return max(math.ceil(num_questions / QUESTIONS_PER_CALL), 1)
+
+
+def extraction_budget(model_client: ModelClient, num_questions: int) -> Tuple[int, int]:
+    """Сколько символов текста стоит извлекать из документа для генерации.
+
+    Возвращает (бюджет символов, число фрагментов): больше текста, чем
+    поместится во все вызовы модели, извлекать бессмысленно.
+    """
+    calls = planned_calls(num_questions)
+    return getattr(model_client, "max_text_chars", 4000) * calls, calls
+
+
+def plan_fanout(text: str, num_questions: int, max_chars: int) -> List[Tuple[str, int]]:
+    """Строит план вызовов: список (фрагмент текста, количество вопросов).
+
+    Фрагментов задействуется столько, сколько нужно вызовов по количеству
+    вопросов (planned_calls); фрагменты выбираются равномерно по всему документу.
+    """
+    chunks = split_text_into_chunks(text, max_chars) or [""]
+    active = min(len(chunks), planned_calls(num_questions))
+    selected = [chunks[idx * len(chunks) // active] for idx in range(active)]
+
+    tasks = []
+    for chunk, count in zip(selected, allocate_questions([len(chunk) for chunk in selected], num_questions)):
+        while count > 0:
+            batch = min(count, QUESTIONS_PER_CALL)
+            tasks.append((chunk, batch))
+            count -= batch
+    return tasks
+
+
+def needs_fanout(model_client: ModelClient, content: Dict[str, Any], num_questions: int) -> bool:
+    """Нужна ли параллельная генерация: вопросов больше лимита одного вызова.
+
+    Длина текста сама по себе не повод для нескольких вызовов: каждый вызов
+    стоит промпта и задержки, а текст упаковывается в бюджет токенов.
+    """
+    return planned_calls(num_questions) > 1
+
+
+def _task_contents(model_client: ModelClient, content: Dict[str, Any], num_questions: int) -> List[Tuple[Dict[str, Any], int]]:
+    max_chars = getattr(model_client, "max_text_chars", 4000)
+    tasks = plan_fanout(content.get("text") or "", num_questions, max_chars)
+    # Изображения отправляются только в первом вызове, чтобы не платить за них многократно
+    return [
+        ({
+            "text": chunk,
+            "images": content.get("images", []) if idx == 0 else [],
+            "total_pages": content.get("total_pages", 0)
+        }, count)
+        for idx, (chunk, count) in enumerate(tasks)
+    ]
+
+
+def _concurrency(model_client: ModelClient, concurrency: int) -> int:
+    """Не больше одновременных вызовов, чем модель обрабатывает параллельно (у роутера - max_concurrency)."""
+    return max(1, min(concurrency, getattr(model_client, "max_concurrency", concurrency)))
+
+
+def _run_tasks(model_client: ModelClient, tasks, concurrency: int,
+               check_cancelled: Optional[Callable[[], None]] = None):
+    """Запускает вызовы модели в пуле; возвращает итератор (индекс, вопросы).
+
+    check_cancelled() бросает исключение, если генерация отменена: еще не
+    начатые вызовы тогда не выполняются.
+    """
+    timings = current_timings()
+
+    def call(task_content, count):
+        if check_cancelled:
+            check_cancelled()
+        with bind_timings(timings):
+            return model_client.generate_quiz_questions(task_content, count)
+
+    with ThreadPoolExecutor(max_workers=min(_concurrency(model_client, concurrency), len(tasks))) as executor:
+        futures = {executor.submit(call, task_content, count): idx for idx, (task_content, count) in enumerate(tasks)}
+        try:
+            for future in as_completed(futures):
+                if check_cancelled:
+                    check_cancelled()
+                yield futures[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def _top_up_content(tasks, exclude: List[Dict]) -> Dict[str, Any]:
+    """Контент дозапроса: первый фрагмент и уже полученные вопросы, которые нельзя повторять."""
+    return {**tasks[0][0], "exclude": exclude}
+
+
+def _merge(results: List[List[Dict]]) -> List[Dict]:
+    """Объединяет вопросы фрагментов без повторов между фрагментами, id - с 1."""
+    merged = filter_questions([question for questions in results for question in questions])
+    for idx, question in enumerate(merged, start=1):
+        question["id"] = idx
+    return merged
+
+
+def generate_quiz_fanout(model_client: ModelClient, content: Dict[str, Any], num_questions: int,
+                         concurrency: int = FANOUT_CONCURRENCY,
+                         check_cancelled: Optional[Callable[[], None]] = None) -> List[Dict]:
+    """Генерирует вопросы параллельными вызовами по фрагментам документа.
+
+    Результаты объединяются в порядке фрагментов, id перенумеровываются с 1.
+    Вопросы, отброшенные как повторы между фрагментами, дозапрашиваются
+    одним небольшим вызовом по первому фрагменту. check_cancelled() проверяется
+    перед каждым вызовом модели (отмена фоновой задачи).
+    """
+    tasks = _task_contents(model_client, content, num_questions)
+    if len(tasks) == 1:
+        return model_client.generate_quiz_questions(*tasks[0])
+
+    results = [None] * len(tasks)
+    for idx, questions in _run_tasks(model_client, tasks, concurrency, check_cancelled):
+        results[idx] = questions
+
+    def request_more(missing, exclude):
+        if check_cancelled:
+            check_cancelled()
+        return model_client.generate_quiz_questions(_top_up_content(tasks, exclude), missing)
+
+    return _top_up(_merge(results), num_questions, request_more)
+
+
+def stream_quiz_fanout(model_client: ModelClient, content: Dict[str, Any], num_questions: int,
+                       concurrency: int = FANOUT_CONCURRENCY) -> Iterator[Dict]:
+    """Потоковый вариант generate_quiz_fanout: вопросы отдаются по мере
+    завершения вызовов, id присваиваются в порядке выдачи."""
+    tasks = _task_contents(model_client, content, num_questions)
+    if len(tasks) == 1:
+        # Один вызов: используем потоковую генерацию самого клиента
+        yield from model_client.stream_quiz_questions(*tasks[0])
+        return
+
+    question_filter = QuestionFilter()
+    streamed = []
+    for _, questions in _run_tasks(model_client, tasks, concurrency):
+        for question in question_filter.filter(questions):
+            question["id"] = len(streamed) + 1
+            streamed.append(question)
+            yield question
+
+    # Недостающие (отброшенные как повторы) вопросы дозапрашиваются после всех фрагментов
+    completed = _top_up(list(streamed), num_questions,
+                        lambda missing, exclude: model_client.generate_quiz_questions(_top_up_content(tasks, exclude), missing))
+    yield from completed[len(streamed):]
+
+
+async def generate_quiz_fanout_async(model_client, content: Dict[str, Any], num_questions: int,
+                                     concurrency: int = FANOUT_CONCURRENCY) -> List[Dict]:
+    """Асинхронный вариант generate_quiz_fanout для клиентов AsyncModelClient."""
+    tasks = _task_contents(model_client, content, num_questions)
+    semaphore = asyncio.Semaphore(_concurrency(model_client, concurrency))
+
+    async def call(task_content, count):
+        async with semaphore:
+            return await model_client.generate_quiz_questions(task_content, count)
+
+    results = await asyncio.gather(*(call(task_content, count) for task_content, count in tasks))
+    if len(tasks) == 1:
+        return _merge(results)
+
+    return await _top_up_async(_merge(results), num_questions,
+                               lambda missing, exclude: call(_top_up_content(tasks, exclude), missing))
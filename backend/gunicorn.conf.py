@@ -0,0 +1,37 @@
+"""Настройки gunicorn для режима с предварительно запущенными воркерами.
+
+Запуск из папки backend:
+
+    gunicorn app:app
+
+Приложение импортируется один раз в мастер-процессе (preload_app), там же
+заранее загружаются отложенные модули (openai, httpx, pdfplumber, Pillow).
+Воркеры создаются fork и получают все это через copy-on-write, поэтому
+новый воркер сразу готов отвечать, включая /api/health.
+"""
+import gc
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5001")
+workers = int(os.getenv("GUNICORN_WORKERS", os.cpu_count() or 1))
+# Генерация ждет ответа модели, поэтому каждый воркер обслуживает запросы потоками
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+# Генерация большого теста и потоковые ответы длятся дольше стандартных 30 секунд
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 300))
+preload_app = True
+PRELOAD_WARM_UP = os.getenv("PRELOAD_WARM_UP", "true").lower() == "true"
+
+
+def when_ready(server):
+    """Загружает отложенные модули в мастере до запуска воркеров."""
+    if PRELOAD_WARM_UP:
+        from lazy_imports import warm_up
+
+        loaded = warm_up()
+        server.log.info("Предзагружены модули: %s", ", ".join(
+            f"{name} {seconds * 1000:.0f} мс" for name, seconds in loaded.items()
+        ))
+    # Объекты мастера не попадут в сборку мусора воркеров, и их страницы
+    # памяти не будут копироваться из-за обновления счетчиков сборщика
+    gc.freeze()
@@ -0,0 +1,134 @@
+# Аннотации не вычисляются при импорте: Pillow загружается отложенно
+from __future__ import annotations
+
+import base64
+import io
+import os
+from typing import Optional
+
+from lazy_imports import lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageChops = lazy_import("PIL.ImageChops")
+
+# Обрезать пустые поля страницы перед кодированием
+IMAGE_CROP_MARGINS = os.getenv("IMAGE_CROP_MARGINS", "true").lower() == "true"
+# Переводить в оттенки серого страницы без цветного содержимого
+IMAGE_DETECT_GRAYSCALE = os.getenv("IMAGE_DETECT_GRAYSCALE", "true").lower() == "true"
+
+# Отличие от цвета фона (0-255), ниже которого пиксель считается пустым полем
+BLANK_THRESHOLD = 24
+# Отступ, оставляемый вокруг содержимого после обрезки полей (пиксели)
+MARGIN_PADDING = 12
+# Максимальная разница каналов RGB, при которой пиксель считается серым
+GRAYSCALE_TOLERANCE = 16
+
+# Число уровней серого в PNG для страниц без цвета (0 - без палитры)
+IMAGE_GRAY_LEVELS = int(os.getenv("IMAGE_GRAY_LEVELS", 16))
+
+# Форматы, которые принимают vision-модели OpenAI
+_FORMATS = {"png": "PNG", "jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP"}
+
+
+def normalize_format(fmt: str) -> str:
+    """Приводит название формата к виду для data URL (jpg -> jpeg).
+
+    "auto" выбирает формат по содержимому страницы, см. resolve_format().
+    """
+    fmt = fmt.lower()
+    if fmt != "auto" and fmt not in _FORMATS:
+        raise ValueError(f"Неподдерживаемый формат изображения: {fmt}")
+    return "jpeg" if fmt == "jpg" else fmt
+
+
+def resolve_format(image: Image.Image, fmt: str) -> str:
+    """Конкретный формат для изображения.
+
+    В режиме auto страницы в оттенках серого (обычно текст) кодируются PNG
+    с палитрой - без артефактов вокруг букв и компактнее JPEG; цветные - JPEG.
+    """
+    fmt = normalize_format(fmt)
+    if fmt == "auto":
+        return "png" if image.mode == "L" else "jpeg"
+    return fmt
+
+
+def crop_blank_margins(image: Image.Image, threshold: int = BLANK_THRESHOLD,
+                       padding: int = MARGIN_PADDING) -> Image.Image:
+    """Обрезает однотонные поля вокруг содержимого страницы.
+
+    Цвет фона берется из левого верхнего угла; пустая страница не обрезается.
+    """
+    rgb = image.convert("RGB")
+    background = Image.new("RGB", rgb.size, rgb.getpixel((0, 0)))
+    diff = ImageChops.difference(rgb, background).convert("L")
+    bbox = diff.point(lambda value: 255 if value > threshold else 0).getbbox()
+    if not bbox:
+        return image
+
+    left, top, right, bottom = bbox
+    bbox = (
+        max(0, left - padding),
+        max(0, top - padding),
+        min(image.width, right + padding),
+        min(image.height, bottom + padding)
+    )
+    if bbox == (0, 0, image.width, image.height):
+        return image
+    return image.crop(bbox)
+
+
+def is_grayscale(image: Image.Image, tolerance: int = GRAYSCALE_TOLERANCE) -> bool:
+    """Проверяет, что в изображении нет цветного содержимого."""
+    if image.mode in ("1", "L", "LA", "I", "F"):
+        return True
+
+    # Для проверки достаточно уменьшенной копии
+    sample = image.convert("RGB")
+    sample.thumbnail((256, 256))
+    red, green, blue = sample.split()
+    for first, second in ((red, green), (green, blue), (red, blue)):
+        if ImageChops.difference(first, second).getextrema()[1] > tolerance:
+            return False
+    return True
+
+
+def compact_image(image: Image.Image, max_side: Optional[int] = None,
+                  crop: bool = IMAGE_CROP_MARGINS, grayscale: bool = IMAGE_DETECT_GRAYSCALE) -> Image.Image:
+    """Уменьшает изображение страницы для отправки в модель.
+
+    Обрезает пустые поля, переводит страницы без цвета в оттенки серого
+    и уменьшает так, чтобы большая сторона не превышала max_side.
+    """
+    if crop:
+        image = crop_blank_margins(image)
+    if grayscale and image.mode != "L" and is_grayscale(image):
+        image = image.convert("L")
+    if max_side and max(image.size) > max_side:
+        image = image.copy() if image.mode == "L" else image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image
+
+
+def encode_image(image: Image.Image, fmt: str, quality: Optional[int] = None) -> bytes:
+    """Кодирует изображение в указанном формате; quality задает сжатие JPEG/WebP."""
+    fmt = resolve_format(image, fmt)
+    if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if fmt == "png" and image.mode == "L" and IMAGE_GRAY_LEVELS:
+        image = image.quantize(IMAGE_GRAY_LEVELS)
+
+    options = {}
+    if fmt in ("jpeg", "webp") and quality:
+        options["quality"] = quality
+    if fmt in ("jpeg", "png"):
+        options["optimize"] = True
+
+    buffered = io.BytesIO()
+    image.save(buffered, format=_FORMATS[fmt], **options)
+    return buffered.getvalue()
+
+
+def encode_image_base64(image: Image.Image, fmt: str, quality: Optional[int] = None) -> str:
+    """Кодирует изображение и возвращает base64 строку."""
+    return base64.b64encode(encode_image(image, fmt, quality)).decode('utf-8')
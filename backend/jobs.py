@@ -0,0 +1,206 @@
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from timings import collect_timings
+
+
+class JobQueueFull(Exception):
+    """Очередь задач заполнена, новая задача не может быть принята."""
+    pass
+
+
+class JobCancelled(Exception):
+    """Задача была отменена во время выполнения."""
+    pass
+
+
+class Job:
+    """Фоновая задача генерации теста."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, func: Callable[["Job"], Any], cleanup: Optional[Callable[[], None]] = None):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.cleanup = cleanup
+        self.status = Job.QUEUED
+        self.result = None
+        self.error = None
+        self.error_type = None
+        self.timings: Dict[str, float] = {}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (Job.DONE, Job.FAILED, Job.CANCELLED)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        """Прерывает выполнение между этапами, если задача отменена."""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def timings_snapshot(self) -> Dict[str, float]:
+        """Копия измерений: воркер и потоки fan-out добавляют этапы во время опроса."""
+        # dict.copy() выполняется целиком под GIL, в отличие от обхода словаря
+        return self.timings.copy()
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timings": {name: round(seconds, 4) for name, seconds in self.timings_snapshot().items()}
+        }
+        if self.status == Job.RUNNING:
+            data["cancel_requested"] = self.cancelled
+        elif self.status == Job.DONE:
+            data["result"] = self.result
+        elif self.status == Job.FAILED:
+            data["error"] = self.error
+            data["error_type"] = self.error_type
+        return data
+
+
+class JobManager:
+    """Ограниченный пул фоновых воркеров с очередью фиксированной длины.
+
+    Если очередь заполнена, submit() бросает JobQueueFull, и API отвечает 429.
+    Завершенные задачи хранятся result_ttl секунд, затем удаляются.
+    """
+
+    def __init__(self, num_workers: int = 4, max_queue_size: int = 32, result_ttl: float = 3600):
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _ensure_workers(self) -> None:
+        # Воркеры запускаются при первой задаче, а не при импорте модуля
+        with self._lock:
+            if self._workers:
+                return
+            for idx in range(self.num_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{idx}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, func: Callable[[Job], Any], cleanup: Optional[Callable[[], None]] = None) -> Job:
+        """Ставит задачу в очередь; func(job) выполняется в воркере."""
+        self._ensure_workers()
+        self._prune()
+
+        job = Job(func, cleanup)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise JobQueueFull("Очередь задач заполнена, повторите запрос позже")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Отменяет задачу. Задача в очереди не будет запущена, выполняющаяся
+        прервется на границе следующего этапа."""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        job._cancel_event.set()
+        if job.status == Job.QUEUED:
+            self._finish(job, Job.CANCELLED)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "workers": self.num_workers,
+            "queue_depth": self._queue.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "jobs": statuses
+        }
+
+    def _finish(self, job: Job, status: str) -> None:
+        with self._lock:
+            if job.finished:
+                return
+            job.status = status
+            job.finished_at = time.time()
+        if job.cleanup:
+            try:
+                job.cleanup()
+            except Exception:
+                pass
+
+    def _prune(self) -> None:
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished and job.finished_at < now - self.result_ttl
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _worker_loop(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Job) -> None:
+        with self._lock:
+            if job.finished:
+                return
+            job.status = Job.RUNNING
+            job.started_at = time.time()
+
+        with collect_timings() as timings:
+            job.timings = timings
+            timings["queue"] = job.started_at - job.created_at
+            try:
+                result = job.func(job)
+                job.raise_if_cancelled()
+                job.result = result
+                status = Job.DONE
+            except JobCancelled:
+                status = Job.CANCELLED
+            except ValueError as e:
+                job.error = str(e)
+                job.error_type = "validation"
+                status = Job.FAILED
+            except Exception as e:
+                job.error = f"Ошибка при обработке запроса: {str(e)}"
+                job.error_type = "internal"
+                status = Job.FAILED
+            timings["total"] = time.time() - job.started_at
+
+        self._finish(job, status)
@@ -0,0 +1,73 @@
+"""Отложенный импорт тяжелых библиотек.
+
+openai, httpx, pdfplumber и Pillow импортируются сотни миллисекунд, а
+/api/health и запросы без PDF в них не нуждаются. lazy_import() сразу
+возвращает заместитель модуля, а сам модуль импортируется при первом
+обращении к его атрибуту. warm_up() загружает все отложенные модули
+заранее - так делает мастер-процесс gunicorn (gunicorn.conf.py) перед
+запуском воркеров, чтобы воркеры получили их уже загруженными через
+copy-on-write.
+"""
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+import types
+from typing import Dict, List
+
+# Заместители, созданные через lazy_import, по именам модулей в порядке регистрации
+_lazy_modules: Dict[str, "LazyModule"] = {}
+# Первое обращение из нескольких потоков (воркеры задач, пакет /api/batch)
+# выполняет импорт один раз, остальные потоки ждут готовый модуль
+_import_lock = threading.RLock()
+
+
+class LazyModule(types.ModuleType):
+    """Заместитель модуля: настоящий модуль импортируется обычным import
+    при первом обращении к атрибуту, дальше атрибуты берутся из него.
+
+    Заместитель не попадает в sys.modules, поэтому обычный import того же
+    модуля в другом месте не видит частично загруженного состояния.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            with _import_lock:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self) -> List[str]:
+        return dir(self._load())
+
+
+def lazy_import(name: str):
+    """Модуль name, который загрузится при первом обращении к атрибуту."""
+    module = sys.modules.get(name) or _lazy_modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        raise ImportError(f"Модуль {name} не найден")
+    module = _lazy_modules[name] = LazyModule(name)
+    return module
+
+
+def warm_up() -> Dict[str, float]:
+    """Загружает все отложенные модули; возвращает время загрузки каждого (секунды)."""
+    loaded = {}
+    for name, module in list(_lazy_modules.items()):
+        start = time.perf_counter()
+        module._load()
+        loaded[name] = time.perf_counter() - start
+    return loaded
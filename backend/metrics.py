@@ -0,0 +1,246 @@
+"""Метрики процесса в текстовом формате Prometheus (/api/metrics).
+
+Реализация без внешних зависимостей: счетчик или гистограмма с метками -
+словарь под одной блокировкой, поэтому наблюдение стоит микросекунды и
+метрики можно держать включенными постоянно. Значения считаются отдельно
+в каждом процессе сервера.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы гистограмм длительности (секунды): от разбора ответа до долгой генерации
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.label_names}")
+        return tuple(str(label) for label in labels)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = self._header()
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами корзин."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики корзин (последняя - +Inf), сумма, количество]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Измеряет длительность блока."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        lines = self._header()
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Набор метрик процесса."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def _register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Этапы обработки (timings.stage): extract, render, score, model, parse
+stage_seconds = registry.histogram(
+    "quiz_stage_duration_seconds", "Длительность этапов обработки", ["stage"]
+)
+stage_errors = registry.counter(
+    "quiz_stage_errors_total", "Ошибки по этапам обработки", ["stage", "error_type"]
+)
+
+# Вызовы моделей по model_type (openrouter, ollama-mistral)
+model_request_seconds = registry.histogram(
+    "quiz_model_request_duration_seconds", "Длительность вызова модели", ["model_type", "outcome"]
+)
+model_tokens = registry.counter(
+    "quiz_model_tokens_total", "Токены промпта и ответа по данным API", ["model_type", "kind"]
+)
+model_retries = registry.counter(
+    "quiz_model_retries_total", "Повторные вызовы для недостающих вопросов", ["model_type"]
+)
+parse_failures = registry.counter(
+    "quiz_parse_failures_total", "Ответы модели без единого разобранного вопроса", ["model_type"]
+)
+questions_generated = registry.counter(
+    "quiz_questions_generated_total", "Разобранные вопросы из ответов модели", ["model_type"]
+)
+
+# Фильтр качества вопросов (quality.py)
+quality_rejected = registry.counter(
+    "quiz_quality_rejected_total", "Вопросы, отброшенные фильтром качества", ["reason"]
+)
+quality_removed_options = registry.counter(
+    "quiz_quality_removed_options_total", "Повторяющиеся варианты ответа, убранные из вопросов"
+)
+
+# Роутер моделей (router.py)
+router_retries = registry.counter(
+    "quiz_router_retries_total", "Повторы вызова модели после временной ошибки", ["model_type"]
+)
+router_hedges = registry.counter(
+    "quiz_router_hedges_total", "Дублирующие вызовы резервной модели после p95 основной", ["model_type"]
+)
+router_failovers = registry.counter(
+    "quiz_router_failovers_total", "Ответы, полученные от резервной модели", ["model_type", "fallback"]
+)
+router_rejected = registry.counter(
+    "quiz_router_rejected_total", "Вызовы, не начатые из-за лимита или размыкателя", ["model_type", "reason"]
+)
+
+# HTTP запросы по маршрутам
+http_request_seconds = registry.histogram(
+    "quiz_http_request_duration_seconds", "Длительность обработки HTTP запроса", ["route", "method", "status"]
+)
+http_errors = registry.counter(
+    "quiz_http_errors_total", "Ошибки запросов по типу исключения", ["route", "error_type"]
+)
+
+
+@contextmanager
+def track_model_request(model_type: str):
+    """Измеряет вызов модели; outcome - ok, error или cancelled (поток брошен клиентом)."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    except GeneratorExit:
+        outcome = "cancelled"
+        raise
+    finally:
+        model_request_seconds.observe(time.perf_counter() - start, model_type, outcome)
+
+
+def record_tokens(model_type: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+    """Учитывает токены из usage ответа (отсутствующие значения пропускаются)."""
+    if prompt_tokens:
+        model_tokens.inc(model_type, "prompt", amount=prompt_tokens)
+    if completion_tokens:
+        model_tokens.inc(model_type, "completion", amount=completion_tokens)
+
+
+def error_type(error: BaseException) -> str:
+    """Тип ошибки для метрик: validation для ошибок ввода, иначе имя класса."""
+    if isinstance(error, ValueError):
+        return "validation"
+    # Клиенты моделей оборачивают исходную ошибку в Exception с текстом для пользователя
+    while type(error) is Exception and error.__context__ is not None:
+        error = error.__context__
+    return type(error).__name__
+
+
+def render() -> str:
+    return registry.render()
@@ -1,22 +1,81 @@
-import openai
+# Аннотации не вычисляются при импорте: httpx загружается отложенно
+from __future__ import annotations
+
+import asyncio
+import atexit
+import importlib.util
 import json
 import os
 import re
-import httpx
+import threading
+import time
+import warnings
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
-from dotenv import load_dotenv
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
+import metrics
+from lazy_imports import lazy_import
+from quality import QuestionFilter, filter_questions
+from timings import stage
+from prompt_builder import OutputTokenEstimator, chars_for_tokens, pack_content
+
+# SDK провайдеров загружаются при создании первого клиента
+openai = lazy_import("openai")
+httpx = lazy_import("httpx")
+
+# Версия промптов: увеличивается при изменении формулировок, чтобы
+# закэшированные тесты, созданные старыми промптами, не переиспользовались
+PROMPT_VERSION = 3
+
+# Начальная оценка размера одного вопроса в ответе модели (токены);
+# уточняется по фактическому usage ответов
+OUTPUT_TOKENS_PER_QUESTION = float(os.getenv("OUTPUT_TOKENS_PER_QUESTION", 120))
+
+# Параметры пулов HTTP соединений для долгоживущих клиентов
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", 20))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", 10))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+# В ASGI режиме одно соединение занимает каждая ожидающая генерация,
+# поэтому пул асинхронных клиентов больше
+ASYNC_HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("ASYNC_HTTP_POOL_MAX_CONNECTIONS", 256))
+
+# Адреса API моделей (переопределяются, например, для локального стенда бенчмарков)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+# Повторы внутри openai SDK; по умолчанию повторяет router.py, чтобы
+# повторы не перемножались (без роутера стоит вернуть 2, как в SDK)
+OPENROUTER_MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", 0))
+
+# Как часто фоновый поток обновляет состояние Ollama (секунды)
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", 15))
+
+# Сколько раз дозапрашивать вопросы, которых не хватило в ответе модели
+# (например, если ответ оборвался на лимите токенов)
+FOLLOWUP_ATTEMPTS = int(os.getenv("FOLLOWUP_ATTEMPTS", 1))
 
-load_dotenv()
+# Висячая запятая перед закрывающей скобкой - частая ошибка JSON от моделей
+TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
 
+# Компактный промпт для экономии токенов
+SYSTEM_PROMPT = """Создай вопросы теста на основе контента. Тип: multiple_choice (4 варианта). На русском. Только JSON.
 
-def normalize_questions(questions: List[Dict]) -> List[Dict]:
-    """Нормализует и валидирует вопросы из ответа модели."""
+Формат: {"questions": [{"id": 1, "question": "Текст вопроса?", "type": "multiple_choice", "options": ["Полный текст варианта A", "Полный текст варианта B", "Полный текст варианта C", "Полный текст варианта D"], "correct_answer": 0}]}
+
+correct_answer - это индекс правильного ответа (0, 1, 2 или 3), где 0 = первый вариант, 1 = второй вариант и т.д."""
+
+
+def normalize_questions(questions: List[Dict], start_index: int = 0) -> List[Dict]:
+    """Нормализует и валидирует вопросы из ответа модели.
+    
+    id присваиваются по порядку начиная с start_index + 1: id из ответа
+    модели после фильтра качества шли бы с пропусками и повторами.
+    """
     normalized_questions = []
     
-    for idx, q in enumerate(questions):
+    for idx, q in enumerate(questions, start=start_index):
         normalized_q = {
-            "id": q.get("id", idx + 1),
+            "id": idx + 1,
             "question": q.get("question", ""),
             "type": q.get("type", "multiple_choice"),
             "correct_answer": q.get("correct_answer")
@@ -50,6 +109,222 @@ def extract_json_from_response(response_text: str) -> str:
     return response_text.strip()
 
 
+class ResponseParseError(Exception):
+    """В ответе модели не нашлось ни одного целого вопроса."""
+    pass
+
+
+def get_page_images(pdf_content: Dict[str, Any], max_pages: int, dpi: int = 200, fmt: str = "png",
+                    quality: Optional[int] = None, max_side: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Возвращает изображения страниц, растеризуя их только по запросу.
+    
+    Для ленивого объекта из process_pdf (с методом render) выбираются страницы
+    с наибольшей визуальной оценкой (изображения, диаграммы); если таких нет,
+    изображения не отправляются. Исключение - документ без текста (скан):
+    тогда отправляются первые страницы. Готовый список изображений (например,
+    пустой список в текстовом режиме) используется как есть.
+    """
+    images = pdf_content.get("images") or []
+    if hasattr(images, "render"):
+        pages = images.visual_pages(max_pages)
+        if not pages and not pdf_content.get("text"):
+            pages = range(1, max_pages + 1)
+        return images.render(pages, dpi=dpi, fmt=fmt, quality=quality, max_side=max_side)
+    return list(images[:max_pages])
+
+
+class QuestionStreamParser:
+    """Инкрементальный парсер ответа модели.
+    
+    Принимает ответ по частям и возвращает каждый объект вопроса, как только
+    закрывается его фигурная скобка. Текст до первой скобки (например,
+    markdown-ограждение ```json) пропускается.
+    """
+    
+    def __init__(self):
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._capture_depth = None
+        self._buffer = []
+    
+    def feed(self, chunk: str) -> List[Dict]:
+        """Обрабатывает очередной фрагмент и возвращает завершенные объекты."""
+        completed = []
+        
+        for char in chunk:
+            capturing = self._capture_depth is not None
+            
+            if self._in_string:
+                if capturing:
+                    self._buffer.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            
+            # До начала JSON игнорируем любой текст
+            if not self._stack and char not in "{[":
+                continue
+            
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                # Объект внутри массива - кандидат на вопрос
+                if char == "{" and not capturing and self._stack and self._stack[-1] == "[":
+                    self._capture_depth = len(self._stack)
+                    capturing = True
+                self._stack.append(char)
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if capturing and len(self._stack) == self._capture_depth:
+                    self._buffer.append(char)
+                    obj = self._finish_object()
+                    if obj is not None:
+                        completed.append(obj)
+                    continue
+            
+            if capturing:
+                self._buffer.append(char)
+        
+        return completed
+    
+    def _finish_object(self):
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._capture_depth = None
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            try:
+                obj = json.loads(TRAILING_COMMA_RE.sub(r"\1", text))
+            except json.JSONDecodeError:
+                return None
+        return obj if isinstance(obj, dict) and "question" in obj else None
+
+
+class ParseStats:
+    """Счетчики разбора ответов моделей (для /api/health)."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.recovered = 0
+        self.failed = 0
+        self.missing_questions = 0
+    
+    def record(self, expected: int, received: int, recovered: bool) -> None:
+        with self._lock:
+            self.responses += 1
+            self.recovered += int(recovered and received > 0)
+            self.failed += int(received == 0)
+            self.missing_questions += max(0, expected - received)
+    
+    def to_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "responses": self.responses,
+                "recovered": self.recovered,
+                "failed": self.failed,
+                "missing_questions": self.missing_questions
+            }
+
+
+parse_stats = ParseStats()
+
+
+def parse_questions(response_text: str, expected: int) -> Tuple[List[Dict], int]:
+    """Разбирает ответ модели, восстанавливая оборванный или засоренный JSON.
+    
+    Если ответ не является корректным JSON (оборван на лимите токенов, содержит
+    текст после JSON и т.п.), из него извлекаются все завершенные объекты вопросов.
+    
+    Returns:
+        (вопросы, сколько вопросов не хватает до expected)
+    """
+    response_text = extract_json_from_response(response_text)
+    try:
+        result = json.loads(response_text)
+        questions = result.get("questions") if isinstance(result, dict) else result
+        if isinstance(questions, list):
+            questions = [q for q in questions if isinstance(q, dict)]
+            if questions:
+                parse_stats.record(expected, len(questions), recovered=False)
+                return questions, max(0, expected - len(questions))
+    except json.JSONDecodeError:
+        pass
+    
+    # Оборванный ответ или текст вокруг JSON: берем все завершенные объекты вопросов
+    questions = QuestionStreamParser().feed(response_text)
+    parse_stats.record(expected, len(questions), recovered=True)
+    if not questions:
+        raise ResponseParseError(f"Не удалось найти вопросы в ответе модели. Ответ: {response_text[:500]}")
+    return questions, max(0, expected - len(questions))
+
+
+def _exclusion_prompt(questions: Optional[List[Dict]]) -> str:
+    """Список уже созданных вопросов для повторного запроса, чтобы модель их не повторяла."""
+    if not questions:
+        return ""
+    lines = "\n".join(f"- {q.get('question', '')[:120]}" for q in questions)
+    return f"\nЭти вопросы уже есть, не повторяй их:\n{lines}\n"
+
+
+def _renumber(questions: List[Dict]) -> List[Dict]:
+    for idx, question in enumerate(questions, start=1):
+        question["id"] = idx
+    return questions
+
+
+def _top_up(questions: List[Dict], num_questions: int,
+            request_more: Callable[[int, List[Dict]], List[Dict]]) -> List[Dict]:
+    """Дозапрашивает у модели только недостающие вопросы.
+    
+    request_more(количество, уже полученные вопросы) выполняет повторный вызов.
+    Если он не удался, возвращаются уже полученные вопросы.
+    """
+    added = False
+    for _ in range(FOLLOWUP_ATTEMPTS):
+        missing = num_questions - len(questions)
+        if missing <= 0:
+            break
+        try:
+            extra = request_more(missing, questions)
+        except Exception:
+            break
+        # Дозапрошенные вопросы не должны повторять уже полученные
+        extra = filter_questions(extra, existing=questions)
+        if not extra:
+            break
+        questions = questions + extra[:missing]
+        added = True
+    return _renumber(questions) if added else questions
+
+
+async def _top_up_async(questions: List[Dict], num_questions: int, request_more) -> List[Dict]:
+    """Асинхронный вариант _top_up: request_more - корутинная функция."""
+    added = False
+    for _ in range(FOLLOWUP_ATTEMPTS):
+        missing = num_questions - len(questions)
+        if missing <= 0:
+            break
+        try:
+            extra = await request_more(missing, questions)
+        except Exception:
+            break
+        # Дозапрошенные вопросы не должны повторять уже полученные
+        extra = filter_questions(extra, existing=questions)
+        if not extra:
+            break
+        questions = questions + extra[:missing]
+        added = True
+    return _renumber(questions) if added else questions
+
+
 class ModelClient(ABC):
     """Абстрактный базовый класс для клиентов моделей."""
     
@@ -57,47 +332,123 @@ class ModelClient(ABC):
     def generate_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> List[Dict]:
         """Генерирует вопросы для теста на основе содержимого PDF."""
         pass
+    
+    @abstractmethod
+    def stream_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> Iterator[Dict]:
+        """Генерирует вопросы в потоковом режиме, отдавая каждый сразу после получения."""
+        pass
+    
+    def close(self) -> None:
+        """Освобождает соединения клиента."""
+        pass
+    
+    def status(self) -> Dict[str, Any]:
+        """Состояние клиента для /api/health."""
+        return {}
 
 
-class OpenRouterClient(ModelClient):
-    """Клиент для работы с OpenRouter API."""
+class AsyncModelClient(ABC):
+    """Абстрактный базовый класс для асинхронных клиентов моделей (ASGI режим)."""
     
-    def __init__(self):
+    @abstractmethod
+    async def generate_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> List[Dict]:
+        """Генерирует вопросы для теста на основе содержимого PDF."""
+        pass
+    
+    async def close(self) -> None:
+        """Освобождает соединения клиента."""
+        pass
+    
+    def status(self) -> Dict[str, Any]:
+        """Состояние клиента для /api/health."""
+        return {}
+
+
+class _InstrumentedRequests:
+    """Метрики вызовов модели с меткой model_type (metrics_label)."""
+    
+    metrics_label = ""
+    
+    def _parse_text(self, response_text: str, num_questions: int) -> List[Dict]:
+        try:
+            questions, _ = parse_questions(response_text, num_questions)
+        except ResponseParseError:
+            metrics.parse_failures.inc(self.metrics_label)
+            raise
+        metrics.questions_generated.inc(self.metrics_label, amount=len(questions))
+        return questions
+    
+    def _track_request(self, exclude: Optional[List[Dict]] = None):
+        """Контекст вызова модели; вызов с exclude - дозапрос недостающих вопросов."""
+        if exclude:
+            metrics.model_retries.inc(self.metrics_label)
+        return metrics.track_model_request(self.metrics_label)
+    
+    def _stream_questions(self, questions: List[Dict]) -> None:
+        """Учитывает вопросы, полученные потоком."""
+        if questions:
+            metrics.questions_generated.inc(self.metrics_label, amount=len(questions))
+        else:
+            metrics.parse_failures.inc(self.metrics_label)
+
+
+class _OpenRouterRequests(_InstrumentedRequests):
+    """Общая часть синхронного и асинхронного клиентов OpenRouter:
+    формирование запроса, разбор ответа и ошибки."""
+    
+    # Бюджет токенов текста документа в промпте и лимит токенов ответа
+    prompt_token_budget = int(os.getenv("OPENROUTER_PROMPT_TOKENS", 1500))
+    max_output_tokens = int(os.getenv("OPENROUTER_MAX_OUTPUT_TOKENS", 4096))
+    # Сколько символов текста помещается в один запрос: извлечение и фрагменты
+    # fan-out считаются от того же бюджета, что и упаковка промпта
+    max_text_chars = chars_for_tokens(prompt_token_budget)
+    
+    # Параметры изображений, отправляемых в vision-модель: страница
+    # уменьшается до image_max_side (1024 - не больше 4 тайлов gpt-4o),
+    # формат auto - PNG с палитрой для серых страниц и JPEG для цветных
+    max_images = 2
+    image_dpi = int(os.getenv("IMAGE_DPI", 150))
+    image_format = os.getenv("IMAGE_FORMAT", "auto")
+    image_quality = int(os.getenv("IMAGE_QUALITY", 75))
+    image_max_side = int(os.getenv("IMAGE_MAX_SIDE", 1024))
+    
+    base_url = OPENROUTER_BASE_URL
+    metrics_label = "openrouter"
+    
+    def _api_key(self) -> str:
         api_key = os.getenv("OPENROUTER_API_KEY")
         if not api_key:
             raise ValueError("OPENROUTER_API_KEY не установлен в переменных окружения")
-        
-        base_url = "https://openrouter.ai/api/v1"
-        self.client = openai.OpenAI(
-            base_url=base_url,
-            api_key=api_key
-        )
+        return api_key
     
-    def generate_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> List[Dict]:
-        """Генерирует вопросы для теста на основе содержимого PDF через OpenRouter API."""
-        
-        # Компактный промпт для экономии токенов
-        system_prompt = """Создай вопросы теста на основе контента. Тип: multiple_choice (4 варианта). На русском. Только JSON.
-
-Формат: {"questions": [{"id": 1, "question": "Текст вопроса?", "type": "multiple_choice", "options": ["Полный текст варианта A", "Полный текст варианта B", "Полный текст варианта C", "Полный текст варианта D"], "correct_answer": 0}]}
-
-correct_answer - это индекс правильного ответа (0, 1, 2 или 3), где 0 = первый вариант, 1 = второй вариант и т.д."""
+    def _build_request(self, pdf_content: Dict[str, Any], num_questions: int,
+                       exclude: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """Формирует параметры запроса chat completions.
         
+        exclude - уже полученные вопросы, которые модель не должна повторять;
+        их можно передать и ключом "exclude" контента (дозапрос в fanout.py).
+        """
+        exclude = exclude or pdf_content.get("exclude")
         # Формируем сообщения для API
         messages = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": f"Создай {num_questions} вопросов для теста на основе следующего контента:\n\n"}
         ]
         
-        # Добавляем текст из PDF (уменьшено для экономии токенов)
-        if pdf_content.get("text"):
-            messages[1]["content"] += f"ТЕКСТ:\n{pdf_content['text'][:4000]}\n\n"
+        # Добавляем текст из PDF, сжатый и вписанный в бюджет токенов
+        text, _ = pack_content(pdf_content.get("text") or "", self.prompt_token_budget)
+        if text:
+            messages[1]["content"] += f"ТЕКСТ:\n{text}\n\n"
         
         # Добавляем изображения (уменьшено для экономии токенов)
-        images_to_send = pdf_content.get("images", [])[:2]
+        images_to_send = get_page_images(
+            pdf_content, self.max_images, dpi=self.image_dpi, fmt=self.image_format,
+            quality=self.image_quality, max_side=self.image_max_side
+        )
         
         if images_to_send:
-            messages[1]["content"] += "ИЗОБРАЖЕНИЯ ИЗ ДОКУМЕНТА:\n"
+            pages = ", ".join(str(img_data["page"]) for img_data in images_to_send if "page" in img_data)
+            messages[1]["content"] += f"ИЗОБРАЖЕНИЯ СТРАНИЦ ДОКУМЕНТА ({pages}):\n" if pages else "ИЗОБРАЖЕНИЯ ИЗ ДОКУМЕНТА:\n"
             for img_data in images_to_send:
                 messages.append({
                     "role": "user",
@@ -111,161 +462,618 @@ correct_answer - это индекс правильного ответа (0, 1,
                     ]
                 })
         
+        messages[1]["content"] += _exclusion_prompt(exclude)
         messages[1]["content"] += f"\nСоздай {num_questions} вопросов. Только JSON."
         
-        try:
-            # Вычисляем max_tokens на основе количества вопросов
-            calculated_max_tokens = min(num_questions * 200, 1500)
-            
-            # Используем gpt-4o-mini для экономии, если нет изображений, иначе gpt-4o
-            model = "openai/gpt-4o-mini" if not images_to_send else "openai/gpt-4o"
+        return {
+            # gpt-4o нужен только для страниц с визуальным содержимым, иначе gpt-4o-mini
+            "model": "openai/gpt-4o-mini" if not images_to_send else "openai/gpt-4o",
+            "messages": messages,
+            # Лимит ответа по измеренному размеру вопроса: лишний резерв
+            # max_tokens OpenRouter списывает с кредитов (ошибки 402)
+            "max_tokens": self.output_tokens.max_tokens(num_questions),
+            "temperature": 0.7
+        }
+    
+    def _parse_response(self, response, num_questions: int) -> List[Dict]:
+        """Извлекает вопросы из ответа chat completions, включая оборванный ответ."""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            metrics.record_tokens(self.metrics_label, usage.prompt_tokens, usage.completion_tokens)
+        
+        with stage("parse"):
+            questions = self._parse_text(response.choices[0].message.content or "", num_questions)
             
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=calculated_max_tokens,
-                temperature=0.7
+            if usage is not None:
+                self.output_tokens.observe(usage.completion_tokens, len(questions))
+            return normalize_questions(filter_questions(questions))
+    
+    def _api_error(self, error: Exception) -> Exception:
+        """Преобразует ошибку API в понятное пользователю сообщение."""
+        error_msg = str(error)
+        # Обрабатываем ошибку недостатка кредитов
+        if "402" in error_msg or "credits" in error_msg.lower() or "max_tokens" in error_msg.lower():
+            return Exception(
+                "Недостаточно кредитов в OpenRouter для выполнения запроса. "
+                "Пожалуйста, попробуйте уменьшить количество вопросов или пополните баланс на https://openrouter.ai/settings/credits"
             )
-            
-            # Извлекаем JSON из ответа
-            response_text = response.choices[0].message.content.strip()
-            response_text = extract_json_from_response(response_text)
-            
-            # Парсим JSON
-            result = json.loads(response_text)
-            
-            # Валидируем и нормализуем формат
-            questions = result.get("questions", [])
-            return normalize_questions(questions)
-            
-        except json.JSONDecodeError as e:
-            raise Exception(f"Ошибка парсинга JSON ответа от API: {str(e)}")
-        except Exception as e:
-            error_msg = str(e)
-            # Обрабатываем ошибку недостатка кредитов
-            if "402" in error_msg or "credits" in error_msg.lower() or "max_tokens" in error_msg.lower():
-                raise Exception(
-                    "Недостаточно кредитов в OpenRouter для выполнения запроса. "
-                    "Пожалуйста, попробуйте уменьшить количество вопросов или пополните баланс на https://openrouter.ai/settings/credits"
-                )
-            raise Exception(f"Ошибка при вызове OpenRouter API: {error_msg}")
+        return Exception(f"Ошибка при вызове OpenRouter API: {error_msg}")
 
 
-class OllamaClient(ModelClient):
-    """Клиент для работы с локальной Ollama API."""
+class OpenRouterClient(_OpenRouterRequests, ModelClient):
+    """Клиент для работы с OpenRouter API."""
     
-    def __init__(self, model_name: str = "mistral", base_url: str = "http://localhost:11434"):
-        self.model_name = model_name
-        self.base_url = base_url
-        self.client = httpx.Client(timeout=100.0)  # Увеличенный таймаут для локальной модели
+    def __init__(self, http_client: Optional[httpx.Client] = None):
+        self.client = openai.OpenAI(
+            base_url=self.base_url,
+            api_key=self._api_key(),
+            http_client=http_client,
+            max_retries=OPENROUTER_MAX_RETRIES
+        )
+        self.output_tokens = OutputTokenEstimator(OUTPUT_TOKENS_PER_QUESTION, max_tokens_cap=self.max_output_tokens)
     
-    def _check_ollama_available(self) -> bool:
-        """Проверяет доступность Ollama сервера."""
+    def close(self) -> None:
+        self.client.close()
+    
+    def _request_questions(self, pdf_content: Dict[str, Any], num_questions: int,
+                           exclude: Optional[List[Dict]] = None) -> List[Dict]:
+        """Один вызов модели; возвращает все вопросы, которые удалось разобрать."""
+        request_params = self._build_request(pdf_content, num_questions, exclude)
+        
         try:
-            response = self.client.get(f"{self.base_url}/api/tags", timeout=5.0)
-            return response.status_code == 200
-        except Exception:
-            return False
+            with stage("model"), self._track_request(exclude):
+                response = self.client.chat.completions.create(**request_params)
+            return self._parse_response(response, num_questions)
+            
+        except ResponseParseError:
+            raise
+        except Exception as e:
+            raise self._api_error(e)
     
     def generate_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> List[Dict]:
-        """Генерирует вопросы для теста на основе содержимого PDF через Ollama API."""
+        """Генерирует вопросы для теста на основе содержимого PDF через OpenRouter API.
         
-        # Проверяем доступность Ollama
-        if not self._check_ollama_available():
-            raise Exception(
-                f"Ollama сервер недоступен по адресу {self.base_url}. "
-                "Убедитесь, что Ollama запущен и модель загружена."
-            )
+        Если ответ оборвался, недостающие вопросы запрашиваются отдельным вызовом.
+        """
+        questions = self._request_questions(pdf_content, num_questions)
+        return _top_up(questions, num_questions,
+                       lambda missing, exclude: self._request_questions(pdf_content, missing, exclude))
+    
+    def stream_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> Iterator[Dict]:
+        """Генерирует вопросы через OpenRouter API, отдавая их по мере генерации."""
+        request_params = self._build_request(pdf_content, num_questions)
+        parser = QuestionStreamParser()
+        question_filter = QuestionFilter()
+        questions = []
         
-        # Формируем промпт для Ollama
-        system_prompt = """Создай вопросы теста на основе контента. Тип: multiple_choice (4 варианта). На русском. Только JSON.
+        try:
+            with self._track_request():
+                stream = self.client.chat.completions.create(stream=True, **request_params)
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    for question in parser.feed(delta):
+                        question = question_filter.check(question)
+                        if question is None:
+                            continue
+                        question = normalize_questions([question], start_index=len(questions))[0]
+                        questions.append(question)
+                        yield question
+        except Exception as e:
+            raise self._api_error(e)
+        
+        self._stream_questions(questions)
+        if not questions:
+            raise Exception("OpenRouter не вернул вопросы в ответе")
+        
+        # Ответ оборвался: недостающие вопросы догружаются обычным вызовом
+        completed = _top_up(list(questions), num_questions,
+                            lambda missing, exclude: self._request_questions(pdf_content, missing, exclude))
+        yield from completed[len(questions):]
 
-Формат: {"questions": [{"id": 1, "question": "Текст вопроса?", "type": "multiple_choice", "options": ["Полный текст варианта A", "Полный текст варианта B", "Полный текст варианта C", "Полный текст варианта D"], "correct_answer": 0}]}
 
-correct_answer - это индекс правильного ответа (0, 1, 2 или 3), где 0 = первый вариант, 1 = второй вариант и т.д."""
+class AsyncOpenRouterClient(_OpenRouterRequests, AsyncModelClient):
+    """Асинхронный клиент OpenRouter API на openai.AsyncOpenAI."""
+    
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        self.client = openai.AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=self._api_key(),
+            http_client=http_client,
+            max_retries=OPENROUTER_MAX_RETRIES
+        )
+        self.output_tokens = OutputTokenEstimator(OUTPUT_TOKENS_PER_QUESTION, max_tokens_cap=self.max_output_tokens)
+    
+    async def close(self) -> None:
+        await self.client.close()
+    
+    async def _request_questions(self, pdf_content: Dict[str, Any], num_questions: int,
+                                 exclude: Optional[List[Dict]] = None) -> List[Dict]:
+        """Один вызов модели; возвращает все вопросы, которые удалось разобрать."""
+        # Рендеринг изображений и упаковка текста - работа CPU, выполняется в потоке
+        request_params = await asyncio.to_thread(self._build_request, pdf_content, num_questions, exclude)
+        
+        try:
+            with stage("model"), self._track_request(exclude):
+                response = await self.client.chat.completions.create(**request_params)
+            return self._parse_response(response, num_questions)
+            
+        except ResponseParseError:
+            raise
+        except Exception as e:
+            raise self._api_error(e)
+    
+    async def generate_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> List[Dict]:
+        """Генерирует вопросы через OpenRouter API, не блокируя цикл событий."""
+        questions = await self._request_questions(pdf_content, num_questions)
+        return await _top_up_async(questions, num_questions,
+                                   lambda missing, exclude: self._request_questions(pdf_content, missing, exclude))
+
+
+class _OllamaRequests(_InstrumentedRequests):
+    """Общая часть синхронного и асинхронного клиентов Ollama:
+    формирование запроса, разбор ответа и ошибки."""
+    
+    # Для локальной модели можем использовать больше текста
+    prompt_token_budget = int(os.getenv("OLLAMA_PROMPT_TOKENS", 3000))
+    max_output_tokens = int(os.getenv("OLLAMA_MAX_OUTPUT_TOKENS", 4096))
+    max_text_chars = chars_for_tokens(prompt_token_budget)
+    
+    def _init_settings(self, model_name: str, base_url: str) -> None:
+        self.model_name = model_name
+        self.base_url = base_url
+        self.metrics_label = f"ollama-{model_name}"
+        self.output_tokens = OutputTokenEstimator(OUTPUT_TOKENS_PER_QUESTION, max_tokens_cap=self.max_output_tokens)
         
+        # Кэшированное состояние сервера, чтобы не делать /api/tags перед каждой генерацией
+        self._available = None
+        self._checked_at = 0.0
+    
+    def _health_stale(self) -> bool:
+        return self._available is None or time.monotonic() - self._checked_at > OLLAMA_HEALTH_INTERVAL
+    
+    def _set_available(self, available: bool) -> bool:
+        self._available = available
+        self._checked_at = time.monotonic()
+        return available
+    
+    def status(self) -> Dict[str, Any]:
+        return {"available": self._available}
+    
+    def _unavailable_error(self) -> Exception:
+        return Exception(
+            f"Ollama сервер недоступен по адресу {self.base_url}. "
+            "Убедитесь, что Ollama запущен и модель загружена."
+        )
+    
+    def _build_payload(self, pdf_content: Dict[str, Any], num_questions: int, stream: bool,
+                       exclude: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """Формирует тело запроса к /api/generate.
+        
+        exclude - уже полученные вопросы, которые модель не должна повторять;
+        их можно передать и ключом "exclude" контента (дозапрос в fanout.py).
+        """
+        exclude = exclude or pdf_content.get("exclude")
         # Формируем пользовательский промпт
         user_prompt = f"Создай {num_questions} вопросов для теста на основе следующего контента:\n\n"
         
-        # Добавляем текст из PDF
-        if pdf_content.get("text"):
-            # Для локальной модели можем использовать больше текста
-            user_prompt += f"ТЕКСТ:\n{pdf_content['text'][:8000]}\n\n"
+        # Добавляем текст из PDF, сжатый и вписанный в бюджет токенов
+        text, _ = pack_content(pdf_content.get("text") or "", self.prompt_token_budget)
+        if text:
+            user_prompt += f"ТЕКСТ:\n{text}\n\n"
         
+        user_prompt += _exclusion_prompt(exclude)
         user_prompt += f"\nСоздай {num_questions} вопросов. Только JSON."
         
+        return {
+            "model": self.model_name,
+            "prompt": f"{SYSTEM_PROMPT}\n\n{user_prompt}",
+            "stream": stream,
+            "options": {
+                "temperature": 0.7,
+                "num_predict": self.output_tokens.max_tokens(num_questions)  # Ограничение токенов
+            }
+        }
+    
+    def _parse_result(self, result: Dict[str, Any], num_questions: int) -> List[Dict]:
+        """Извлекает вопросы из ответа /api/generate, включая оборванный ответ."""
+        # Извлекаем текст ответа
+        response_text = result.get("response", "").strip()
+        
+        if not response_text:
+            raise Exception("Ollama вернул пустой ответ")
+        
+        metrics.record_tokens(self.metrics_label, result.get("prompt_eval_count"), result.get("eval_count"))
+        
+        with stage("parse"):
+            questions = self._parse_text(response_text, num_questions)
+            
+            self.output_tokens.observe(result.get("eval_count"), len(questions))
+            return normalize_questions(filter_questions(questions))
+    
+    def _timeout_error(self) -> Exception:
+        return Exception(
+            "Превышено время ожидания ответа от Ollama (лимит: 100 сек, можно увеличить). "
+            "Попробуйте уменьшить количество вопросов или проверьте производительность системы."
+        )
+    
+    def _api_error(self, error: Exception) -> Exception:
+        """Преобразует ошибку API в понятное пользователю сообщение."""
+        error_msg = str(error)
+        if "model" in error_msg.lower() and "not found" in error_msg.lower():
+            return Exception(
+                f"Модель {self.model_name} не найдена в Ollama. "
+                f"Установите её командой: ollama pull {self.model_name}"
+            )
+        return Exception(f"Ошибка при вызове Ollama API: {error_msg}")
+
+
+class OllamaClient(_OllamaRequests, ModelClient):
+    """Клиент для работы с локальной Ollama API."""
+    
+    def __init__(self, model_name: str = "mistral", base_url: str = OLLAMA_BASE_URL,
+                 http_client: Optional[httpx.Client] = None):
+        self._init_settings(model_name, base_url)
+        self.client = http_client or httpx.Client(timeout=100.0)  # Увеличенный таймаут для локальной модели
+        self._health_stop = threading.Event()
+        self._health_thread = None
+    
+    def _check_ollama_available(self) -> bool:
+        """Проверяет доступность Ollama сервера и обновляет кэшированное состояние."""
+        try:
+            response = self.client.get(f"{self.base_url}/api/tags", timeout=5.0)
+            available = response.status_code == 200
+        except Exception:
+            available = False
+        return self._set_available(available)
+    
+    def is_available(self) -> bool:
+        """Возвращает кэшированное состояние сервера, проверяя его заново,
+        только если данные старше OLLAMA_HEALTH_INTERVAL."""
+        if self._health_stale():
+            return self._check_ollama_available()
+        return self._available
+    
+    def start_health_monitor(self, interval: float = OLLAMA_HEALTH_INTERVAL) -> None:
+        """Запускает фоновое обновление состояния сервера."""
+        if self._health_thread is not None:
+            return
+        
+        def monitor():
+            while not self._health_stop.is_set():
+                self._check_ollama_available()
+                self._health_stop.wait(interval)
+        
+        self._health_thread = threading.Thread(target=monitor, name="ollama-health", daemon=True)
+        self._health_thread.start()
+    
+    def close(self) -> None:
+        self._health_stop.set()
+        self.client.close()
+    
+    def _ensure_available(self) -> None:
+        """Бросает исключение, если Ollama сервер недоступен."""
+        if not self.is_available():
+            raise self._unavailable_error()
+    
+    def _request_questions(self, pdf_content: Dict[str, Any], num_questions: int,
+                           exclude: Optional[List[Dict]] = None) -> List[Dict]:
+        """Один вызов модели; возвращает все вопросы, которые удалось разобрать."""
+        payload = self._build_payload(pdf_content, num_questions, stream=False, exclude=exclude)
+        
         try:
             # Вызываем Ollama API
-            response = self.client.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model_name,
-                    "prompt": f"{system_prompt}\n\n{user_prompt}",
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.7,
-                        "num_predict": min(num_questions * 200, 2000)  # Ограничение токенов
-                    }
-                },
-                timeout=100.0
-            )
+            with stage("model"), self._track_request(exclude):
+                response = self.client.post(
+                    f"{self.base_url}/api/generate",
+                    json=payload,
+                    timeout=100.0
+                )
             
             if response.status_code != 200:
-                error_text = response.text
-                raise Exception(f"Ollama API вернул ошибку: {error_text}")
-            
-            result = response.json()
-            
-            # Извлекаем текст ответа
-            response_text = result.get("response", "").strip()
-            
-            if not response_text:
-                raise Exception("Ollama вернул пустой ответ")
+                # HTTPStatusError сохраняет код ответа: по нему роутер отличает сбой сервера
+                raise httpx.HTTPStatusError(f"Ollama API вернул ошибку: {response.text}",
+                                            request=response.request, response=response)
             
-            # Извлекаем JSON из ответа
-            response_text = extract_json_from_response(response_text)
+            return self._parse_result(response.json(), num_questions)
             
-            # Парсим JSON
-            try:
-                result_json = json.loads(response_text)
-            except json.JSONDecodeError:
-                # Пытаемся найти JSON в ответе, если он обернут в текст
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    result_json = json.loads(json_match.group())
-                else:
-                    raise Exception(f"Не удалось найти JSON в ответе Ollama. Ответ: {response_text[:500]}")
+        except ResponseParseError:
+            raise
+        except httpx.TimeoutException:
+            raise self._timeout_error()
+        except httpx.ConnectError as e:
+            self._available = False
+            raise self._api_error(e)
+        except json.JSONDecodeError as e:
+            raise Exception(f"Ошибка парсинга JSON ответа от Ollama: {str(e)}")
+        except Exception as e:
+            raise self._api_error(e)
+    
+    def generate_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> List[Dict]:
+        """Генерирует вопросы для теста на основе содержимого PDF через Ollama API.
+        
+        Если ответ оборвался, недостающие вопросы запрашиваются отдельным вызовом.
+        """
+        # Проверяем доступность Ollama
+        self._ensure_available()
+        
+        questions = self._request_questions(pdf_content, num_questions)
+        return _top_up(questions, num_questions,
+                       lambda missing, exclude: self._request_questions(pdf_content, missing, exclude))
+    
+    def stream_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> Iterator[Dict]:
+        """Генерирует вопросы через Ollama API, отдавая их по мере генерации."""
+        self._ensure_available()
+        
+        payload = self._build_payload(pdf_content, num_questions, stream=True)
+        parser = QuestionStreamParser()
+        question_filter = QuestionFilter()
+        questions = []
+        
+        try:
+            with self._track_request(), \
+                    self.client.stream("POST", f"{self.base_url}/api/generate", json=payload, timeout=100.0) as response:
+                if response.status_code != 200:
+                    raise Exception(f"Ollama API вернул ошибку: {response.read().decode('utf-8', 'replace')}")
+                
+                # Ollama отдает NDJSON: по одному объекту с фрагментом ответа на строку
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise Exception(data["error"])
+                    for question in parser.feed(data.get("response", "")):
+                        question = question_filter.check(question)
+                        if question is None:
+                            continue
+                        question = normalize_questions([question], start_index=len(questions))[0]
+                        questions.append(question)
+                        yield question
+                    if data.get("done"):
+                        metrics.record_tokens(self.metrics_label, data.get("prompt_eval_count"), data.get("eval_count"))
+                        break
+        except httpx.TimeoutException:
+            raise self._timeout_error()
+        except httpx.ConnectError as e:
+            self._available = False
+            raise self._api_error(e)
+        except Exception as e:
+            raise self._api_error(e)
+        
+        self._stream_questions(questions)
+        if not questions:
+            raise Exception("Ollama не вернул вопросы в ответе")
+        
+        # Ответ оборвался: недостающие вопросы догружаются обычным вызовом
+        completed = _top_up(list(questions), num_questions,
+                            lambda missing, exclude: self._request_questions(pdf_content, missing, exclude))
+        yield from completed[len(questions):]
+
+
+class AsyncOllamaClient(_OllamaRequests, AsyncModelClient):
+    """Асинхронный клиент Ollama API на httpx.AsyncClient."""
+    
+    def __init__(self, model_name: str = "mistral", base_url: str = OLLAMA_BASE_URL,
+                 http_client: Optional[httpx.AsyncClient] = None):
+        self._init_settings(model_name, base_url)
+        self.client = http_client or httpx.AsyncClient(timeout=100.0)
+        self._health_lock = None
+    
+    async def _check_ollama_available(self) -> bool:
+        """Проверяет доступность Ollama сервера и обновляет кэшированное состояние."""
+        try:
+            response = await self.client.get(f"{self.base_url}/api/tags", timeout=5.0)
+            available = response.status_code == 200
+        except Exception:
+            available = False
+        return self._set_available(available)
+    
+    async def is_available(self) -> bool:
+        """Кэшированное состояние сервера; при одновременных запросах
+        /api/tags проверяется одним из них."""
+        if not self._health_stale():
+            return self._available
+        if self._health_lock is None:
+            self._health_lock = asyncio.Lock()
+        async with self._health_lock:
+            if self._health_stale():
+                await self._check_ollama_available()
+        return self._available
+    
+    async def close(self) -> None:
+        await self.client.aclose()
+    
+    async def _request_questions(self, pdf_content: Dict[str, Any], num_questions: int,
+                                 exclude: Optional[List[Dict]] = None) -> List[Dict]:
+        """Один вызов модели; возвращает все вопросы, которые удалось разобрать."""
+        payload = await asyncio.to_thread(self._build_payload, pdf_content, num_questions, False, exclude)
+        
+        try:
+            with stage("model"), self._track_request(exclude):
+                response = await self.client.post(
+                    f"{self.base_url}/api/generate",
+                    json=payload,
+                    timeout=100.0
+                )
             
-            # Валидируем и нормализуем формат
-            questions = result_json.get("questions", [])
-            if not questions:
-                raise Exception("Ollama не вернул вопросы в ответе")
+            if response.status_code != 200:
+                # HTTPStatusError сохраняет код ответа: по нему роутер отличает сбой сервера
+                raise httpx.HTTPStatusError(f"Ollama API вернул ошибку: {response.text}",
+                                            request=response.request, response=response)
             
-            return normalize_questions(questions)
+            return self._parse_result(response.json(), num_questions)
             
+        except ResponseParseError:
+            raise
         except httpx.TimeoutException:
-            raise Exception(
-                "Превышено время ожидания ответа от Ollama (лимит: 100 сек, можно увеличить). "
-                "Попробуйте уменьшить количество вопросов или проверьте производительность системы."
-            )
+            raise self._timeout_error()
+        except httpx.ConnectError as e:
+            self._available = False
+            raise self._api_error(e)
         except json.JSONDecodeError as e:
             raise Exception(f"Ошибка парсинга JSON ответа от Ollama: {str(e)}")
         except Exception as e:
-            error_msg = str(e)
-            if "model" in error_msg.lower() and "not found" in error_msg.lower():
-                raise Exception(
-                    f"Модель {self.model_name} не найдена в Ollama. "
-                    f"Установите её командой: ollama pull {self.model_name}"
-                )
-            raise Exception(f"Ошибка при вызове Ollama API: {error_msg}")
+            raise self._api_error(e)
+    
+    async def generate_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> List[Dict]:
+        """Генерирует вопросы через Ollama API, не блокируя цикл событий."""
+        if not await self.is_available():
+            raise self._unavailable_error()
+        
+        questions = await self._request_questions(pdf_content, num_questions)
+        return await _top_up_async(questions, num_questions,
+                                   lambda missing, exclude: self._request_questions(pdf_content, missing, exclude))
 
 
-def create_model_client(model_type: str) -> ModelClient:
+def create_model_client(model_type: str, http_client: Optional[httpx.Client] = None) -> ModelClient:
     """Создает клиент модели на основе типа модели."""
     if model_type == "openrouter":
-        return OpenRouterClient()
+        return OpenRouterClient(http_client=http_client)
+    elif model_type == "ollama-mistral":
+        return OllamaClient(model_name="mistral", http_client=http_client)
+    else:
+        raise ValueError(f"Неизвестный тип модели: {model_type}")
+
+
+def _http_limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+
+
+def _http2_available(http2: bool) -> bool:
+    if not (http2 and HTTP2_ENABLED):
+        return False
+    # HTTP/2 требует пакета h2 (httpx[http2] в requirements.txt)
+    if importlib.util.find_spec("h2") is None:
+        warnings.warn("HTTP2_ENABLED=true, но пакет h2 не установлен: клиенты моделей используют HTTP/1.1. "
+                      "Установите httpx[http2] или задайте HTTP2_ENABLED=false", RuntimeWarning)
+        return False
+    return True
+
+
+def _create_http_client(timeout: float, http2: bool = False) -> httpx.Client:
+    """Создает httpx клиент с пулом keep-alive соединений."""
+    return httpx.Client(timeout=timeout, limits=_http_limits(HTTP_POOL_MAX_CONNECTIONS), http2=_http2_available(http2))
+
+
+_clients: Dict[str, ModelClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_model_client(model_type: str) -> ModelClient:
+    """Возвращает долгоживущий клиент модели из реестра процесса.
+    
+    Клиенты создаются один раз и переиспользуют пулы соединений между
+    запросами; закрываются при завершении процесса.
+    """
+    with _clients_lock:
+        client = _clients.get(model_type)
+        if client is not None:
+            return client
+        
+        if model_type == "openrouter":
+            # OpenRouter работает по HTTPS и поддерживает HTTP/2
+            http_client = _create_http_client(timeout=600.0, http2=True)
+        elif model_type == "ollama-mistral":
+            # Ollama - локальный HTTP/1.1 сервер
+            http_client = _create_http_client(timeout=100.0)
+        else:
+            raise ValueError(f"Неизвестный тип модели: {model_type}")
+        
+        try:
+            client = create_model_client(model_type, http_client=http_client)
+        except Exception:
+            http_client.close()
+            raise
+        
+        if isinstance(client, OllamaClient):
+            client.start_health_monitor()
+        
+        _clients[model_type] = client
+        return client
+
+
+def model_clients_status() -> Dict[str, Any]:
+    """Состояние созданных клиентов для /api/health."""
+    with _clients_lock:
+        return {model_type: client.status() for model_type, client in _clients.items()}
+
+
+def close_model_clients() -> None:
+    """Закрывает все клиенты реестра и их соединения."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+atexit.register(close_model_clients)
+
+
+def create_async_model_client(model_type: str, http_client: Optional[httpx.AsyncClient] = None) -> AsyncModelClient:
+    """Создает асинхронный клиент модели на основе типа модели."""
+    if model_type == "openrouter":
+        return AsyncOpenRouterClient(http_client=http_client)
+    elif model_type == "ollama-mistral":
+        return AsyncOllamaClient(model_name="mistral", http_client=http_client)
+    else:
+        raise ValueError(f"Неизвестный тип модели: {model_type}")
+
+
+_async_clients: Dict[str, AsyncModelClient] = {}
+
+
+async def get_async_model_client(model_type: str) -> AsyncModelClient:
+    """Возвращает долгоживущий асинхронный клиент из реестра процесса.
+    
+    Клиенты привязаны к циклу событий ASGI сервера, поэтому вызывается
+    только из него; закрываются через close_async_model_clients().
+    """
+    client = _async_clients.get(model_type)
+    if client is not None:
+        return client
+    
+    if model_type == "openrouter":
+        http_client = httpx.AsyncClient(
+            timeout=600.0, limits=_http_limits(ASYNC_HTTP_POOL_MAX_CONNECTIONS), http2=_http2_available(True)
+        )
     elif model_type == "ollama-mistral":
-        return OllamaClient(model_name="mistral")
+        http_client = httpx.AsyncClient(timeout=100.0, limits=_http_limits(ASYNC_HTTP_POOL_MAX_CONNECTIONS))
     else:
         raise ValueError(f"Неизвестный тип модели: {model_type}")
+    
+    try:
+        client = create_async_model_client(model_type, http_client=http_client)
+    except Exception:
+        await http_client.aclose()
+        raise
+    
+    _async_clients[model_type] = client
+    return client
+
 
+def async_model_clients_status() -> Dict[str, Any]:
+    """Состояние созданных асинхронных клиентов для /api/health."""
+    return {model_type: client.status() for model_type, client in _async_clients.items()}
+
+
+async def close_async_model_clients() -> None:
+    """Закрывает все асинхронные клиенты реестра и их соединения."""
+    clients = list(_async_clients.values())
+    _async_clients.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception:
+            pass
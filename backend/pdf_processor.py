@@ -1,76 +1,523 @@
-import pdfplumber
-from pdf2image import convert_from_path
-import base64
+import atexit
 import io
-from typing import Dict, List, Any
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterable, Optional, Tuple, Union
+from timings import stage
+from image_encoder import compact_image, encode_image_base64, normalize_format, resolve_format
+from lazy_imports import lazy_import
 
+# pdfplumber (вместе с pdfminer) и pdf2image загружаются при первой обработке PDF
+pdfplumber = lazy_import("pdfplumber")
+pdf2image = lazy_import("pdf2image")
 
-def extract_text_from_pdf(pdf_path: str, include_page_markers: bool = True) -> str:
-    """Извлекает весь текст из PDF документа.
+# Путь к PDF файлу или содержимое PDF в памяти
+PDFSource = Union[str, bytes]
+
+# Число процессов для извлечения текста и потоков pdftoppm для рендеринга
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+# Документы короче этого порога обрабатываются последовательно:
+# запуск пула обошелся бы дороже, чем выигрыш от параллельности
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 64))
+
+# Минимальная визуальная оценка страницы, при которой ее изображение
+# стоит отправлять в vision-модель
+VISION_MIN_SCORE = float(os.getenv("VISION_MIN_SCORE", 0.15))
+# Сколько страниц (равномерно по документу) анализируется при выборе изображений,
+# если визуальные признаки не были собраны при извлечении текста
+VISION_SCAN_PAGES = int(os.getenv("VISION_SCAN_PAGES", 12))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _open_pdf(pdf_source: PDFSource):
+    """Открывает PDF через pdfplumber из файла или из памяти."""
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return pdfplumber.open(io.BytesIO(pdf_source))
+    return pdfplumber.open(pdf_source)
+
+
+def _convert_pages(pdf_source: PDFSource, **kwargs):
+    """Растеризует страницы PDF через pdf2image из файла или из памяти."""
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return pdf2image.convert_from_bytes(pdf_source, **kwargs)
+    return pdf2image.convert_from_path(pdf_source, **kwargs)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Возвращает общий пул процессов извлечения (создается при первом использовании)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn безопасен для процесса с фоновыми потоками (воркеры задач, health-check)
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown, wait=False)
+        return _pool
+
+
+def _reset_pool(broken: ProcessPoolExecutor) -> None:
+    """Отбрасывает сломанный пул (процесс воркера убит), следующий вызов создаст новый."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_in_pool(func, calls: List[tuple]) -> list:
+    """Выполняет func(*args) для каждого набора аргументов в пуле процессов.
+
+    Если пул сломан (BrokenProcessPool), он пересоздается и вызовы повторяются
+    один раз; при повторной поломке вызовы выполняются в текущем процессе.
+    """
+    for _ in range(2):
+        pool = _get_pool()
+        try:
+            futures = [pool.submit(func, *args) for args in calls]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            _reset_pool(pool)
+    return [func(*args) for args in calls]
+
+
+@contextmanager
+def _pool_source(pdf_source: PDFSource):
+    """Путь к PDF для процессов пула.
+
+    Содержимое в памяти записывается во временный файл: иначе байты документа
+    сериализовались бы в каждую задачу пула.
+    """
+    if not isinstance(pdf_source, (bytes, bytearray)):
+        yield pdf_source
+        return
+    fd, path = tempfile.mkstemp(prefix="quiz_pool_", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_source)
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _read_page(page, features: Optional[Dict[int, Dict[str, Any]]] = None) -> Optional[str]:
+    """Извлекает текст страницы и освобождает ее разобранные объекты.
+    
+    Если передан features, туда же записываются визуальные признаки страницы:
+    объекты уже разобраны для текста, поэтому признаки почти бесплатны.
+    """
+    page_text = page.extract_text()
+    if features is not None:
+        features[page.page_number] = _page_visual_features(page)
+    page.flush_cache()
+    return page_text
+
+
+def _page_texts(pdf, first_page: int = 1, last_page: Optional[int] = None,
+                features: Optional[Dict[int, Dict[str, Any]]] = None) -> List[Tuple[int, Optional[str]]]:
+    """Извлекает текст страниц first_page..last_page открытого документа."""
+    pages = pdf.pages[first_page - 1:last_page]
+    return [(page_num, _read_page(page, features)) for page_num, page in enumerate(pages, start=first_page)]
+
+
+def _extract_page_range(pdf_source: PDFSource, first_page: int,
+                        last_page: int) -> Tuple[List[Tuple[int, Optional[str]]], Dict[int, Dict[str, Any]]]:
+    """Извлекает текст и визуальные признаки диапазона страниц; выполняется в процессе пула."""
+    features = {}
+    with _open_pdf(pdf_source) as pdf:
+        return _page_texts(pdf, first_page, last_page, features), features
+
+
+def _page_ranges(total_pages: int, parts: int) -> List[Tuple[int, int]]:
+    """Делит страницы 1..total_pages на parts непрерывных диапазонов."""
+    parts = max(1, min(parts, total_pages))
+    bounds = [total_pages * idx // parts for idx in range(parts + 1)]
+    return [(bounds[idx] + 1, bounds[idx + 1]) for idx in range(parts)]
+
+
+def _extract_parallel(pdf_source: PDFSource, total_pages: int,
+                      features: Optional[Dict[int, Dict[str, Any]]] = None) -> List[Tuple[int, Optional[str]]]:
+    """Извлекает текст диапазонами страниц в пуле процессов, сохраняя порядок."""
+    # Несколько диапазонов на процесс выравнивают нагрузку при неравномерных страницах
+    ranges = _page_ranges(total_pages, PDF_WORKERS * 4)
+    with _pool_source(pdf_source) as path:
+        results = _run_in_pool(_extract_page_range, [(path, first, last) for first, last in ranges])
+    if features is not None:
+        for _, range_features in results:
+            features.update(range_features)
+    return [page for pages, _ in results for page in pages]
+
+
+def _join_page_texts(page_texts: List[Tuple[int, Optional[str]]], include_page_markers: bool) -> str:
+    """Объединяет текст страниц в порядке номеров."""
+    text_content = []
+    
+    for page_num, page_text in page_texts:
+        if page_text:
+            if include_page_markers:
+                # Добавляем явный маркер страницы для лучшей структуризации
+                marked_text = f"\n\n{'='*60}\nСТРАНИЦА {page_num}\n{'='*60}\n\n{page_text}"
+                text_content.append(marked_text)
+            else:
+                text_content.append(page_text)
+    
+    # Используем один перенос строки между страницами, так как маркер уже добавляет разделение
+    separator = "\n\n" if not include_page_markers else "\n"
+    return separator.join(text_content)
+
+
+def _spread_order(total_pages: int) -> List[int]:
+    """Порядок обхода страниц, равномерно покрывающий документ на любом префиксе.
+    
+    Использует бит-реверсивную перестановку: 1, середина, четверти, восьмые и т.д.
+    """
+    bits = max(1, (total_pages - 1).bit_length())
+    order = []
+    for idx in range(1 << bits):
+        reversed_idx = int(format(idx, f"0{bits}b")[::-1], 2)
+        if reversed_idx < total_pages:
+            order.append(reversed_idx + 1)
+    return order
+
+
+def _page_texts_within_budget(pdf, max_chars: int, sampled: bool, include_page_markers: bool,
+                              features: Optional[Dict[int, Dict[str, Any]]] = None) -> List[Tuple[int, Optional[str]]]:
+    """Извлекает страницы, пока набранный текст не достигнет max_chars.
+    
+    В режиме sampled страницы берутся равномерно по всему документу,
+    а результат возвращается в порядке номеров страниц.
+    """
+    total_pages = len(pdf.pages)
+    order = _spread_order(total_pages) if sampled else range(1, total_pages + 1)
+    # Длина маркера страницы и разделителя, которые добавит _join_page_texts
+    overhead = len(f"\n\n{'='*60}\nСТРАНИЦА {total_pages}\n{'='*60}\n\n\n") if include_page_markers else 2
+    
+    page_texts = []
+    collected = 0
+    for page_num in order:
+        page_text = _read_page(pdf.pages[page_num - 1], features)
+        if page_text:
+            page_texts.append((page_num, page_text))
+            collected += len(page_text) + overhead
+            if collected >= max_chars:
+                break
+    
+    return sorted(page_texts)
+
+
+def _extract_text(pdf, pdf_source: PDFSource, include_page_markers: bool,
+                  max_chars: Optional[int] = None, sampled: bool = False, parallel: bool = True,
+                  features: Optional[Dict[int, Dict[str, Any]]] = None) -> str:
+    """Извлекает текст из уже открытого документа.
+    
+    Если задан max_chars, обработка страниц прекращается, как только текста
+    достаточно. Иначе большие документы (от PDF_PARALLEL_MIN_PAGES страниц)
+    обрабатываются диапазонами страниц в пуле процессов; результат идентичен
+    последовательному. В features собираются визуальные признаки
+    разобранных страниц.
+    """
+    total_pages = len(pdf.pages)
+    if max_chars is not None:
+        page_texts = _page_texts_within_budget(pdf, max_chars, sampled, include_page_markers, features)
+    elif parallel and PDF_WORKERS > 1 and total_pages >= PDF_PARALLEL_MIN_PAGES:
+        page_texts = _extract_parallel(pdf_source, total_pages, features)
+    else:
+        page_texts = _page_texts(pdf, features=features)
+    return _join_page_texts(page_texts, include_page_markers)
+
+
+def extract_text_from_pdf(pdf_source: PDFSource, include_page_markers: bool = True,
+                          max_chars: Optional[int] = None, sampled: bool = False) -> str:
+    """Извлекает текст из PDF документа.
     
     Args:
-        pdf_path: Путь к PDF файлу
+        pdf_source: Путь к PDF файлу или его содержимое (bytes)
         include_page_markers: Если True, добавляет явные маркеры страниц в текст
+        max_chars: Бюджет символов; страницы перестают разбираться, когда текста
+            достаточно (None - извлечь весь документ)
+        sampled: Брать страницы равномерно по документу, а не с начала
     
     Returns:
-        Объединенный текст всех страниц с маркерами страниц (если включено)
+        Объединенный текст страниц с маркерами страниц (если включено)
     """
-    text_content = []
-    
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, start=1):
-                page_text = page.extract_text()
-                if page_text:
-                    if include_page_markers:
-                        # Добавляем явный маркер страницы для лучшей структуризации
-                        marked_text = f"\n\n{'='*60}\nСТРАНИЦА {page_num}\n{'='*60}\n\n{page_text}"
-                        text_content.append(marked_text)
-                    else:
-                        text_content.append(page_text)
+        with stage("extract"), _open_pdf(pdf_source) as pdf:
+            return _extract_text(pdf, pdf_source, include_page_markers, max_chars, sampled)
     except Exception as e:
         raise Exception(f"Ошибка при извлечении текста из PDF: {str(e)}")
-    
-    # Используем один перенос строки между страницами, так как маркер уже добавляет разделение
-    separator = "\n\n" if not include_page_markers else "\n"
-    return separator.join(text_content)
 
 
-def extract_images_from_pdf(pdf_path: str) -> List[Dict[str, str]]:
-    """Извлекает изображения из PDF и конвертирует их в base64."""
+def _group_consecutive(pages: List[int]) -> List[List[int]]:
+    """Группирует отсортированные номера страниц в непрерывные диапазоны."""
+    groups = []
+    for page in pages:
+        if groups and page == groups[-1][-1] + 1:
+            groups[-1].append(page)
+        else:
+            groups.append([page])
+    return groups
+
+
+def render_pdf_pages(pdf_source: PDFSource, pages: Iterable[int], dpi: int = 200, fmt: str = "png",
+                     quality: Optional[int] = None, max_side: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Растеризует только указанные страницы PDF и конвертирует их в base64.
+    
+    Перед кодированием изображения проходят compact_image: обрезку пустых
+    полей, перевод бесцветных страниц в оттенки серого и уменьшение до max_side.
+    
+    Args:
+        pdf_source: Путь к PDF файлу или его содержимое (bytes)
+        pages: Номера страниц (начиная с 1)
+        dpi: Разрешение растеризации
+        fmt: Формат изображения (png, jpeg, webp или auto - по содержимому страницы)
+        quality: Качество сжатия JPEG/WebP (1-100)
+        max_side: Максимальный размер большей стороны в пикселях
+    
+    Returns:
+        Список словарей с номером страницы, base64, форматом и размерами в порядке страниц
+    """
     images_data = []
+    fmt = normalize_format(fmt)
     
     try:
-        # Конвертируем PDF страницы в изображения
-        images = convert_from_path(pdf_path, dpi=200)
-        
-        for idx, image in enumerate(images):
-            # Конвертируем PIL Image в base64
-            buffered = io.BytesIO()
-            image.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+        # Каждая непрерывная группа страниц рендерится одним вызовом poppler
+        with stage("render"):
+            for group in _group_consecutive(sorted(set(pages))):
+                images = _convert_pages(
+                    pdf_source, dpi=dpi, first_page=group[0], last_page=group[-1],
+                    thread_count=max(1, min(PDF_WORKERS, len(group)))
+                )
             
-            images_data.append({
-                "page": idx + 1,
-                "base64": img_base64,
-                "format": "png"
-            })
+                for page_num, image in zip(group, images):
+                    compact = compact_image(image, max_side)
+                    page_fmt = resolve_format(compact, fmt)
+                    images_data.append({
+                        "page": page_num,
+                        "base64": encode_image_base64(compact, page_fmt, quality),
+                        "format": page_fmt,
+                        "width": compact.width,
+                        "height": compact.height
+                    })
+                    image.close()
     except Exception as e:
         raise Exception(f"Ошибка при извлечении изображений из PDF: {str(e)}")
     
     return images_data
 
 
-def process_pdf(pdf_path: str, include_page_markers: bool = True) -> Dict[str, Any]:
+def extract_images_from_pdf(pdf_source: PDFSource) -> "LazyPageImages":
+    """Возвращает изображения всех страниц PDF.
+    
+    Страницы не растеризуются заранее: каждая кодируется при первом обращении.
+    """
+    return LazyPageImages(pdf_source, get_page_count(pdf_source))
+
+
+def get_page_count(pdf_source: PDFSource) -> int:
+    """Возвращает количество страниц в PDF без растеризации."""
+    try:
+        with _open_pdf(pdf_source) as pdf:
+            return len(pdf.pages)
+    except Exception as e:
+        raise Exception(f"Ошибка при чтении PDF: {str(e)}")
+
 
-    text = extract_text_from_pdf(pdf_path, include_page_markers=include_page_markers)
-    images = extract_images_from_pdf(pdf_path)
+def _page_visual_features(page) -> Dict[str, Any]:
+    """Собирает признаки визуального содержимого страницы из объектов pdfplumber."""
+    width, height = float(page.width), float(page.height)
+    images = []
+    for image in page.images:
+        # Изображения могут выходить за границы страницы
+        bbox = (
+            round(max(0.0, float(image["x0"]))), round(max(0.0, float(image["top"]))),
+            round(min(width, float(image["x1"]))), round(min(height, float(image["bottom"])))
+        )
+        if bbox[2] > bbox[0] and bbox[3] > bbox[1]:
+            images.append(bbox)
     
     return {
-        "text": text,
+        "area": width * height or 1.0,
         "images": images,
-        "total_pages": len(images)
+        "curves": len(page.curves),
+        # Мелкие прямоугольники - подчеркивания и маркеры списков, не графика
+        "rects": sum(1 for rect in page.rects if rect["width"] > 5 and rect["height"] > 5),
+        "chars": len(page.chars)
     }
 
 
+def _visual_score(features: Dict[str, Any], repeated: set) -> float:
+    """Оценка визуального содержимого страницы: доля площади под изображениями
+    плюс векторная графика (диаграммы, схемы), со скидкой для страниц, плотно
+    заполненных текстом."""
+    has_text = features["chars"] > 200
+    image_area = sum(
+        (x1 - x0) * (bottom - top)
+        for x0, top, x1, bottom in features["images"]
+        # Повторяющиеся на многих страницах изображения (фон, логотип) не учитываются,
+        # кроме страниц без текста (сканов)
+        if not (has_text and (x0, top, x1, bottom) in repeated)
+    ) / features["area"]
+    graphics = 0.6 * min(1.0, features["curves"] / 40) + 0.2 * min(1.0, features["rects"] / 30)
+    score = min(1.0, image_area) + graphics
+    return round(score * (1 - 0.5 * min(1.0, features["chars"] / 3000)), 4)
+
+
+def _score_features(features: Dict[int, Dict[str, Any]]) -> Dict[int, float]:
+    """Визуальные оценки страниц по собранным признакам."""
+    counts = Counter(bbox for page_features in features.values() for bbox in set(page_features["images"]))
+    repeated = {bbox for bbox, count in counts.items() if len(features) >= 3 and count > len(features) / 2}
+    return {page_num: _visual_score(page_features, repeated) for page_num, page_features in features.items()}
+
+
+def score_pages(pdf_source: PDFSource, max_pages: int = VISION_SCAN_PAGES,
+                skip: Iterable[int] = ()) -> Dict[int, float]:
+    """Оценивает визуальную значимость страниц без растеризации.
+    
+    Нужна для страниц, которые не разбирались при извлечении текста
+    (process_pdf остановился по бюджету символов): документ открывается
+    заново, поэтому анализируются лишь max_pages страниц, равномерно
+    распределенных по документу, кроме уже оцененных страниц skip.
+    
+    Returns:
+        Словарь {номер страницы: оценка}; 0 - страница без графики
+    """
+    skip = set(skip)
+    features = {}
+    with stage("score"), _open_pdf(pdf_source) as pdf:
+        pages = [page_num for page_num in _spread_order(len(pdf.pages)) if page_num not in skip]
+        for page_num in sorted(pages[:max_pages]):
+            page = pdf.pages[page_num - 1]
+            features[page_num] = _page_visual_features(page)
+            page.flush_cache()
+    return _score_features(features)
+
+
+class LazyPageImages:
+    """Ленивый доступ к изображениям страниц PDF.
+    
+    Страницы растеризуются только при вызове render(), поэтому клиенты,
+    которые не работают с изображениями, не платят за рендеринг.
+    Каждый клиент сам выбирает страницы, разрешение и формат.
+    """
+    
+    def __init__(self, pdf_source: PDFSource, total_pages: int, scores: Optional[Dict[int, float]] = None):
+        self.pdf_source = pdf_source
+        self.total_pages = total_pages
+        # Оценки страниц, разобранных при извлечении текста
+        self._extracted_scores = dict(scores or {})
+        self._scores = None
+        # Готовые кодировки: (страница, dpi, формат, качество, размер) -> изображение
+        self._encoded = {}
+    
+    def __len__(self) -> int:
+        return self.total_pages
+    
+    def __iter__(self):
+        for page_num in range(1, self.total_pages + 1):
+            yield self.page(page_num)
+    
+    def render(self, pages: Iterable[int], dpi: int = 200, fmt: str = "png",
+               quality: Optional[int] = None, max_side: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Растеризует выбранные страницы (номера вне документа игнорируются).
+        
+        Каждая страница кодируется с данными параметрами не больше одного раза.
+        """
+        pages = sorted({page for page in pages if 1 <= page <= self.total_pages})
+        options = (dpi, normalize_format(fmt), quality, max_side)
+        missing = [page for page in pages if (page,) + options not in self._encoded]
+        if missing:
+            for image in render_pdf_pages(self.pdf_source, missing, dpi=dpi, fmt=fmt, quality=quality, max_side=max_side):
+                self._encoded[(image["page"],) + options] = image
+        return [self._encoded[(page,) + options] for page in pages]
+    
+    def visual_pages(self, count: int, min_score: float = VISION_MIN_SCORE) -> List[int]:
+        """Номера не более count страниц с наибольшей визуальной оценкой.
+        
+        Страницы с оценкой ниже min_score не возвращаются, поэтому для
+        документа без графики список пуст. Оценки из process_pdf покрывают
+        только разобранные страницы; если извлечение остановилось раньше
+        конца документа, остальные страницы один раз оцениваются через
+        score_pages (равномерно по документу) и добавляются к ним.
+        """
+        if self._scores is None:
+            scores = dict(self._extracted_scores)
+            if len(scores) < self.total_pages:
+                try:
+                    scores.update(score_pages(self.pdf_source, skip=scores))
+                except Exception:
+                    # Без оценок остальных страниц выбор идет из уже оцененных
+                    pass
+            self._scores = scores
+        
+        ranked = sorted(
+            (page for page, score in self._scores.items() if score >= min_score),
+            key=lambda page: (-self._scores[page], page)
+        )
+        return sorted(ranked[:count])
+    
+    def page(self, page_num: int, **kwargs) -> Dict[str, Any]:
+        """Изображение одной страницы; параметры те же, что у render()."""
+        images = self.render([page_num], **kwargs)
+        if not images:
+            raise IndexError(f"Страница {page_num} вне документа")
+        return images[0]
+    
+    def first(self, count: int, **kwargs) -> List[Dict[str, Any]]:
+        """Растеризует первые count страниц."""
+        return self.render(range(1, count + 1), **kwargs)
+
+
+def _extract_document(pdf_source: PDFSource, include_page_markers: bool,
+                      max_chars: Optional[int], sampled: bool) -> Tuple[str, int, Dict[int, float]]:
+    """Извлекает текст, число страниц и визуальные оценки страниц документа;
+    выполняется в процессе пула."""
+    features = {}
+    with _open_pdf(pdf_source) as pdf:
+        text = _extract_text(pdf, pdf_source, include_page_markers, max_chars, sampled, parallel=False, features=features)
+        return text, len(pdf.pages), _score_features(features)
 
+
+def process_pdf(pdf_source: PDFSource, include_page_markers: bool = True,
+                max_chars: Optional[int] = None, sampled: bool = False, in_pool: bool = False) -> Dict[str, Any]:
+    """Извлекает текст PDF и готовит ленивый доступ к изображениям страниц.
+    
+    Изображения не растеризуются здесь: поле "images" содержит LazyPageImages,
+    из которого клиент модели запрашивает только нужные ему страницы.
+    Визуальные оценки разобранных страниц ("visual_scores") считаются
+    в том же проходе, что и текст.
+    max_chars и sampled работают так же, как в extract_text_from_pdf.
+    in_pool - извлекать весь документ в пуле процессов: так несколько
+    документов (например, пакет /api/batch) разбираются на разных ядрах.
+    """
+    try:
+        with stage("extract"):
+            if in_pool and PDF_WORKERS > 1:
+                with _pool_source(pdf_source) as path:
+                    text, total_pages, scores = _run_in_pool(
+                        _extract_document, [(path, include_page_markers, max_chars, sampled)]
+                    )[0]
+            else:
+                # Документ открывается один раз и для текста, и для подсчета страниц
+                features = {}
+                with _open_pdf(pdf_source) as pdf:
+                    text = _extract_text(pdf, pdf_source, include_page_markers, max_chars, sampled, features=features)
+                    total_pages = len(pdf.pages)
+                scores = _score_features(features)
+    except Exception as e:
+        raise Exception(f"Ошибка при извлечении текста из PDF: {str(e)}")
+    
+    return {
+        "text": text,
+        "images": LazyPageImages(pdf_source, total_pages, scores),
+        "total_pages": total_pages,
+        "visual_scores": scores
+    }
@@ -0,0 +1,243 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Баннер страницы, который добавляет extract_text_from_pdf
+PAGE_BANNER_RE = re.compile(r"\n*={60}\nСТРАНИЦА (\d+)\n={60}\n\n?")
+CYRILLIC_RE = re.compile(r"[а-яА-ЯёЁ]")
+TRAILING_PAGE_LABEL_RE = re.compile(r"\s*\[стр\. \d+\]\s*$")
+
+# Сколько первых/последних строк страницы проверяется на колонтитулы
+EDGE_LINES = 2
+# Строка считается колонтитулом, если встречается на такой доле страниц
+REPEATED_LINE_RATIO = 0.5
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """Возвращает токенизатор tiktoken, если пакет установлен и словарь доступен."""
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(os.getenv("TOKENIZER_ENCODING", "o200k_base"))
+            except Exception:
+                # Без tiktoken (или без доступа к словарю) используем оценку по символам
+                _encoding = None
+        return _encoding
+
+
+# Символов извлеченного текста на токен промпта: по нему объем извлечения
+# и размер фрагментов выводятся из того же бюджета токенов, что и упаковка.
+# Кириллица занимает около 2.8 символа на токен, латиница - около 4.
+CHARS_PER_PROMPT_TOKEN = float(os.getenv("CHARS_PER_PROMPT_TOKEN", 3))
+
+
+def chars_for_tokens(tokens: int) -> int:
+    """Сколько символов текста извлекать под бюджет в tokens токенов промпта."""
+    return int(tokens * CHARS_PER_PROMPT_TOKEN)
+
+
+def count_tokens(text: str) -> int:
+    """Считает токены текста.
+
+    С tiktoken считает точно, иначе оценивает: кириллица занимает
+    около 2.8 символа на токен, латиница и прочее - около 4.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cyrillic = len(CYRILLIC_RE.findall(text))
+    return math.ceil(cyrillic / 2.8 + (len(text) - cyrillic) / 4)
+
+
+def _split_pages(text: str) -> List[Tuple[Optional[int], str]]:
+    """Делит текст по баннерам страниц на пары (номер страницы, текст)."""
+    parts = PAGE_BANNER_RE.split(text)
+    pages = []
+    if parts[0].strip():
+        pages.append((None, parts[0]))
+    for idx in range(1, len(parts), 2):
+        pages.append((int(parts[idx]), parts[idx + 1]))
+    return pages
+
+
+def _normalize_line(line: str) -> str:
+    line = re.sub(r"\s+", " ", line.strip().lower())
+    # В коротких строках ("Стр. 5 из 10", "- 5 -") цифры - номер страницы,
+    # поэтому не учитываются; в остальных строках цифры значимы
+    if len(re.sub(r"[\d\W]", "", line)) <= 12:
+        return re.sub(r"\d+", "#", line)
+    return line
+
+
+def _edge_lines(lines: List[str]) -> List[str]:
+    content = [line for line in lines if line.strip()]
+    return content[:EDGE_LINES] + content[-EDGE_LINES:]
+
+
+def _repeated_lines(pages: List[Tuple[Optional[int], str]]) -> set:
+    """Находит колонтитулы: строки в начале/конце страниц, повторяющиеся на многих страницах."""
+    if len(pages) < 3:
+        return set()
+
+    counter = Counter()
+    for _, body in pages:
+        counter.update({_normalize_line(line) for line in _edge_lines(body.split("\n"))})
+
+    threshold = max(3, math.ceil(len(pages) * REPEATED_LINE_RATIO))
+    return {line for line, count in counter.items() if line and count >= threshold}
+
+
+def _strip_edges(lines: List[str], repeated: set) -> List[str]:
+    """Удаляет колонтитулы среди первых и последних строк страницы."""
+    content_idx = [idx for idx, line in enumerate(lines) if line.strip()]
+    edges = set(content_idx[:EDGE_LINES] + content_idx[-EDGE_LINES:])
+    removed = {idx for idx in edges if _normalize_line(lines[idx]) in repeated}
+    # Страницу, состоящую только из повторяющихся строк, не трогаем
+    if len(removed) == len(content_idx):
+        return lines
+    return [line for idx, line in enumerate(lines) if idx not in removed]
+
+
+def compress_text(text: str) -> str:
+    """Убирает из текста шум, не несущий содержания.
+
+    Баннеры страниц заменяются компактными метками [стр. N], удаляются
+    повторяющиеся колонтитулы и лишние пробелы/пустые строки.
+    """
+    pages = _split_pages(text)
+    repeated = _repeated_lines(pages)
+
+    packed_pages = []
+    for page_num, body in pages:
+        lines = _strip_edges(body.split("\n"), repeated) if repeated else body.split("\n")
+        body = "\n".join(re.sub(r"[ \t]+", " ", line).strip() for line in lines)
+        body = re.sub(r"\n{3,}", "\n\n", body).strip()
+        if not body:
+            continue
+        packed_pages.append(f"[стр. {page_num}]\n{body}" if page_num is not None else body)
+
+    return "\n\n".join(packed_pages)
+
+
+def fit_to_budget(text: str, max_tokens: int) -> str:
+    """Обрезает текст до max_tokens токенов, по возможности на границе строки или слова."""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    # Бинарный поиск наибольшего префикса, который помещается в бюджет
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+
+    cut = text[:low]
+    for boundary in ("\n", " "):
+        position = cut.rfind(boundary)
+        if position > len(cut) * 0.8:
+            return cut[:position]
+    return cut
+
+
+class PromptStats:
+    """Счетчики токенов, сэкономленных упаковкой промптов (для /api/health)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.input_tokens = 0
+        self.prompt_tokens = 0
+        self.noise_tokens_removed = 0
+        self.tokens_truncated = 0
+
+    def record(self, stats: Dict[str, int]) -> None:
+        with self._lock:
+            self.prompts += 1
+            self.input_tokens += stats["input_tokens"]
+            self.prompt_tokens += stats["prompt_tokens"]
+            self.noise_tokens_removed += stats["noise_tokens_removed"]
+            self.tokens_truncated += stats["tokens_truncated"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "prompts": self.prompts,
+                "input_tokens": self.input_tokens,
+                "prompt_tokens": self.prompt_tokens,
+                "noise_tokens_removed": self.noise_tokens_removed,
+                "tokens_truncated": self.tokens_truncated
+            }
+
+
+prompt_stats = PromptStats()
+
+
+def pack_content(text: str, token_budget: int) -> Tuple[str, Dict[str, int]]:
+    """Готовит текст документа для промпта: сжимает и вписывает в бюджет токенов.
+
+    Returns:
+        (текст для промпта, статистика токенов)
+    """
+    compressed = compress_text(text)
+    # Токен занимает не больше нескольких символов: длиннее окна текст заведомо не поместится
+    window = compressed[:token_budget * 8]
+    packed = fit_to_budget(window, token_budget)
+    if len(packed) < len(compressed):
+        # Метка страницы без текста после обрезки бесполезна
+        packed = TRAILING_PAGE_LABEL_RE.sub("", packed)
+
+    input_tokens = count_tokens(text)
+    compressed_tokens = count_tokens(compressed)
+    prompt_tokens = count_tokens(packed)
+    stats = {
+        "input_tokens": input_tokens,
+        "prompt_tokens": prompt_tokens,
+        "noise_tokens_removed": max(0, input_tokens - compressed_tokens),
+        "tokens_truncated": max(0, compressed_tokens - prompt_tokens)
+    }
+    prompt_stats.record(stats)
+    return packed, stats
+
+
+class OutputTokenEstimator:
+    """Оценивает max_tokens по измеренному размеру одного вопроса в ответе модели.
+
+    Начинает с per_question токенов на вопрос и уточняет оценку экспоненциальным
+    скользящим средним по фактическому числу токенов в ответах.
+    """
+
+    def __init__(self, per_question: float = 120, overhead: int = 40, safety: float = 1.3,
+                 max_tokens_cap: int = 4096, smoothing: float = 0.2):
+        self.per_question = per_question
+        self.overhead = overhead
+        self.safety = safety
+        self.max_tokens_cap = max_tokens_cap
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def max_tokens(self, num_questions: int) -> int:
+        """Лимит токенов ответа для num_questions вопросов с запасом safety."""
+        estimate = (self.overhead + self.per_question * num_questions) * self.safety
+        return min(math.ceil(estimate), self.max_tokens_cap)
+
+    def observe(self, completion_tokens: Optional[int], num_questions: int) -> None:
+        """Учитывает фактический размер ответа."""
+        if not completion_tokens or num_questions <= 0:
+            return
+        measured = max(1.0, (completion_tokens - self.overhead) / num_questions)
+        with self._lock:
+            self.per_question += self.smoothing * (measured - self.per_question)
@@ -0,0 +1,205 @@
+"""Локальная проверка качества сгенерированных вопросов.
+
+Без сетевых моделей: похожесть текстов считается как коэффициент Жаккара
+по множествам символьных n-грамм и по множествам слов; тексты с разными
+числами или знаками операций ("x = 1" и "x = -1") повтором не считаются.
+Фильтр отбрасывает почти повторяющиеся вопросы, убирает повторяющиеся
+варианты ответа и проверяет индекс правильного ответа; недостающие вопросы
+клиенты моделей дозапрашивают отдельным небольшим вызовом (_top_up
+в model_client.py).
+"""
+import os
+import re
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+import metrics
+
+QUALITY_FILTER = os.getenv("QUALITY_FILTER", "true").lower() == "true"
+# Порог похожести (0..1), начиная с которого вопросы или варианты считаются повтором
+QUALITY_QUESTION_SIMILARITY = float(os.getenv("QUALITY_QUESTION_SIMILARITY", 0.9))
+QUALITY_OPTION_SIMILARITY = float(os.getenv("QUALITY_OPTION_SIMILARITY", 0.9))
+# Минимум различных вариантов ответа у вопроса с выбором
+QUALITY_MIN_OPTIONS = int(os.getenv("QUALITY_MIN_OPTIONS", 3))
+QUALITY_NGRAM = int(os.getenv("QUALITY_NGRAM", 3))
+
+# Пунктуация, кроме знаков операций и десятичного разделителя внутри числа
+NON_WORD_RE = re.compile(r"(?:[^\w+\-*/=<>≤≥≠^%.,]|(?<!\d)[.,]|[.,](?!\d))+")
+# Числа и знаки операций, которые должны совпадать у повторяющихся текстов
+EXACT_TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)*|[+\-*/=<>≤≥≠^%]")
+ANSWER_LETTERS = {"a": 0, "b": 1, "c": 2, "d": 3, "а": 0, "б": 1, "в": 2, "г": 3}
+
+
+def normalize_text(text: str) -> str:
+    """Нижний регистр, без пунктуации и лишних пробелов; знаки операций,
+    минус и десятичные дроби сохраняются."""
+    text = str(text).lower().replace("\u2212", "-")
+    return NON_WORD_RE.sub(" ", text).strip()
+
+
+def shingles(text: str, n: int = QUALITY_NGRAM) -> FrozenSet[str]:
+    """Множество символьных n-грамм нормализованного текста."""
+    return _shingles(normalize_text(text), n)
+
+
+def _shingles(text: str, n: int = QUALITY_NGRAM) -> FrozenSet[str]:
+    if len(text) <= n:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[idx:idx + n] for idx in range(len(text) - n + 1))
+
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Коэффициент Жаккара двух множеств n-грамм."""
+    if not a or not b:
+        return 0.0
+    intersection = len(a & b)
+    return intersection / (len(a) + len(b) - intersection)
+
+
+class Fingerprint(NamedTuple):
+    """Признаки текста для поиска повторов."""
+    exact: Tuple[str, ...]
+    words: FrozenSet[str]
+    shingles: FrozenSet[str]
+
+
+def fingerprint(text: str) -> Fingerprint:
+    """Числа и знаки операций, слова и n-граммы нормализованного текста."""
+    text = normalize_text(text)
+    return Fingerprint(tuple(EXACT_TOKEN_RE.findall(text)), frozenset(text.split()), _shingles(text))
+
+
+def _at_least(a: FrozenSet[str], b: FrozenSet[str], threshold: float) -> bool:
+    # Жаккар не больше отношения размеров, поэтому пересечение считается не всегда
+    if min(len(a), len(b)) < threshold * max(len(a), len(b)):
+        return False
+    return similarity(a, b) >= threshold
+
+
+def is_similar(a: Fingerprint, b: Fingerprint, threshold: float) -> bool:
+    """Повтор: те же числа и знаки операций, и похожи и n-граммы, и слова.
+
+    Сравнение по словам не дает счесть повтором вопросы, которые отличаются
+    одним ключевым словом при общем шаблоне ("Что такое процесс..." и
+    "Что такое поток...").
+    """
+    if a.exact != b.exact:
+        return False
+    if a.shingles == b.shingles:
+        return True
+    return _at_least(a.shingles, b.shingles, threshold) and _at_least(a.words, b.words, threshold)
+
+
+def _find_similar(item: Fingerprint, others: List[Fingerprint], threshold: float) -> Optional[int]:
+    """Индекс первого текста из others, похожего на item не меньше threshold."""
+    for idx, other in enumerate(others):
+        if is_similar(item, other, threshold):
+            return idx
+    return None
+
+
+def _answer_index(answer, options: List[str]) -> Optional[int]:
+    """Индекс правильного ответа: число, строка с числом, буква или текст варианта."""
+    if isinstance(answer, bool):
+        return None
+    if isinstance(answer, int):
+        index = answer
+    elif isinstance(answer, float) and answer.is_integer():
+        index = int(answer)
+    elif isinstance(answer, str):
+        value = answer.strip().rstrip(").").lower()
+        # isdigit() верно и для "²", но int() такую строку не разбирает
+        if value.isdecimal():
+            index = int(value)
+        elif value in ANSWER_LETTERS:
+            index = ANSWER_LETTERS[value]
+        else:
+            matches = [idx for idx, option in enumerate(options) if normalize_text(option) == normalize_text(answer)]
+            index = matches[0] if matches else None
+    else:
+        index = None
+    if index is None or not 0 <= index < len(options):
+        return None
+    return index
+
+
+def _dedupe_options(options: List[str], correct: int):
+    """Убирает пустые и повторяющиеся варианты; возвращает (варианты, новый индекс ответа).
+
+    Если правильный ответ повторяет другой вариант, вопрос неоднозначен:
+    индекс ответа возвращается None, и вопрос отбрасывается.
+    """
+    kept, kept_fingerprints = [], []
+    new_correct = None
+    for idx, option in enumerate(options):
+        text = str(option).strip()
+        option_fingerprint = fingerprint(text)
+        duplicate_of = _find_similar(option_fingerprint, kept_fingerprints, QUALITY_OPTION_SIMILARITY) if text else None
+        if not text or duplicate_of is not None:
+            metrics.quality_removed_options.inc()
+            if idx == correct or (duplicate_of is not None and duplicate_of == new_correct):
+                return kept, None
+            continue
+        if idx == correct:
+            new_correct = len(kept)
+        kept.append(text)
+        kept_fingerprints.append(option_fingerprint)
+    return kept, new_correct
+
+
+class QuestionFilter:
+    """Фильтр качества с памятью о принятых вопросах.
+
+    Вопрос отбрасывается, если он пуст, почти повторяет уже принятый (или
+    переданный в existing), после удаления повторов у него меньше
+    QUALITY_MIN_OPTIONS вариантов или индекс правильного ответа некорректен.
+    """
+
+    def __init__(self, existing: Iterable[Dict] = ()):
+        self._accepted: List[Fingerprint] = []
+        for question in existing:
+            self._accepted.append(fingerprint(question.get("question", "")))
+
+    def _reject(self, reason: str) -> None:
+        metrics.quality_rejected.inc(reason)
+
+    def check(self, question: Dict) -> Optional[Dict]:
+        """Возвращает исправленный вопрос или None, если он отброшен."""
+        if not QUALITY_FILTER:
+            return question
+        text = str(question.get("question") or "").strip()
+        if not text:
+            self._reject("empty")
+            return None
+
+        question_fingerprint = fingerprint(text)
+        if _find_similar(question_fingerprint, self._accepted, QUALITY_QUESTION_SIMILARITY) is not None:
+            self._reject("duplicate")
+            return None
+
+        if question.get("type", "multiple_choice") == "multiple_choice":
+            options = question.get("options")
+            if not isinstance(options, list):
+                self._reject("options")
+                return None
+            correct = _answer_index(question.get("correct_answer"), [str(option) for option in options])
+            if correct is None:
+                self._reject("answer")
+                return None
+            options, correct = _dedupe_options(options, correct)
+            if len(options) < QUALITY_MIN_OPTIONS or correct is None:
+                self._reject("options")
+                return None
+            question = {**question, "question": text, "options": options, "correct_answer": correct}
+
+        self._accepted.append(question_fingerprint)
+        return question
+
+    def filter(self, questions: Iterable[Dict]) -> List[Dict]:
+        return [checked for checked in map(self.check, questions) if checked is not None]
+
+
+def filter_questions(questions: List[Dict], existing: Iterable[Dict] = ()) -> List[Dict]:
+    """Отбрасывает некачественные и повторяющиеся вопросы (если фильтр включен)."""
+    if not QUALITY_FILTER:
+        return questions
+    return QuestionFilter(existing).filter(questions)
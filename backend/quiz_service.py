@@ -0,0 +1,170 @@
+"""Общая часть серверов Flask (app.py) и ASGI (asgi_app.py).
+
+Настройки генерации, кэш результатов, пул фоновых задач, проверка
+параметров запроса и извлечение контента PDF. Модуль не зависит от
+веб-фреймворка, поэтому ASGI режим не загружает Flask.
+"""
+import os
+
+from cache import create_result_cache
+from fanout import extraction_budget
+from jobs import JobManager
+from model_client import PROMPT_VERSION, get_model_client, parse_stats
+from pdf_processor import LazyPageImages, process_pdf
+from prompt_builder import prompt_stats
+from router import router_status
+
+ALLOWED_EXTENSIONS = {'pdf'}
+MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
+
+# Больше 20 вопросов генерируется параллельными вызовами по фрагментам документа
+MAX_QUESTIONS = int(os.getenv("MAX_QUESTIONS", 200))
+
+# Объем извлекаемого из PDF текста:
+# auto - не больше, чем поместится в промпты (страницы по всему документу, если вызовов несколько),
+# budget - то же, но страницы подряд с начала, sampled - всегда равномерно, full - весь документ
+PDF_EXTRACTION_MODE = os.getenv("PDF_EXTRACTION_MODE", "auto").lower()
+
+# Кэш извлеченного контента и сгенерированных тестов
+CONTENT_CACHE_TTL = float(os.getenv("CACHE_CONTENT_TTL", 7 * 24 * 3600))
+QUIZ_CACHE_TTL = float(os.getenv("CACHE_QUIZ_TTL", 24 * 3600))
+result_cache = create_result_cache()
+
+# Пул фоновых воркеров для асинхронного API задач (воркеры запускаются при первой задаче)
+job_manager = JobManager(
+    num_workers=int(os.getenv("JOB_WORKERS", 4)),
+    max_queue_size=int(os.getenv("JOB_QUEUE_SIZE", 32)),
+    result_ttl=float(os.getenv("JOB_RESULT_TTL", 3600))
+)
+
+
+def health_status(models):
+    """Тело ответа /api/health; models - состояние клиентов моделей сервера."""
+    return {
+        "status": "ok",
+        "cache": result_cache.stats(),
+        "jobs": job_manager.stats(),
+        "models": models,
+        "routing": router_status(),
+        "prompt": prompt_stats.to_dict(),
+        "parse": parse_stats.to_dict()
+    }
+
+
+def allowed_file(filename):
+    """Проверяет, что файл имеет разрешенное расширение."""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def validate_quiz_parameters(num_questions, model_type):
+    """Валидирует параметры для генерации теста."""
+    if not num_questions or num_questions < 1:
+        raise ValueError("Количество вопросов должно быть положительным числом")
+    
+    if num_questions > MAX_QUESTIONS:
+        raise ValueError(f"Максимальное количество вопросов - {MAX_QUESTIONS}")
+    
+    valid_models = ['openrouter', 'ollama-mistral']
+    if model_type not in valid_models:
+        raise ValueError(f"Неизвестный тип модели. Доступные: {', '.join(valid_models)}")
+    
+    return True
+
+
+def parse_num_questions(value):
+    """Преобразует количество вопросов в число (0 при некорректном значении)."""
+    try:
+        return int(value or 0)
+    except (ValueError, TypeError):
+        return 0
+
+
+def parse_text_request(data):
+    """Проверяет JSON-запрос с текстом и возвращает (текст, кол-во вопросов, тип модели)."""
+    # Проверяем наличие текста
+    if not data or 'text' not in data:
+        raise ValueError("Текст не найден в запросе")
+    
+    text = data.get('text', '').strip()
+    
+    if not text:
+        raise ValueError("Текст не может быть пустым")
+    
+    num_questions = parse_num_questions(data.get('num_questions', 0))
+    # Получаем тип модели (по умолчанию openrouter)
+    model_type = data.get('model_type', 'openrouter')
+    
+    return text, num_questions, model_type
+
+
+def quiz_response(questions):
+    """Формирует тело успешного ответа с вопросами."""
+    return {
+        "success": True,
+        "questions": questions,
+        "total_questions": len(questions)
+    }
+
+
+def extraction_options(num_questions, model_type, model_client=None):
+    """Возвращает (max_chars, sampled) для извлечения текста под бюджет промпта.
+    
+    model_client передается, если генерация идет не через синхронный реестр
+    (например, асинхронным клиентом в ASGI режиме).
+    """
+    if PDF_EXTRACTION_MODE == "full":
+        return None, False
+    
+    max_chars, calls = extraction_budget(model_client or get_model_client(model_type), num_questions)
+    if PDF_EXTRACTION_MODE == "sampled":
+        return max_chars, True
+    if PDF_EXTRACTION_MODE == "budget":
+        return max_chars, False
+    # auto: для нескольких вызовов модели нужны фрагменты со всего документа
+    return max_chars, calls > 1
+
+
+def process_pdf_cached(pdf_source, file_hash, max_chars=None, sampled=False, in_pool=False):
+    """Обрабатывает PDF, переиспользуя извлеченный текст для файлов с тем же SHA-256."""
+    cache_key = file_hash if max_chars is None else f"{file_hash}:{max_chars}:{'sampled' if sampled else 'head'}"
+    cached = result_cache.get("content", cache_key)
+    if cached is not None:
+        # Кэш хранит JSON: оценки страниц лежат списком пар [страница, оценка]
+        visual_scores = {int(page): score for page, score in cached.get("visual_scores") or []}
+        # Изображения по-прежнему рендерятся лениво из текущего файла
+        return {
+            "text": cached["text"],
+            "images": LazyPageImages(pdf_source, cached["total_pages"], visual_scores),
+            "total_pages": cached["total_pages"],
+            "visual_scores": visual_scores
+        }
+    
+    pdf_content = process_pdf(pdf_source, max_chars=max_chars, sampled=sampled, in_pool=in_pool)
+    result_cache.set("content", cache_key, {
+        "text": pdf_content["text"],
+        "total_pages": pdf_content["total_pages"],
+        "visual_scores": sorted(pdf_content["visual_scores"].items())
+    }, ttl=CONTENT_CACHE_TTL)
+    return pdf_content
+
+
+def quiz_cache_key(content_hash, num_questions, model_type):
+    """Ключ кэша теста: хэш контента, параметры генерации и версия промпта."""
+    return f"{content_hash}:{num_questions}:{model_type}:v{PROMPT_VERSION}"
+
+
+def load_pdf_content(upload, num_questions, model_type, model_client=None, in_pool=False):
+    """Извлекает контент PDF из буфера загрузки и проверяет, что он не пуст.
+    
+    Извлекается только столько текста, сколько модель сможет использовать;
+    in_pool - извлекать в пуле процессов (см. process_pdf).
+    """
+    max_chars, sampled = extraction_options(num_questions, model_type, model_client)
+    # Извлеченный текст кэшируется по SHA-256, посчитанному при загрузке
+    pdf_content = process_pdf_cached(upload.source(), upload.sha256, max_chars, sampled, in_pool)
+    
+    # Проверяем, что PDF не пустой
+    if not pdf_content.get("text") and not pdf_content.get("images"):
+        raise ValueError("PDF документ пуст или не может быть обработан")
+    
+    return pdf_content
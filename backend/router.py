@@ -0,0 +1,696 @@
+"""Маршрутизация вызовов между моделями: лимиты, повторы, хеджирование и failover.
+
+ModelRouter оборачивает клиента запрошенной модели (model_type) и:
+
+- ограничивает число одновременных вызовов каждой модели;
+- повторяет вызов после временной ошибки (таймаут, сеть, 429, 5xx)
+  с экспоненциальной задержкой;
+- если модель не ответила за свой p95, параллельно запускает тот же запрос
+  у резервной модели и берет первый ответ (хеджирование);
+- после серии ошибок размыкает цепь модели (circuit breaker) и сразу
+  переключается на резервную, пока модель не восстановится.
+
+Если у модели нет свободного слота дольше ROUTER_QUEUE_TIMEOUT, запрос
+отклоняется (BackendBusy, HTTP 503), а не переносится на другую модель.
+Таймаут действует только при допуске запроса: когда один из вызовов роутера
+получил слот, остальные вызовы того же запроса (фрагменты fan-out, дозапросы)
+ждут своей очереди без таймаута.
+
+Политики задаются переменными окружения: общие ROUTER_* и для каждой модели
+<MODEL_TYPE>_MAX_CONCURRENCY и <MODEL_TYPE>_FALLBACK. Резервных моделей
+по умолчанию нет: переключение отправляет документ другому провайдеру
+(например, с локальной Ollama во внешний OpenRouter), поэтому включается
+явно, например OPENROUTER_FALLBACK=ollama-mistral.
+"""
+import asyncio
+import functools
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import metrics
+from lazy_imports import lazy_import
+from model_client import (
+    AsyncModelClient, ModelClient, ResponseParseError, get_async_model_client, get_model_client
+)
+from timings import bind_timings, current_timings
+
+MODEL_TYPES = ("openrouter", "ollama-mistral")
+
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+# Повторы одной модели после временной ошибки и задержка между ними (секунды)
+ROUTER_RETRIES = int(os.getenv("ROUTER_RETRIES", 2))
+ROUTER_BACKOFF_BASE = float(os.getenv("ROUTER_BACKOFF_BASE", 0.5))
+ROUTER_BACKOFF_MAX = float(os.getenv("ROUTER_BACKOFF_MAX", 8))
+# Хеджирование: резервная модель стартует, если основная не ответила за этот квантиль
+ROUTER_HEDGING = os.getenv("ROUTER_HEDGING", "true").lower() == "true"
+ROUTER_HEDGE_QUANTILE = float(os.getenv("ROUTER_HEDGE_QUANTILE", 0.95))
+# До набора стольких ответов квантиль не считается и хеджирования нет
+ROUTER_HEDGE_MIN_SAMPLES = int(os.getenv("ROUTER_HEDGE_MIN_SAMPLES", 20))
+# Circuit breaker: ошибок подряд до размыкания и пауза до пробного вызова (секунды)
+ROUTER_BREAKER_FAILURES = int(os.getenv("ROUTER_BREAKER_FAILURES", 5))
+ROUTER_BREAKER_RESET = float(os.getenv("ROUTER_BREAKER_RESET", 30))
+# Сколько ждать свободного слота модели, прежде чем ответить 503 (секунды)
+ROUTER_QUEUE_TIMEOUT = float(os.getenv("ROUTER_QUEUE_TIMEOUT", 30))
+# Как часто ожидающий допуска вызов проверяет, не допущен ли уже запрос (секунды)
+_ADMISSION_POLL = 0.1
+
+# Политики по умолчанию: локальная Ollama обрабатывает запросы почти последовательно.
+# Резервные модели не заданы: документ не уходит к другому провайдеру без явной настройки
+DEFAULT_POLICIES = {
+    "openrouter": {"max_concurrency": 16, "fallback": ""},
+    "ollama-mistral": {"max_concurrency": 2, "fallback": ""}
+}
+
+httpx = lazy_import("httpx")
+openai = lazy_import("openai")
+
+
+@functools.lru_cache(maxsize=None)
+def transient_errors() -> tuple:
+    """Ошибки, после которых имеет смысл повторить вызов той же модели.
+
+    Кортеж собирается при первой ошибке, чтобы импорт роутера не загружал SDK.
+    ResponseParseError сюда не входит: модель ответила, но без вопросов
+    (например, {"questions": []}), и повтор того же запроса даст то же самое.
+    """
+    return (
+        httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError,
+        openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError
+    )
+
+
+def _policy_env(model_type: str, name: str, default: Any) -> str:
+    return os.getenv(f"{model_type.upper().replace('-', '_')}_{name}", str(default))
+
+
+def is_transient(error: BaseException) -> bool:
+    """Временная ли ошибка: таймаут, сеть, 429 или 5xx (в том числе внутри обертки клиента)."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, transient_errors()):
+            return True
+        # httpx.HTTPStatusError и openai.APIStatusError хранят ответ сервера
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        if isinstance(status, int) and (status == 429 or status >= 500):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def backoff_delay(attempt: int) -> float:
+    """Экспоненциальная задержка перед повтором со случайным разбросом (full jitter)."""
+    return random.uniform(0, min(ROUTER_BACKOFF_MAX, ROUTER_BACKOFF_BASE * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Размыкатель цепи модели.
+
+    closed - вызовы идут; после failure_threshold ошибок подряд - open, вызовы
+    не идут reset_timeout секунд; затем half_open - пропускается один пробный
+    вызов, успех замыкает цепь, ошибка снова размыкает.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_at = None
+        self._lock = threading.Lock()
+
+    def _refresh(self, now: float) -> None:
+        if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_at = None
+
+    def available(self) -> bool:
+        """Можно ли рассчитывать на модель (не расходует пробный вызов)."""
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self.state != self.OPEN
+
+    def allow(self) -> bool:
+        """Разрешает вызов; в half_open - только один пробный."""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN:
+                # Пробный вызов, брошенный без результата, не блокирует цепь навсегда
+                if self._probe_at is None or now - self._probe_at >= self.reset_timeout:
+                    self._probe_at = now
+                    return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_at = None
+
+
+class LatencyTracker:
+    """Скользящее окно длительностей успешных вызовов для оценки квантилей."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Backend:
+    """Состояние модели в роутере: лимит параллельных вызовов, размыкатель и задержки."""
+
+    def __init__(self, model_type: str):
+        policy = DEFAULT_POLICIES.get(model_type, {})
+        self.model_type = model_type
+        self.max_concurrency = max(1, int(_policy_env(model_type, "MAX_CONCURRENCY", policy.get("max_concurrency", 4))))
+        fallback = _policy_env(model_type, "FALLBACK", policy.get("fallback", ""))
+        self.fallbacks = [
+            item.strip() for item in fallback.split(",")
+            if item.strip() and item.strip().lower() != "none" and item.strip() != model_type
+        ]
+        self.breaker = CircuitBreaker(ROUTER_BREAKER_FAILURES, ROUTER_BREAKER_RESET)
+        self.latency = LatencyTracker()
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float]) -> bool:
+        if not self._slots.acquire(timeout=timeout):
+            return False
+        self.track(1)
+        return True
+
+    def release(self) -> None:
+        self.track(-1)
+        self._slots.release()
+
+    def track(self, delta: int) -> None:
+        with self._lock:
+            self.in_flight += delta
+
+    def hedge_delay(self) -> Optional[float]:
+        """Через сколько секунд запускать резервную модель (None - не запускать)."""
+        if not ROUTER_HEDGING:
+            return None
+        return self.latency.quantile(ROUTER_HEDGE_QUANTILE, ROUTER_HEDGE_MIN_SAMPLES)
+
+    def status(self) -> Dict[str, Any]:
+        p95 = self.latency.quantile(0.95)
+        return {
+            "circuit": self.breaker.state,
+            "failures": self.breaker.failures,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "fallbacks": self.fallbacks,
+            "p95_seconds": round(p95, 3) if p95 is not None else None
+        }
+
+
+class BackendUnavailable(Exception):
+    """Модель пропущена роутером: цепь разомкнута или нет свободного слота.
+
+    retry_after - через сколько секунд имеет смысл повторить запрос.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BackendBusy(BackendUnavailable):
+    """Все слоты модели заняты дольше ROUTER_QUEUE_TIMEOUT; на резервную модель не переключаемся."""
+
+
+_backends: Dict[str, Backend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(model_type: str) -> Backend:
+    with _backends_lock:
+        backend = _backends.get(model_type)
+        if backend is None:
+            backend = _backends[model_type] = Backend(model_type)
+        return backend
+
+
+def _candidates(model_type: str) -> List[Backend]:
+    """Запрошенная модель и ее резервные, кроме моделей с разомкнутой цепью.
+
+    Если разомкнуты все, возвращается запрошенная: ее вызов сообщит пользователю
+    понятную ошибку.
+    """
+    primary = get_backend(model_type)
+    backends = [primary] + [get_backend(fallback) for fallback in primary.fallbacks if fallback in MODEL_TYPES]
+    available = [backend for backend in backends if backend.breaker.available()]
+    for backend in backends:
+        if backend not in available:
+            metrics.router_rejected.inc(backend.model_type, "circuit_open")
+    return available or [primary]
+
+
+def _finish_call(backend: Backend, error: Optional[Exception], started: float) -> bool:
+    """Учитывает результат вызова; True - ошибку стоит повторить."""
+    if isinstance(error, ResponseParseError):
+        # Модель доступна, непригодный ответ не размыкает цепь и не повторяется
+        backend.breaker.record_success()
+        return False
+    if error is None:
+        backend.breaker.record_success()
+        backend.latency.observe(time.perf_counter() - started)
+        return False
+    backend.breaker.record_failure()
+    return is_transient(error)
+
+
+def _circuit_open_error(backend: Backend) -> Exception:
+    metrics.router_rejected.inc(backend.model_type, "circuit_open")
+    return BackendUnavailable(
+        f"Модель {backend.model_type} временно отключена после серии ошибок, "
+        f"повторите попытку через {int(ROUTER_BREAKER_RESET)} сек",
+        retry_after=ROUTER_BREAKER_RESET
+    )
+
+
+def _busy_error(backend: Backend) -> Exception:
+    metrics.router_rejected.inc(backend.model_type, "busy")
+    return BackendBusy(
+        f"Модель {backend.model_type} перегружена, повторите попытку позже",
+        retry_after=ROUTER_QUEUE_TIMEOUT
+    )
+
+
+def _routing_error(model_type: str, errors: List[Exception]) -> Exception:
+    """Ошибка для пользователя: ошибка запрошенной модели, а не резервной."""
+    return errors[0] if errors else Exception(f"Модель {model_type} недоступна")
+
+
+# Потоки для вызовов с хеджированием: вызов основной модели тоже идет в пуле,
+# чтобы ответ резервной можно было вернуть, не дожидаясь основной
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ROUTER_HEDGE_WORKERS", 64)), thread_name_prefix="hedge"
+)
+
+
+class ModelRouter(ModelClient):
+    """Клиент модели с повторами, хеджированием и переключением на резервную модель.
+
+    Один роутер обслуживает один запрос пользователя. Параметры промпта
+    (max_text_chars и др.) берутся у клиента запрошенной модели.
+    """
+
+    def __init__(self, model_type: str):
+        self.model_type = model_type
+        # Создание клиента проверяет настройки (например, ключ OpenRouter) до генерации
+        self.primary = get_model_client(model_type)
+        # Устанавливается, когда первый вызов запроса получил слот модели
+        self._admitted = threading.Event()
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "primary":
+            raise AttributeError(name)
+        return getattr(self.primary, name)
+
+    def status(self) -> Dict[str, Any]:
+        return self.primary.status()
+
+    @property
+    def max_concurrency(self) -> int:
+        """Сколько вызовов запрошенной модели выполняются одновременно."""
+        return get_backend(self.model_type).max_concurrency
+
+    def _acquire(self, backend: Backend, queue_timeout: float) -> bool:
+        """Занимает слот модели; False - слот не освободился за queue_timeout.
+
+        queue_timeout ограничивает только допуск запроса. Вызовы уже допущенного
+        запроса ждут без таймаута: иначе запрос отклонялся бы из-за собственных
+        параллельных вызовов. queue_timeout=0 (хеджирование) - без ожидания.
+        """
+        if not queue_timeout:
+            return backend.acquire(0)
+        deadline = time.monotonic() + queue_timeout
+        while not self._admitted.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if backend.acquire(min(remaining, _ADMISSION_POLL)):
+                self._admitted.set()
+                return True
+        return backend.acquire(None)
+
+    def _call(self, backend: Backend, call: Callable[[ModelClient], Any], queue_timeout: float,
+              queued: Optional[threading.Event] = None) -> Any:
+        """Вызов одной модели с повторами временных ошибок; queued устанавливается, когда слот получен."""
+        client = self.primary if backend.model_type == self.model_type else get_model_client(backend.model_type)
+        if not self._acquire(backend, queue_timeout):
+            raise _busy_error(backend)
+        if queued is not None:
+            queued.set()
+        try:
+            for attempt in range(ROUTER_RETRIES + 1):
+                if not backend.breaker.allow():
+                    raise _circuit_open_error(backend)
+                started = time.perf_counter()
+                try:
+                    result = call(client)
+                except ValueError:
+                    raise
+                except Exception as e:
+                    if not _finish_call(backend, e, started) or attempt == ROUTER_RETRIES:
+                        raise
+                    metrics.router_retries.inc(backend.model_type)
+                    time.sleep(backoff_delay(attempt))
+                    continue
+                _finish_call(backend, None, started)
+                return result
+        finally:
+            backend.release()
+
+    def _hedged(self, backend: Backend, remaining: List[Backend], delay: float,
+                call: Callable[[ModelClient], Any]) -> Any:
+        """Вызывает backend, а если он не ответил за delay - и следующую модель.
+
+        delay отсчитывается от получения слота: ожидание в очереди основной
+        модели не переносит запрос на резервную. Возвращает первый успешный
+        ответ; проигравший вызов завершается в фоне.
+        """
+        timings = current_timings()
+        queued = threading.Event()
+
+        def run(target, queue_timeout, queued=None):
+            with bind_timings(timings):
+                try:
+                    return self._call(target, call, queue_timeout, queued)
+                finally:
+                    # Вызов мог завершиться, не получив слота
+                    if queued is not None:
+                        queued.set()
+
+        first = _hedge_executor.submit(run, backend, ROUTER_QUEUE_TIMEOUT, queued)
+        queued.wait()
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        hedge_backend = remaining.pop(0)
+        metrics.router_hedges.inc(hedge_backend.model_type)
+        # Хеджирование не ждет слота: если резервная модель занята, ждем основную
+        futures = {first: backend, _hedge_executor.submit(run, hedge_backend, 0): hedge_backend}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if futures[future] is not backend:
+                        metrics.router_failovers.inc(backend.model_type, futures[future].model_type)
+                    return future.result()
+        return first.result()
+
+    def _route(self, call: Callable[[ModelClient], Any]) -> Any:
+        remaining = _candidates(self.model_type)
+        errors = []
+        while remaining:
+            backend = remaining.pop(0)
+            delay = backend.hedge_delay() if remaining else None
+            try:
+                if delay is None:
+                    result = self._call(backend, call, ROUTER_QUEUE_TIMEOUT)
+                else:
+                    result = self._hedged(backend, remaining, delay, call)
+            except ValueError:
+                # Ошибки настройки резервной модели (нет ключа и т.п.) не показываем
+                if backend.model_type == self.model_type:
+                    raise
+                continue
+            except BackendBusy:
+                # Очередь запрошенной модели переполнена: отвечаем 503, а не переносим документ
+                if backend.model_type == self.model_type:
+                    raise
+                continue
+            except Exception as e:
+                errors.append(e)
+                continue
+            if backend.model_type != self.model_type:
+                metrics.router_failovers.inc(self.model_type, backend.model_type)
+            return result
+        raise _routing_error(self.model_type, errors)
+
+    def generate_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> List[Dict]:
+        return self._route(lambda client: client.generate_quiz_questions(pdf_content, num_questions))
+
+    def stream_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> Iterator[Dict]:
+        """Поток вопросов; на резервную модель переключается, только пока не отдан ни один вопрос."""
+        errors = []
+        for backend in _candidates(self.model_type):
+            try:
+                client = self.primary if backend.model_type == self.model_type else get_model_client(backend.model_type)
+            except ValueError:
+                continue
+            if not self._acquire(backend, ROUTER_QUEUE_TIMEOUT):
+                if backend.model_type == self.model_type:
+                    raise _busy_error(backend)
+                continue
+            try:
+                for attempt in range(ROUTER_RETRIES + 1):
+                    if not backend.breaker.allow():
+                        errors.append(_circuit_open_error(backend))
+                        break
+                    started = time.perf_counter()
+                    yielded = 0
+                    try:
+                        for question in client.stream_quiz_questions(pdf_content, num_questions):
+                            yielded += 1
+                            yield question
+                    except Exception as e:
+                        retry = _finish_call(backend, e, started)
+                        if yielded:
+                            raise
+                        if retry and attempt < ROUTER_RETRIES:
+                            metrics.router_retries.inc(backend.model_type)
+                            time.sleep(backoff_delay(attempt))
+                            continue
+                        errors.append(e)
+                        break
+                    _finish_call(backend, None, started)
+                    if backend.model_type != self.model_type:
+                        metrics.router_failovers.inc(self.model_type, backend.model_type)
+                    return
+            finally:
+                backend.release()
+        raise _routing_error(self.model_type, errors)
+
+
+class AsyncModelRouter(AsyncModelClient):
+    """Асинхронный вариант ModelRouter: проигравший хеджированный вызов отменяется."""
+
+    def __init__(self, model_type: str, primary: AsyncModelClient):
+        self.model_type = model_type
+        self.primary = primary
+        self._admitted = asyncio.Event()
+
+    @classmethod
+    async def create(cls, model_type: str) -> "AsyncModelRouter":
+        return cls(model_type, await get_async_model_client(model_type))
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "primary":
+            raise AttributeError(name)
+        return getattr(self.primary, name)
+
+    def status(self) -> Dict[str, Any]:
+        return self.primary.status()
+
+    @property
+    def max_concurrency(self) -> int:
+        return get_backend(self.model_type).max_concurrency
+
+    async def _acquire(self, slots: asyncio.Semaphore, queue_timeout: float) -> bool:
+        """Как ModelRouter._acquire: таймаут только до допуска запроса.
+
+        Вызов, ожидающий допуска, продолжает ждать без таймаута, как только
+        слот получил другой вызов того же запроса, и не теряет места в очереди.
+        """
+        if not queue_timeout:
+            if slots.locked():
+                return False
+            await slots.acquire()
+            return True
+        acquire = asyncio.ensure_future(slots.acquire())
+        admitted = asyncio.ensure_future(self._admitted.wait())
+        try:
+            await asyncio.wait({acquire, admitted}, timeout=queue_timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not acquire.done() and admitted.done():
+                await acquire
+        finally:
+            admitted.cancel()
+            if not acquire.done():
+                acquire.cancel()
+        if not acquire.done() or acquire.cancelled():
+            return False
+        self._admitted.set()
+        return True
+
+    async def _call(self, backend: Backend, call, queue_timeout: float,
+                    queued: Optional[asyncio.Event] = None) -> Any:
+        client = self.primary if backend.model_type == self.model_type else await get_async_model_client(backend.model_type)
+        slots = _async_slots(backend)
+        if not await self._acquire(slots, queue_timeout):
+            raise _busy_error(backend)
+        if queued is not None:
+            queued.set()
+        backend.track(1)
+        try:
+            for attempt in range(ROUTER_RETRIES + 1):
+                if not backend.breaker.allow():
+                    raise _circuit_open_error(backend)
+                started = time.perf_counter()
+                try:
+                    result = await call(client)
+                except ValueError:
+                    raise
+                except Exception as e:
+                    if not _finish_call(backend, e, started) or attempt == ROUTER_RETRIES:
+                        raise
+                    metrics.router_retries.inc(backend.model_type)
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                _finish_call(backend, None, started)
+                return result
+        finally:
+            backend.track(-1)
+            slots.release()
+
+    async def _hedged(self, backend: Backend, remaining: List[Backend], delay: float, call) -> Any:
+        queued = asyncio.Event()
+
+        async def run_first():
+            try:
+                return await self._call(backend, call, ROUTER_QUEUE_TIMEOUT, queued)
+            finally:
+                queued.set()
+
+        first = asyncio.ensure_future(run_first())
+        # Как и в синхронном роутере, delay отсчитывается от получения слота
+        await queued.wait()
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        hedge_backend = remaining.pop(0)
+        metrics.router_hedges.inc(hedge_backend.model_type)
+        second = asyncio.ensure_future(self._call(hedge_backend, call, 0))
+        tasks = {first: backend, second: hedge_backend}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if tasks[task] is not backend:
+                            metrics.router_failovers.inc(backend.model_type, tasks[task].model_type)
+                        return task.result()
+            return first.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Ошибка проигравшего вызова уже не нужна; помечаем ее полученной
+                    task.exception()
+
+    async def _route(self, call) -> Any:
+        remaining = _candidates(self.model_type)
+        errors = []
+        while remaining:
+            backend = remaining.pop(0)
+            delay = backend.hedge_delay() if remaining else None
+            try:
+                if delay is None:
+                    result = await self._call(backend, call, ROUTER_QUEUE_TIMEOUT)
+                else:
+                    result = await self._hedged(backend, remaining, delay, call)
+            except ValueError:
+                if backend.model_type == self.model_type:
+                    raise
+                continue
+            except BackendBusy:
+                if backend.model_type == self.model_type:
+                    raise
+                continue
+            except Exception as e:
+                errors.append(e)
+                continue
+            if backend.model_type != self.model_type:
+                metrics.router_failovers.inc(self.model_type, backend.model_type)
+            return result
+        raise _routing_error(self.model_type, errors)
+
+    async def generate_quiz_questions(self, pdf_content: Dict[str, Any], num_questions: int) -> List[Dict]:
+        return await self._route(lambda client: client.generate_quiz_questions(pdf_content, num_questions))
+
+
+_async_slots_by_type: Dict[str, asyncio.Semaphore] = {}
+
+
+def _async_slots(backend: Backend) -> asyncio.Semaphore:
+    # Семафоры asyncio привязаны к циклу событий ASGI сервера
+    slots = _async_slots_by_type.get(backend.model_type)
+    if slots is None:
+        slots = _async_slots_by_type[backend.model_type] = asyncio.Semaphore(backend.max_concurrency)
+    return slots
+
+
+def get_model_router(model_type: str) -> ModelClient:
+    """Клиент для генерации: роутер поверх клиента модели или сам клиент, если роутер выключен."""
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Неизвестный тип модели: {model_type}")
+    if not ROUTER_ENABLED:
+        return get_model_client(model_type)
+    return ModelRouter(model_type)
+
+
+async def get_async_model_router(model_type: str) -> AsyncModelClient:
+    """Асинхронный вариант get_model_router."""
+    if model_type not in MODEL_TYPES:
+        raise ValueError(f"Неизвестный тип модели: {model_type}")
+    if not ROUTER_ENABLED:
+        return await get_async_model_client(model_type)
+    return await AsyncModelRouter.create(model_type)
+
+
+def router_status() -> Dict[str, Any]:
+    """Состояние моделей в роутере для /api/health."""
+    with _backends_lock:
+        backends = list(_backends.values())
+    return {backend.model_type: backend.status() for backend in backends}
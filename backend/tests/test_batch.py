@@ -0,0 +1,124 @@
+"""Пакетная загрузка: количество вопросов, разбор архивов и пул генерации модели."""
+import io
+import json
+import threading
+import time
+import zipfile
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import batch
+import router
+from upload_buffer import UploadBuffer
+
+
+def _file(name, data=b"%PDF-1.4 test"):
+    return FileStorage(stream=io.BytesIO(data), filename=name)
+
+
+def _zip(files):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return data.getvalue()
+
+
+def _items(count):
+    items = []
+    for idx in range(count):
+        upload = UploadBuffer()
+        upload.write(b"%PDF-1.4 test")
+        items.append(batch.BatchItem(idx, f"doc{idx}.pdf", upload, 5))
+    return items
+
+
+@pytest.fixture
+def executors(monkeypatch):
+    """Свежие пулы генерации и политики моделей."""
+    monkeypatch.setattr(batch, "_generate_executors", {})
+    monkeypatch.setattr(router, "_backends", {})
+    monkeypatch.delenv("OLLAMA_MISTRAL_MAX_CONCURRENCY", raising=False)
+    yield
+    for executor in batch._generate_executors.values():
+        executor.shutdown(wait=True)
+
+
+def test_question_counts_from_object_and_list():
+    assert batch.parse_question_counts('{"a.pdf": 10}') == {"a.pdf": 10}
+    assert batch.parse_question_counts([{"name": "b.pdf", "num_questions": "3"}]) == {"b.pdf": 3}
+    assert batch.parse_question_counts(None) == {}
+    with pytest.raises(ValueError):
+        batch.parse_question_counts("{")
+    with pytest.raises(ValueError):
+        batch.parse_question_counts({"a.pdf": "много"})
+
+
+def test_collect_reads_zip_with_manifest():
+    archive = _zip({
+        "docs/a.pdf": b"%PDF-1.4 a",
+        "docs/b.pdf": b"%PDF-1.4 b",
+        "docs/picture.png": b"png",
+        "__MACOSX/docs/._a.pdf": b"",
+        batch.MANIFEST_NAME: json.dumps({"a.pdf": 7, "b.pdf": 8}),
+    })
+    items, skipped = batch.collect_batch_items(
+        [_file("c.pdf"), _file("docs.zip", archive)], 5, {"b.pdf": 9}, max_file_size=1024
+    )
+    try:
+        assert [(item.index, item.name, item.num_questions) for item in items] == [
+            (0, "c.pdf", 5), (1, "docs/a.pdf", 7), (2, "docs/b.pdf", 9)
+        ]
+        assert skipped == ["docs/picture.png"]
+        assert items[1].upload.read() == b"%PDF-1.4 a"
+    finally:
+        for item in items:
+            item.upload.release()
+
+
+def test_collect_rejects_oversized_and_foreign_files():
+    with pytest.raises(ValueError, match="слишком большой"):
+        batch.collect_batch_items([_file("big.pdf", b"x" * 2048)], 5, {}, max_file_size=1024)
+    with pytest.raises(ValueError, match="слишком большой"):
+        batch.collect_batch_items([_file("docs.zip", _zip({"big.pdf": b"x" * 2048}))], 5, {}, max_file_size=1024)
+    with pytest.raises(ValueError, match="Разрешены только"):
+        batch.collect_batch_items([_file("notes.txt")], 5, {}, max_file_size=1024)
+
+
+def test_generation_is_limited_by_model_concurrency(executors, monkeypatch):
+    monkeypatch.setenv("OLLAMA_MISTRAL_MAX_CONCURRENCY", "2")
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def generate(item, content):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return [{"question": item.name}]
+
+    events = list(batch.run_batch(_items(6), lambda item: {}, generate, "ollama-mistral"))
+    assert [event["type"] for event in events] == ["result"] * 6 + ["done"]
+    assert peak[0] == 2
+    assert events[-1] == {"type": "done", "total_documents": 6, "failed": 0}
+
+
+def test_document_errors_do_not_stop_batch(executors):
+    def extract(item):
+        if item.index == 0:
+            raise ValueError("Не удалось извлечь текст")
+        return {}
+
+    def generate(item, content):
+        if item.index == 1:
+            raise RuntimeError("сбой модели")
+        return [{"question": item.name}]
+
+    events = list(batch.run_batch(_items(3), extract, generate, "openrouter"))
+    errors = {event["index"]: event for event in events if event["type"] == "error"}
+    assert errors[0]["error_type"] == "validation"
+    assert errors[1]["error_type"] == "internal"
+    assert events[-1] == {"type": "done", "total_documents": 3, "failed": 2}
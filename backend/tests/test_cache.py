@@ -0,0 +1,104 @@
+"""Кэш результатов: TTL, вытеснение по размеру и дисковое хранилище."""
+import os
+import time
+
+import pytest
+
+from cache import DiskCache, MemoryCache, ResultCache, create_result_cache
+
+QUESTIONS = [{"question": "Что такое процесс?", "options": ["a", "b", "c"], "correct_answer": 0}]
+
+
+def test_memory_ttl_expires():
+    cache = MemoryCache()
+    cache.set("quiz", QUESTIONS, ttl=0.05)
+    assert cache.get("quiz") == QUESTIONS
+    time.sleep(0.06)
+    assert cache.get("quiz") is None
+    assert cache.size_bytes() == 0
+
+
+def test_memory_evicts_least_recently_used():
+    value = "x" * 100
+    cache = MemoryCache(max_bytes=350)
+    for key in ("a", "b", "c"):
+        cache.set(key, value)
+    cache.get("a")
+    cache.set("d", value)
+    assert cache.get("b") is None
+    assert cache.get("a") == value
+    assert cache.size_bytes() <= 350
+
+
+def test_memory_skips_values_larger_than_limit():
+    cache = MemoryCache(max_bytes=10)
+    cache.set("big", "x" * 100)
+    assert cache.get("big") is None
+
+
+def test_disk_roundtrip_survives_restart(tmp_path):
+    directory = str(tmp_path / "cache")
+    DiskCache(directory).set("quiz", QUESTIONS)
+    restarted = DiskCache(directory)
+    assert restarted.get("quiz") == QUESTIONS
+    assert restarted.size_bytes() > 0
+    assert all(name.endswith(".json") for name in os.listdir(directory))
+
+
+def test_disk_ttl_expires(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    cache.set("quiz", QUESTIONS, ttl=0.05)
+    time.sleep(0.06)
+    assert cache.get("quiz") is None
+    assert cache.size_bytes() == 0
+
+
+def test_disk_evicts_oldest(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=250)
+    for idx, key in enumerate(("a", "b", "c")):
+        cache.set(key, "x" * 100)
+        # Время доступа отличается даже на файловых системах с грубыми отметками
+        os.utime(cache._path(key), (idx, idx))
+    cache.set("d", "x" * 100)
+    assert cache.get("a") is None
+    assert cache.get("d") == "x" * 100
+    assert cache.size_bytes() <= 250
+
+
+def test_disk_corrupted_entry_is_a_miss(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    cache.set("quiz", QUESTIONS)
+    with open(cache._path("quiz"), "wb") as f:
+        f.write(b"\x80\x04not json")
+    assert cache.get("quiz") is None
+    assert not os.path.exists(cache._path("quiz"))
+
+
+def test_disk_directory_is_private(tmp_path):
+    directory = tmp_path / "cache"
+    DiskCache(str(directory))
+    assert directory.stat().st_mode & 0o777 == 0o700
+
+
+def test_disk_rejects_shared_directory(tmp_path):
+    directory = tmp_path / "shared"
+    directory.mkdir()
+    directory.chmod(0o777)
+    with pytest.raises(ValueError):
+        DiskCache(str(directory))
+
+
+def test_default_disk_cache_is_per_user(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_BACKEND", "disk")
+    monkeypatch.delenv("CACHE_DIR", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    cache = create_result_cache()
+    assert cache.backend.directory == str(tmp_path / "quiz-generator")
+
+
+def test_result_cache_counts_hits_and_misses():
+    cache = ResultCache(MemoryCache())
+    assert cache.get("quiz", "key") is None
+    cache.set("quiz", "key", QUESTIONS)
+    assert cache.get("quiz", "key") == QUESTIONS
+    assert cache.stats()["namespaces"]["quiz"] == {"hits": 1, "misses": 1}
@@ -0,0 +1,137 @@
+"""Параллельная генерация: план вызовов, объединение, повторы между фрагментами и дозапрос."""
+import asyncio
+import re
+
+import pytest
+
+import fanout
+from model_client import normalize_questions
+
+
+def _first_page(content):
+    return re.search(r"страница\d+", content["text"]).group()
+
+
+class ChunkClient:
+    """Клиент модели: вопросы по первой странице фрагмента или по заданному сценарию."""
+
+    max_text_chars = 250
+
+    def __init__(self, answers=None):
+        # answers(content, count) -> тексты вопросов; по умолчанию уникальные для фрагмента
+        self.answers = answers or (lambda content, count: [
+            f"Вопрос {_first_page(content)} номер {idx}" for idx in range(count)
+        ])
+        self.calls = []
+
+    def _questions(self, content, count):
+        self.calls.append((content, count))
+        return [
+            {"id": 7, "question": text, "type": "multiple_choice",
+             "options": ["a", "b", "c", "d"], "correct_answer": 0}
+            for text in self.answers(content, count)
+        ]
+
+    def generate_quiz_questions(self, content, count):
+        return self._questions(content, count)
+
+    def stream_quiz_questions(self, content, count):
+        yield from self._questions(content, count)
+
+
+def _document(pages):
+    return {"text": "".join(
+        f"\n\n{'=' * 60}\nСТРАНИЦА {idx}\n{'=' * 60}\n\nстраница{idx} " + "текст " * 10
+        for idx in range(1, pages + 1)
+    ), "images": [], "total_pages": pages}
+
+
+@pytest.fixture(autouse=True)
+def small_calls(monkeypatch):
+    monkeypatch.setattr(fanout, "QUESTIONS_PER_CALL", 3)
+
+
+def test_allocate_questions_keeps_total():
+    assert fanout.allocate_questions([10, 10, 20], 7) == [2, 2, 3]
+    assert sum(fanout.allocate_questions([0, 0], 5)) == 5
+
+
+def test_plan_covers_whole_document():
+    text = _document(8)["text"]
+    tasks = fanout.plan_fanout(text, 7, 250)
+    assert sum(count for _, count in tasks) == 7
+    assert all(count <= 3 for _, count in tasks)
+    # Фрагменты берутся равномерно: первый вызов - начало документа, последний - вторая половина
+    assert "страница1 " in tasks[0][0]
+    assert int(re.search(r"страница(\d+)", tasks[-1][0]).group(1)) > 4
+
+
+def test_no_fanout_for_small_quiz():
+    assert not fanout.needs_fanout(ChunkClient(), _document(8), 3)
+    assert fanout.needs_fanout(ChunkClient(), _document(8), 4)
+
+
+def test_merge_keeps_chunk_order_and_renumbers():
+    client = ChunkClient()
+    questions = fanout.generate_quiz_fanout(client, _document(8), 7, concurrency=3)
+    assert len(questions) == 7
+    assert [q["id"] for q in questions] == list(range(1, 8))
+    chunk_words = [q["question"].split()[1] for q in questions]
+    assert chunk_words == sorted(chunk_words, key=lambda word: int(word[len("страница"):]))
+
+
+def test_duplicates_across_chunks_are_topped_up_with_exclude():
+    # Все фрагменты возвращают одни и те же вопросы; дозапрос - новые
+    def answers(content, count):
+        if content.get("exclude"):
+            return [f"Дополнительный вопрос {idx}" for idx in range(count)]
+        return [f"Общий вопрос {idx}" for idx in range(count)]
+
+    client = ChunkClient(answers)
+    questions = fanout.generate_quiz_fanout(client, _document(8), 6, concurrency=2)
+    texts = [q["question"] for q in questions]
+    assert len(texts) == len(set(texts)) == 6
+    assert [q["id"] for q in questions] == list(range(1, 7))
+    top_up_content, top_up_count = client.calls[-1]
+    assert top_up_count == 3
+    assert [q["question"] for q in top_up_content["exclude"]] == texts[:3]
+
+
+def test_cancellation_stops_remaining_calls():
+    client = ChunkClient()
+    calls = []
+
+    def check_cancelled():
+        calls.append(1)
+        if len(calls) > 1:
+            raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        fanout.generate_quiz_fanout(client, _document(8), 9, concurrency=1, check_cancelled=check_cancelled)
+    assert len(client.calls) == 1
+
+
+def test_stream_fanout_numbers_in_output_order_and_tops_up():
+    def answers(content, count):
+        if content.get("exclude"):
+            return [f"Дополнительный вопрос {idx}" for idx in range(count)]
+        return [f"Общий вопрос {idx}" for idx in range(count)]
+
+    questions = list(fanout.stream_quiz_fanout(ChunkClient(answers), _document(8), 6, concurrency=2))
+    assert [q["id"] for q in questions] == list(range(1, 7))
+    assert len({q["question"] for q in questions}) == 6
+
+
+def test_async_fanout_merges_and_renumbers():
+    class AsyncClient(ChunkClient):
+        async def generate_quiz_questions(self, content, count):
+            return self._questions(content, count)
+
+    questions = asyncio.run(fanout.generate_quiz_fanout_async(AsyncClient(), _document(8), 7, concurrency=2))
+    assert [q["id"] for q in questions] == list(range(1, 8))
+
+
+def test_normalized_ids_ignore_model_ids():
+    questions = [{"id": 5, "question": "a"}, {"id": 5, "question": "b"}, {"question": "c"}]
+    assert [q["id"] for q in normalize_questions(questions)] == [1, 2, 3]
+    assert [q["id"] for q in normalize_questions(questions, start_index=3)] == [4, 5, 6]
@@ -0,0 +1,55 @@
+"""Разбор ответа модели: целый, оборванный, засоренный и пустой JSON."""
+import json
+
+import pytest
+
+from model_client import ResponseParseError, parse_questions
+
+
+def _question(idx):
+    return {"question": f"Вопрос {idx}", "options": ["a", "b", "c", "d"], "correct_answer": 0}
+
+
+def _response(count):
+    return json.dumps({"questions": [_question(idx) for idx in range(count)]}, ensure_ascii=False)
+
+
+def test_complete_response():
+    questions, missing = parse_questions(_response(3), 3)
+    assert [q["question"] for q in questions] == ["Вопрос 0", "Вопрос 1", "Вопрос 2"]
+    assert missing == 0
+
+
+def test_short_response_reports_missing():
+    questions, missing = parse_questions(_response(2), 5)
+    assert len(questions) == 2
+    assert missing == 3
+
+
+def test_truncated_response_keeps_complete_questions():
+    # Ответ оборван на лимите токенов посреди третьего вопроса
+    text = _response(3)
+    questions, missing = parse_questions(text[:text.rindex('"correct_answer"')], 3)
+    assert [q["question"] for q in questions] == ["Вопрос 0", "Вопрос 1"]
+    assert missing == 1
+
+
+@pytest.mark.parametrize("wrap", [
+    "```json\n{}\n```",
+    "Вот тест:\n{}\nУдачи!",
+])
+def test_text_around_json(wrap):
+    questions, missing = parse_questions(wrap.format(_response(2)), 2)
+    assert len(questions) == 2
+    assert missing == 0
+
+
+@pytest.mark.parametrize("text", [
+    '{"questions": []}',
+    "",
+    "Не могу составить тест по этому тексту",
+    '{"questions": [{"question": "Вопрос',
+])
+def test_response_without_questions_raises(text):
+    with pytest.raises(ResponseParseError):
+        parse_questions(text, 3)
@@ -0,0 +1,33 @@
+"""Выбор страниц для vision-модели по визуальным оценкам."""
+import pdf_processor
+from pdf_processor import LazyPageImages
+
+
+def test_scores_of_unparsed_pages_are_added(monkeypatch):
+    calls = []
+
+    def score_pages(pdf_source, skip=()):
+        calls.append(set(skip))
+        return {50: 0.9, 80: 0.5, 90: 0.0}
+
+    monkeypatch.setattr(pdf_processor, "score_pages", score_pages)
+    # Извлечение по бюджету разобрало только титул и оглавление
+    images = LazyPageImages(b"", 100, {1: 0.0, 2: 0.2})
+    assert images.visual_pages(2) == [50, 80]
+    assert images.visual_pages(3) == [2, 50, 80]
+    assert calls == [{1, 2}]
+
+
+def test_complete_scores_skip_rescan(monkeypatch):
+    def score_pages(pdf_source, skip=()):
+        raise AssertionError("документ не должен открываться повторно")
+
+    monkeypatch.setattr(pdf_processor, "score_pages", score_pages)
+    images = LazyPageImages(b"", 3, {1: 0.0, 2: 0.6, 3: 0.3})
+    assert images.visual_pages(1) == [2]
+
+
+def test_spread_order_covers_document():
+    order = pdf_processor._spread_order(10)
+    assert sorted(order) == list(range(1, 11))
+    assert order[:3] == [1, 9, 5]
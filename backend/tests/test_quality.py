@@ -0,0 +1,71 @@
+"""Фильтр качества: повторы вопросов и вариантов, индекс правильного ответа."""
+from quality import QuestionFilter, _dedupe_options, filter_questions, normalize_text
+
+
+def _question(text, options=("a", "b", "c", "d"), correct=0):
+    return {"question": text, "type": "multiple_choice", "options": list(options), "correct_answer": correct}
+
+
+def test_normalize_keeps_signs_and_decimals():
+    assert normalize_text("x = −1,5.") == "x = -1,5"
+    assert normalize_text("Ответ: a ≥ b!") == "ответ a ≥ b"
+
+
+def test_options_differing_only_in_sign_are_kept():
+    options, correct = _dedupe_options(["x = 1", "x = -1", "x = 0", "x = 2"], 1)
+    assert options == ["x = 1", "x = -1", "x = 0", "x = 2"]
+    assert correct == 1
+
+
+def test_options_differing_only_in_operator_are_kept():
+    options, correct = _dedupe_options(["a + b", "a - b", "a * b", "a / b"], 2)
+    assert len(options) == 4
+    assert correct == 2
+
+
+def test_duplicate_wrong_option_is_removed():
+    options, correct = _dedupe_options(["Париж", "Лондон", "Лондон.", "Рим"], 0)
+    assert options == ["Париж", "Лондон", "Рим"]
+    assert correct == 0
+
+
+def test_correct_option_duplicating_another_drops_question():
+    assert _dedupe_options(["Париж", "Лондон", "Париж.", "Рим"], 2)[1] is None
+    assert _dedupe_options(["Париж", "Лондон", "Париж.", "Рим"], 0)[1] is None
+    questions = [_question("Столица Франции?", ["Париж", "Лондон", "Париж.", "Рим"], 2)]
+    assert filter_questions(questions) == []
+
+
+def test_template_questions_with_different_key_word_are_kept():
+    questions = [
+        _question("Что такое процесс?"),
+        _question("Что такое поток?"),
+        _question("Что такое процесс в операционной системе?"),
+        _question("Что такое поток в операционной системе?"),
+        _question("Чему равно 2 + 2?"),
+        _question("Чему равно 2 - 2?"),
+    ]
+    assert len(filter_questions(questions)) == len(questions)
+
+
+def test_repeated_question_is_dropped():
+    questions = [_question("Что такое процесс?"), _question("что такое процесс")]
+    assert [q["question"] for q in filter_questions(questions)] == ["Что такое процесс?"]
+
+
+def test_existing_questions_are_not_repeated():
+    existing = [_question("Что такое процесс?")]
+    assert QuestionFilter(existing).check(_question("Что такое процесс?!")) is None
+
+
+def test_letter_answer_is_converted_to_index():
+    checked = QuestionFilter().check(_question("Что такое поток?", correct="B"))
+    assert checked["correct_answer"] == 1
+
+
+def test_superscript_answer_is_rejected_not_raised():
+    question_filter = QuestionFilter()
+    assert question_filter.check(_question("Чему равно 2 в квадрате?", correct="²")) is None
+    checked = question_filter.check(_question("Какой знак обозначает квадрат?", ["¹", "²", "³", "⁴"], "²"))
+    assert checked["correct_answer"] == 1
+    assert QuestionFilter().check(_question("Что такое поток?", correct="2)"))["correct_answer"] == 2
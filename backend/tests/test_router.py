@@ -0,0 +1,280 @@
+"""Правила роутера: повторы, circuit breaker, очередь и переключение на резервную модель."""
+import asyncio
+import itertools
+import threading
+import time
+
+import httpx
+import pytest
+
+import fanout
+import router
+from model_client import ResponseParseError
+
+
+class FakeClient:
+    """Клиент модели, который отвечает по заданному сценарию."""
+
+    def __init__(self, name, outcomes=(), delay=0.0):
+        self.name = name
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.calls = 0
+
+    def generate_quiz_questions(self, pdf_content, num_questions):
+        self.calls += 1
+        time.sleep(self.delay)
+        outcome = self.outcomes.pop(0) if self.outcomes else None
+        if isinstance(outcome, Exception):
+            raise outcome
+        return [{"question": self.name}]
+
+
+class ChunkClient(FakeClient):
+    """Медленный клиент для fan-out: уникальные вопросы и учет одновременных вызовов."""
+
+    max_text_chars = 250
+
+    def __init__(self, name, delay):
+        super().__init__(name, delay=delay)
+        self.running = 0
+        self.peak = 0
+        self._numbers = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def generate_quiz_questions(self, pdf_content, num_questions):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            super().generate_quiz_questions(pdf_content, num_questions)
+        finally:
+            with self._lock:
+                self.running -= 1
+        return [
+            {"question": f"Вопрос вызов{next(self._numbers)}", "type": "multiple_choice",
+             "options": ["a", "b", "c", "d"], "correct_answer": 0}
+            for _ in range(num_questions)
+        ]
+
+
+class AsyncFakeClient:
+    def __init__(self, name, delay=0.0):
+        self.name = name
+        self.delay = delay
+
+    async def generate_quiz_questions(self, pdf_content, num_questions):
+        await asyncio.sleep(self.delay)
+        return [{"question": self.name}]
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    """Заменители клиентов обеих моделей и чистое состояние роутера."""
+    fakes = {model_type: FakeClient(model_type) for model_type in router.MODEL_TYPES}
+    monkeypatch.setattr(router, "get_model_client", lambda model_type: fakes[model_type])
+    monkeypatch.setattr(router, "backoff_delay", lambda attempt: 0)
+    monkeypatch.setattr(router, "ROUTER_HEDGING", False)
+    monkeypatch.setattr(router, "_backends", {})
+    for name in ("OPENROUTER_FALLBACK", "OLLAMA_MISTRAL_FALLBACK",
+                 "OPENROUTER_MAX_CONCURRENCY", "OLLAMA_MISTRAL_MAX_CONCURRENCY"):
+        monkeypatch.delenv(name, raising=False)
+    return fakes
+
+
+def _generate(model_type):
+    return router.ModelRouter(model_type).generate_quiz_questions({}, 1)
+
+
+def test_no_cross_provider_fallback_by_default(clients):
+    assert router.get_backend("openrouter").fallbacks == []
+    assert router.get_backend("ollama-mistral").fallbacks == []
+
+    clients["ollama-mistral"].outcomes = [httpx.ConnectError("down")] * 10
+    with pytest.raises(httpx.ConnectError):
+        _generate("ollama-mistral")
+    assert clients["openrouter"].calls == 0
+
+
+def test_transient_error_is_retried(clients, monkeypatch):
+    monkeypatch.setattr(router, "ROUTER_RETRIES", 2)
+    clients["openrouter"].outcomes = [httpx.ReadTimeout("slow"), httpx.ReadTimeout("slow")]
+    assert _generate("openrouter") == [{"question": "openrouter"}]
+    assert clients["openrouter"].calls == 3
+
+
+def test_response_without_questions_is_not_retried(clients):
+    clients["openrouter"].outcomes = [ResponseParseError("empty")]
+    with pytest.raises(ResponseParseError):
+        _generate("openrouter")
+    assert clients["openrouter"].calls == 1
+    assert router.get_backend("openrouter").breaker.failures == 0
+
+
+def test_configured_fallback_after_retries(clients, monkeypatch):
+    monkeypatch.setenv("OPENROUTER_FALLBACK", "ollama-mistral")
+    monkeypatch.setattr(router, "ROUTER_RETRIES", 1)
+    clients["openrouter"].outcomes = [httpx.ConnectError("down")] * 2
+    assert _generate("openrouter") == [{"question": "ollama-mistral"}]
+    assert clients["openrouter"].calls == 2
+
+
+def test_validation_error_does_not_fail_over(clients, monkeypatch):
+    monkeypatch.setenv("OPENROUTER_FALLBACK", "ollama-mistral")
+    clients["openrouter"].outcomes = [ValueError("нет ключа")]
+    with pytest.raises(ValueError):
+        _generate("openrouter")
+    assert clients["ollama-mistral"].calls == 0
+
+
+def test_full_queue_answers_busy_without_failover(clients, monkeypatch):
+    monkeypatch.setenv("OPENROUTER_FALLBACK", "ollama-mistral")
+    monkeypatch.setenv("OPENROUTER_MAX_CONCURRENCY", "1")
+    monkeypatch.setattr(router, "ROUTER_QUEUE_TIMEOUT", 0.1)
+    clients["openrouter"].delay = 0.5
+
+    running = threading.Thread(target=_generate, args=("openrouter",))
+    running.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(router.BackendBusy) as error:
+            _generate("openrouter")
+    finally:
+        running.join()
+    assert error.value.retry_after == 0.1
+    assert clients["ollama-mistral"].calls == 0
+
+
+def test_calls_of_admitted_request_wait_without_timeout(clients, monkeypatch):
+    monkeypatch.setenv("OLLAMA_MISTRAL_MAX_CONCURRENCY", "1")
+    monkeypatch.setattr(router, "ROUTER_QUEUE_TIMEOUT", 0.1)
+    clients["ollama-mistral"].delay = 0.2
+    request = router.ModelRouter("ollama-mistral")
+
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(request.generate_quiz_questions({}, 1))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    # Другой запрос к занятой модели по-прежнему получает 503
+    with pytest.raises(router.BackendBusy):
+        _generate("ollama-mistral")
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(results) == 3
+
+
+def test_fanout_is_limited_by_model_concurrency(clients, monkeypatch):
+    monkeypatch.setenv("OLLAMA_MISTRAL_MAX_CONCURRENCY", "2")
+    monkeypatch.setattr(router, "ROUTER_QUEUE_TIMEOUT", 0.05)
+    monkeypatch.setattr(fanout, "QUESTIONS_PER_CALL", 2)
+    client = clients["ollama-mistral"] = ChunkClient("ollama-mistral", delay=0.1)
+    content = {"text": "".join(
+        f"\n\n{'=' * 60}\nСТРАНИЦА {idx}\n{'=' * 60}\n\nстраница{idx} " + "текст " * 10
+        for idx in range(1, 9)
+    ), "images": [], "total_pages": 8}
+    request = router.ModelRouter("ollama-mistral")
+
+    assert fanout.needs_fanout(request, content, 8)
+    questions = fanout.generate_quiz_fanout(request, content, 8, concurrency=8)
+    assert len(questions) == 8
+    assert client.calls >= 4
+    assert client.peak == 2
+
+
+def test_async_calls_of_admitted_request_wait_without_timeout(clients, monkeypatch):
+    monkeypatch.setenv("OLLAMA_MISTRAL_MAX_CONCURRENCY", "1")
+    monkeypatch.setattr(router, "ROUTER_QUEUE_TIMEOUT", 0.1)
+    monkeypatch.setattr(router, "_async_slots_by_type", {})
+
+    async def scenario():
+        request = router.AsyncModelRouter("ollama-mistral", AsyncFakeClient("ollama-mistral", 0.2))
+        other = router.AsyncModelRouter("ollama-mistral", AsyncFakeClient("ollama-mistral", 0.2))
+        return await asyncio.gather(
+            *(request.generate_quiz_questions({}, 1) for _ in range(3)),
+            other.generate_quiz_questions({}, 1),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert results[:3] == [[{"question": "ollama-mistral"}]] * 3
+    assert isinstance(results[3], router.BackendBusy)
+
+
+def test_slow_primary_is_hedged_with_fallback(clients, monkeypatch):
+    monkeypatch.setenv("OPENROUTER_FALLBACK", "ollama-mistral")
+    monkeypatch.setattr(router, "ROUTER_HEDGING", True)
+    monkeypatch.setattr(router, "ROUTER_HEDGE_MIN_SAMPLES", 1)
+    router.get_backend("openrouter").latency.observe(0.05)
+    clients["openrouter"].delay = 0.5
+
+    started = time.monotonic()
+    assert _generate("openrouter") == [{"question": "ollama-mistral"}]
+    assert time.monotonic() - started < 0.4
+    assert clients["ollama-mistral"].calls == 1
+
+
+def test_fast_primary_is_not_hedged(clients, monkeypatch):
+    monkeypatch.setenv("OPENROUTER_FALLBACK", "ollama-mistral")
+    monkeypatch.setattr(router, "ROUTER_HEDGING", True)
+    monkeypatch.setattr(router, "ROUTER_HEDGE_MIN_SAMPLES", 1)
+    router.get_backend("openrouter").latency.observe(0.5)
+
+    assert _generate("openrouter") == [{"question": "openrouter"}]
+    assert clients["ollama-mistral"].calls == 0
+
+
+def test_breaker_opens_after_failures(clients, monkeypatch):
+    monkeypatch.setattr(router, "ROUTER_RETRIES", 0)
+    monkeypatch.setattr(router, "ROUTER_BREAKER_FAILURES", 2)
+    clients["openrouter"].outcomes = [httpx.ConnectError("down")] * 2
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            _generate("openrouter")
+
+    assert router.get_backend("openrouter").breaker.state == router.CircuitBreaker.OPEN
+    with pytest.raises(router.BackendUnavailable):
+        _generate("openrouter")
+    assert clients["openrouter"].calls == 2
+
+
+def test_open_breaker_switches_to_configured_fallback(clients, monkeypatch):
+    monkeypatch.setenv("OPENROUTER_FALLBACK", "ollama-mistral")
+    monkeypatch.setattr(router, "ROUTER_BREAKER_FAILURES", 1)
+    router.get_backend("openrouter").breaker.record_failure()
+    assert _generate("openrouter") == [{"question": "ollama-mistral"}]
+    assert clients["openrouter"].calls == 0
+
+
+def test_half_open_breaker_allows_one_probe():
+    breaker = router.CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == router.CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == router.CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_breaker_again():
+    breaker = router.CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == router.CircuitBreaker.OPEN
+    assert not breaker.allow()
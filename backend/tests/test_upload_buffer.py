@@ -0,0 +1,33 @@
+"""Буфер загрузки: хэш, перенос на диск и ограничение размера."""
+import hashlib
+import io
+import os
+
+import pytest
+
+from upload_buffer import UploadBuffer, UploadTooLarge, as_upload_buffer
+
+
+def test_copy_hashes_and_spools_to_disk(tmp_path):
+    data = os.urandom(3000)
+    buffer = UploadBuffer(threshold=1000, directory=str(tmp_path))
+    buffer.write(data)
+    assert buffer.on_disk
+    assert buffer.sha256 == hashlib.sha256(data).hexdigest()
+    path = buffer.source()
+    buffer.release()
+    assert not os.path.exists(path)
+
+
+def test_copy_stops_after_max_size():
+    stream = io.BytesIO(b"x" * (3 * 1024 * 1024))
+    with pytest.raises(UploadTooLarge):
+        as_upload_buffer(stream, max_size=1024 * 1024)
+    # Читается не больше одного блока сверх лимита
+    assert stream.tell() <= 2 * 1024 * 1024
+
+
+def test_small_upload_within_limit():
+    buffer = as_upload_buffer(io.BytesIO(b"%PDF-1.4"), max_size=100)
+    assert buffer.read() == b"%PDF-1.4"
+    assert buffer.size == 8
@@ -0,0 +1,60 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import metrics
+
+_local = threading.local()
+
+
+@contextmanager
+def collect_timings():
+    """Собирает длительность этапов, выполняемых в текущем потоке.
+
+    Возвращает словарь {этап: секунды}, который заполняется блоками stage().
+    """
+    with bind_timings({}) as timings:
+        yield timings
+
+
+def current_timings() -> Optional[Dict[str, float]]:
+    """Возвращает активный словарь измерений текущего потока (или None)."""
+    return getattr(_local, "timings", None)
+
+
+@contextmanager
+def bind_timings(timings: Optional[Dict[str, float]]):
+    """Привязывает существующий словарь измерений к текущему потоку.
+
+    Используется в пулах потоков, чтобы этапы, выполненные в воркере,
+    попали в измерения исходного запроса или задачи.
+    """
+    previous = getattr(_local, "timings", None)
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+@contextmanager
+def stage(name: str):
+    """Измеряет этап обработки (extract, render, model, parse).
+
+    Длительность всегда попадает в гистограмму quiz_stage_duration_seconds,
+    а ошибка этапа - в quiz_stage_errors_total. В словарь измерений она
+    сохраняется, только если в потоке есть активный collect_timings().
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        metrics.stage_errors.inc(name, metrics.error_type(e))
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.stage_seconds.observe(elapsed, name)
+        timings = getattr(_local, "timings", None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
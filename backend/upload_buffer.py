@@ -0,0 +1,132 @@
+import hashlib
+import io
+import os
+import tempfile
+from typing import Optional, Union
+
+# Размер, после которого загрузка переносится из памяти во временный файл
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", 8 * 1024 * 1024))
+
+
+class UploadBuffer:
+    """Буфер загружаемого файла, который считает SHA-256 по мере записи.
+
+    Небольшие файлы остаются в памяти; при превышении порога содержимое
+    переносится во временный файл с уникальным именем. И текст, и изображения
+    извлекаются из этого же буфера, без повторного сохранения на диск.
+    """
+
+    def __init__(self, threshold: int = UPLOAD_SPOOL_THRESHOLD, directory: Optional[str] = None):
+        self.threshold = threshold
+        self.directory = directory or tempfile.gettempdir()
+        self.path = None
+        self.size = 0
+        self._file = io.BytesIO()
+        self._digest = hashlib.sha256()
+        self._detached = False
+
+    @property
+    def sha256(self) -> str:
+        """SHA-256 всех записанных данных."""
+        return self._digest.hexdigest()
+
+    @property
+    def on_disk(self) -> bool:
+        return self.path is not None
+
+    def write(self, data: bytes) -> int:
+        self._digest.update(data)
+        self.size += len(data)
+        written = self._file.write(data)
+        if not self.on_disk and self.size > self.threshold:
+            self._rollover()
+        return written
+
+    def _rollover(self) -> None:
+        """Переносит данные из памяти во временный файл с уникальным именем."""
+        fd, path = tempfile.mkstemp(prefix="quiz_", suffix=".pdf", dir=self.directory)
+        disk_file = os.fdopen(fd, "w+b")
+        disk_file.write(self._file.getbuffer())
+        self._file.close()
+        self._file = disk_file
+        self.path = path
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def readline(self, size: int = -1) -> bytes:
+        return self._file.readline(size)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def seekable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def source(self) -> Union[str, bytes]:
+        """Источник для извлечения PDF: путь к файлу или содержимое в памяти."""
+        if self.on_disk:
+            self._file.flush()
+            return self.path
+        return self._file.getvalue()
+
+    def detach(self) -> "UploadBuffer":
+        """Передает владение буфером вызывающему коду (например, фоновой задаче):
+        close() по окончании HTTP запроса больше не освобождает данные."""
+        self._detached = True
+        return self
+
+    def close(self) -> None:
+        if not self._detached:
+            self.release()
+
+    def release(self) -> None:
+        """Освобождает память и удаляет временный файл; повторный вызов ничего не делает."""
+        if not self._file.closed:
+            self._file.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class UploadTooLarge(ValueError):
+    """Загруженный файл больше допустимого размера."""
+
+
+def as_upload_buffer(stream, max_size: Optional[int] = None) -> UploadBuffer:
+    """Возвращает UploadBuffer для потока загрузки, копируя данные при необходимости.
+    
+    Если задан max_size, копирование прекращается, как только данных становится
+    больше: слишком большой файл не копируется и не хэшируется целиком.
+    """
+    if isinstance(stream, UploadBuffer):
+        if max_size is not None and stream.size > max_size:
+            raise UploadTooLarge("Файл слишком большой")
+        return stream
+    buffer = UploadBuffer()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+        buffer.write(chunk)
+        if max_size is not None and buffer.size > max_size:
+            buffer.release()
+            raise UploadTooLarge("Файл слишком большой")
+    buffer.seek(0)
+    return buffer